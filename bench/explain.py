@@ -0,0 +1,37 @@
+"""EXPLAIN checks: do the hot queries use the indexes from cogs/migrations.py?
+
+    POSTGRES_URL=postgresql://... python -m bench.explain
+
+Applies pending migrations first, then EXPLAINs every query of HOT_QUERIES
+(on synthetic rows inserted and analyzed in a rolled-back transaction). Exits with status 1 if a
+query does not use its expected index.
+"""
+import asyncio
+import os
+import sys
+
+import asyncpg
+
+from cogs.migrations import run_migrations, explain_hot_queries
+
+
+async def run(dsn: str) -> int:
+    pool = await asyncpg.create_pool(dsn, min_size=1, max_size=1)
+    try:
+        await run_migrations(pool)
+        results = await explain_hot_queries(pool)
+    finally:
+        await pool.close()
+
+    failed = 0
+    for query, indexes, ok, used in results:
+        mark = "✅" if ok else "❌"
+        print(f"{mark} {' | '.join(indexes):<32} {query}")
+        if not ok:
+            failed += 1
+            print(f"   plan uses: {', '.join(sorted(used)) or 'no index'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run(os.getenv("POSTGRES_URL"))))
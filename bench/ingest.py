@@ -0,0 +1,297 @@
+"""Offline microbenchmarks for the Mazoku card ingestion path.
+
+Runs every parser of cogs/auction_core.py and the whole
+AuctionCore._process_mazoku_embed against a fixture corpus of embed dicts,
+with an in-memory Redis stand-in (no gateway, no Redis server needed).
+
+    python -m bench.ingest                              # report only
+    python -m bench.ingest --save-baseline bench/baseline.json
+    python -m bench.ingest --baseline bench/baseline.json --tolerance 0.3
+
+With --baseline, exits with status 1 if any benchmark p50 is slower than the
+baseline by more than the tolerance, or if parse_mazoku_embed disagrees with
+the legacy helpers on the corpus.
+
+Also reports the size of the mazoku:card cache entry per card, legacy JSON
+(full embed under "raw") vs the compact format of cogs/utils.py. With
+--redis-url it measures MEMORY USAGE on a real Redis (scratch keys, deleted).
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from types import SimpleNamespace
+
+import discord
+
+from cogs import auction_core as core
+from cogs.utils import encode_card, redis_json_load
+
+FIXTURES = Path(__file__).parent / "fixtures" / "mazoku_embeds.json"
+MAZOKU_BOT_ID = 1242307526143447061
+
+
+class FakeRedis:
+    """Stand-in minimal de redis.asyncio (seulement ce que l'ingestion utilise)."""
+
+    def __init__(self):
+        self.store = {}
+        self.ops = 0
+
+    async def get(self, key):
+        self.ops += 1
+        return self.store.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.ops += 1
+        self.store[key] = value
+        return True
+
+
+def load_corpus(path: Path = FIXTURES) -> list:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def legacy_parse(data: dict):
+    # Chemin d'origine : un appel de helper par champ
+    desc = data.get("description") or ""
+    owner_id = core.parse_owner_id_from_desc(desc)
+    if not owner_id:
+        return None
+    title_raw = data.get("title") or ""
+    event_info = core.parse_event_or_special(data)
+    return core.ParsedCard(
+        title=core.strip_discord_emojis(title_raw),
+        rarity=core.parse_rarity(data) or "COMMON",
+        series=core.parse_series_from_desc(desc),
+        version=core.parse_version_from_text(title_raw) or core.parse_version_from_text(desc),
+        batch=core.parse_batch_from_desc(desc),
+        owner_id=owner_id,
+        image_url=(data.get("image") or {}).get("url"),
+        event=event_info.get("event"),
+        special=event_info.get("special"),
+    )
+
+
+def check_equivalence(corpus: list) -> list:
+    mismatches = []
+    for i, entry in enumerate(corpus):
+        data = discord.Embed.from_dict(entry["embed"]).to_dict()
+        expected, got = legacy_parse(data), core.parse_mazoku_embed(data)
+        if expected != got:
+            mismatches.append((i, entry["kind"], expected, got))
+    return mismatches
+
+
+def make_message(i: int, embed_dict: dict):
+    return SimpleNamespace(
+        id=1_300_000_000_000_000_000 + i,
+        author=SimpleNamespace(id=MAZOKU_BOT_ID, bot=True),
+        embeds=[discord.Embed.from_dict(embed_dict)] if embed_dict else [],
+    )
+
+
+def percentile(sorted_ns: list, q: float) -> float:
+    idx = min(len(sorted_ns) - 1, int(round(q * (len(sorted_ns) - 1))))
+    return sorted_ns[idx]
+
+
+def summarize(name: str, samples_ns: list, alloc_bytes: float) -> dict:
+    samples_ns.sort()
+    total = sum(samples_ns)
+    return {
+        "name": name,
+        "n": len(samples_ns),
+        "msgs_per_sec": len(samples_ns) / (total / 1e9) if total else 0.0,
+        "p50_us": percentile(samples_ns, 0.50) / 1000,
+        "p99_us": percentile(samples_ns, 0.99) / 1000,
+        "alloc_bytes_per_msg": alloc_bytes,
+    }
+
+
+def _alloc_per_call(fn, inputs: list) -> float:
+    tracemalloc.start()
+    try:
+        total = 0
+        for x in inputs:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            fn(x)
+            total += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return total / len(inputs)
+
+
+def bench_sync(name: str, fn, inputs: list, rounds: int) -> dict:
+    for x in inputs:
+        fn(x)  # warm-up
+    samples = []
+    clock = time.perf_counter_ns
+    for _ in range(rounds):
+        for x in inputs:
+            t0 = clock()
+            fn(x)
+            samples.append(clock() - t0)
+    return summarize(name, samples, _alloc_per_call(fn, inputs))
+
+
+async def bench_ingest(corpus: list, rounds: int) -> dict:
+    bot = SimpleNamespace(redis=FakeRedis(), mazoku_bot_id=MAZOKU_BOT_ID, ingest_mode="inline")
+    cog = core.AuctionCore(bot)
+    messages = [make_message(i, e["embed"]) for i, e in enumerate(corpus)]
+
+    for m in messages:
+        await cog._process_mazoku_embed(m)  # warm-up
+    samples = []
+    clock = time.perf_counter_ns
+    for _ in range(rounds):
+        for m in messages:
+            t0 = clock()
+            await cog._process_mazoku_embed(m)
+            samples.append(clock() - t0)
+
+    tracemalloc.start()
+    try:
+        total = 0
+        for m in messages:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            await cog._process_mazoku_embed(m)
+            total += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return summarize("_process_mazoku_embed", samples, total / len(messages))
+
+
+def card_payloads(corpus: list) -> list:
+    # (legacy, compact) pour chaque carte du corpus
+    out = []
+    for entry in corpus:
+        data = discord.Embed.from_dict(entry["embed"]).to_dict()
+        card = core.parse_mazoku_embed(data)
+        if not card:
+            continue
+        legacy = card.to_payload()
+        legacy["raw"] = data
+        compact = encode_card(card.to_payload())
+        assert redis_json_load(compact) == card.to_payload(), entry["kind"]
+        out.append((json.dumps(legacy), compact))
+    return out
+
+
+async def redis_memory(url: str, payloads: list) -> tuple:
+    import redis.asyncio as aioredis
+
+    r = aioredis.from_url(url, encoding="utf-8", decode_responses=True)
+    try:
+        totals = [0, 0]
+        for i, pair in enumerate(payloads):
+            for fmt, value in enumerate(pair):
+                key = f"bench:mazoku:card:{fmt}:{i}"
+                await r.set(key, value, ex=60)
+                totals[fmt] += await r.memory_usage(key) or 0
+                await r.delete(key)
+        return totals[0] / len(payloads), totals[1] / len(payloads)
+    finally:
+        await r.aclose()
+
+
+def print_sizes(payloads: list, memory: tuple = None, out=sys.stdout):
+    legacy = sum(len(a.encode()) for a, _ in payloads) / len(payloads)
+    compact = sum(len(b.encode()) for _, b in payloads) / len(payloads)
+    print(f"\nmazoku:card entry ({len(payloads)} cards): "
+          f"legacy {legacy:,.0f} B -> compact {compact:,.0f} B ({compact / legacy:.0%})", file=out)
+    if memory:
+        print(f"Redis MEMORY USAGE per card: legacy {memory[0]:,.0f} B -> compact {memory[1]:,.0f} B", file=out)
+
+
+def run(corpus: list, rounds: int) -> list:
+    dicts = [discord.Embed.from_dict(e["embed"]).to_dict() for e in corpus]
+    descs = [d.get("description") or "" for d in dicts]
+    titles = [d.get("title") or "" for d in dicts]
+    texts = titles + descs
+
+    results = [
+        bench_sync("parse_mazoku_embed", core.parse_mazoku_embed, dicts, rounds),
+        bench_sync("legacy helpers (all)", legacy_parse, dicts, rounds),
+        bench_sync("strip_discord_emojis", core.strip_discord_emojis, titles, rounds),
+        bench_sync("parse_emoji_id_from_text", core.parse_emoji_id_from_text, texts, rounds),
+        bench_sync("parse_version_from_text", core.parse_version_from_text, texts, rounds),
+        bench_sync("parse_series_from_desc", core.parse_series_from_desc, descs, rounds),
+        bench_sync("parse_batch_from_desc", core.parse_batch_from_desc, descs, rounds),
+        bench_sync("parse_owner_id_from_desc", core.parse_owner_id_from_desc, descs, rounds),
+        bench_sync("parse_rarity", core.parse_rarity, dicts, rounds),
+        bench_sync("parse_event_or_special", core.parse_event_or_special, dicts, rounds),
+    ]
+    results.append(asyncio.run(bench_ingest(corpus, rounds)))
+    return results
+
+
+def print_report(results: list, out=sys.stdout):
+    header = f"{'benchmark':<28} {'msgs/s':>12} {'p50 µs':>9} {'p99 µs':>9} {'alloc B/msg':>12}"
+    print(header, file=out)
+    print("-" * len(header), file=out)
+    for r in results:
+        print(
+            f"{r['name']:<28} {r['msgs_per_sec']:>12,.0f} {r['p50_us']:>9.2f} "
+            f"{r['p99_us']:>9.2f} {r['alloc_bytes_per_msg']:>12,.0f}",
+            file=out,
+        )
+
+
+def compare(results: list, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for r in results:
+        ref = baseline.get(r["name"])
+        if not ref:
+            continue
+        limit = ref["p50_us"] * (1 + tolerance)
+        if r["p50_us"] > limit:
+            regressions.append((r["name"], ref["p50_us"], r["p50_us"]))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fixtures", type=Path, default=FIXTURES)
+    parser.add_argument("--rounds", type=int, default=500, help="passes over the corpus per benchmark")
+    parser.add_argument("--baseline", type=Path, help="fail if p50 regresses against this file")
+    parser.add_argument("--tolerance", type=float, default=0.30, help="allowed p50 slowdown (0.30 = +30%%)")
+    parser.add_argument("--save-baseline", type=Path, help="write results as a new baseline")
+    parser.add_argument("--redis-url", help="measure MEMORY USAGE per cached card on this Redis")
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus(args.fixtures)
+    mismatches = check_equivalence(corpus)
+    for i, kind, expected, got in mismatches:
+        print(f"❌ fixture #{i} ({kind}): legacy={expected} single-pass={got}")
+
+    results = run(corpus, args.rounds)
+    print(f"corpus: {len(corpus)} embeds, {args.rounds} rounds")
+    print_report(results)
+    payloads = card_payloads(corpus)
+    memory = asyncio.run(redis_memory(args.redis_url, payloads)) if args.redis_url else None
+    print_sizes(payloads, memory)
+
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps({r["name"]: r for r in results}, indent=2))
+        print(f"Baseline saved to {args.save_baseline}")
+
+    failed = bool(mismatches)
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+        for name, ref, now in regressions:
+            print(f"❌ {name}: p50 {now:.2f} µs vs baseline {ref:.2f} µs (+{(now / ref - 1) * 100:.0f}%)")
+        failed = failed or bool(regressions)
+    if not failed:
+        print("✅ No regression.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""Leader failover with two processes: does exactly one node hold the lease?
+
+    REDIS_URL=redis://localhost:6379 python -m bench.leader
+
+Starts two contender processes running cogs.leader.LeaderLease (short TTL,
+own key), then stops the leader twice: SIGTERM (lease released on close) and
+SIGKILL (lease left to expire). Prints the failover time of each and exits
+with status 1 if the other node did not take over in time or if both nodes
+claimed the lease at once.
+"""
+import asyncio
+import itertools
+import os
+import signal
+import sys
+import time
+
+import redis.asyncio as redis
+
+from cogs.leader import LeaderLease
+
+KEY = "bench:leader"
+TTL = 3.0
+RENEW = 1.0
+NODE_IDS = itertools.count(1)
+
+
+async def contender(url: str, node: str):
+    client = redis.from_url(url, decode_responses=True)
+    lease = LeaderLease(client, key=KEY, ttl=TTL, renew_interval=RENEW, node=node)
+    lease.on_change(lambda leader: print(f"{'LEADER' if leader else 'FOLLOWER'} {node} {time.time():.3f}", flush=True))
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    lease.start()
+    print(f"READY {node}", flush=True)
+    await stop.wait()
+    await lease.close()
+    await client.aclose()
+
+
+async def spawn(procs: dict, events: asyncio.Queue):
+    node = f"node-{next(NODE_IDS)}"
+    procs[node] = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "bench.leader", "--node", node, stdout=asyncio.subprocess.PIPE
+    )
+    asyncio.create_task(read_events(procs[node], events))
+
+
+async def read_events(proc, events: asyncio.Queue):
+    async for line in proc.stdout:
+        kind, node, *rest = line.decode().split()
+        await events.put((kind, node, float(rest[0]) if rest else time.time()))
+
+
+async def wait_for(events: asyncio.Queue, kind: str, timeout: float, leaders: set):
+    deadline = time.monotonic() + timeout
+    while True:
+        event = await asyncio.wait_for(events.get(), max(deadline - time.monotonic(), 0.01))
+        if event[0] == "LEADER":
+            leaders.add(event[1])
+            if len(leaders) > 1:
+                raise RuntimeError(f"two leaders at once: {sorted(leaders)}")
+        elif event[0] == "FOLLOWER":
+            leaders.discard(event[1])
+        if event[0] == kind:
+            return event
+
+
+async def failover(sig: int, events: asyncio.Queue, procs: dict, leaders: set) -> float:
+    # Le leader tourne (au plus un tour de renouvellement pour l'élection)
+    while not leaders:
+        await wait_for(events, "LEADER", TTL + RENEW * 2, leaders)
+    old = next(iter(leaders))
+    stopped_at = time.time()
+    procs[old].send_signal(sig)
+    await procs[old].wait()
+    del procs[old]
+    leaders.discard(old)  # SIGKILL : pas de FOLLOWER
+    _, new, at = await wait_for(events, "LEADER", TTL + RENEW * 3, leaders)
+    await spawn(procs, events)  # un second candidat pour le tour suivant
+    return at - stopped_at
+
+
+async def run(url: str) -> int:
+    client = redis.from_url(url, decode_responses=True)
+    await client.delete(KEY)
+    await client.aclose()
+
+    events: asyncio.Queue = asyncio.Queue()
+    procs: dict = {}
+    for _ in range(2):
+        await spawn(procs, events)
+    leaders: set = set()
+    failed = 0
+    try:
+        for name, sig, limit in (("SIGTERM", signal.SIGTERM, RENEW * 2), ("SIGKILL", signal.SIGKILL, TTL + RENEW * 2)):
+            try:
+                seconds = await failover(sig, events, procs, leaders)
+            except (RuntimeError, asyncio.TimeoutError) as e:
+                print(f"❌ {name:<8} {e or 'no new leader'}")
+                failed += 1
+                continue
+            ok = seconds <= limit
+            failed += not ok
+            print(f"{'✅' if ok else '❌'} {name:<8} failover in {seconds:.2f}s (limit {limit:.1f}s, ttl {TTL:.0f}s)")
+    finally:
+        for proc in procs.values():
+            if proc.returncode is None:
+                proc.send_signal(signal.SIGTERM)
+        await asyncio.gather(*(p.wait() for p in procs.values()))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    url = os.getenv("REDIS_URL", "redis://localhost:6379")
+    if sys.argv[1:2] == ["--node"]:
+        asyncio.run(contender(url, sys.argv[2]))
+    else:
+        sys.exit(asyncio.run(run(url)))
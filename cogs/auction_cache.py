@@ -0,0 +1,168 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from . import db
+from .metrics import AUCTION_CACHE_REQUESTS
+
+# Cache read-through des lignes auctions lues par clé primaire
+# (/auction-status, boutons de review...) :
+#  1. LRU en mémoire (AUCTION_CACHE_SIZE lignes, AUCTION_CACHE_TTL secondes)
+#  2. Redis (auction:row:{id}, AUCTION_REDIS_TTL secondes), partagé entre process
+#  3. Postgres (auction_by_id)
+# Chaque écriture sur auctions passe par store() (UPDATE ... RETURNING *) :
+# la nouvelle ligne remplace celle de Redis et un message sur
+# AUCTION_INVALIDATE_CHANNEL fait oublier l'id aux LRU des autres process.
+# Un remplissage depuis Postgres n'écrase jamais Redis (SET NX) et n'entre
+# pas dans le LRU si l'id a été invalidé pendant la lecture.
+AUCTION_CACHE_SIZE = 2048
+AUCTION_CACHE_TTL = 60.0  # filet de sécurité si un message pub/sub est perdu
+AUCTION_REDIS_TTL = 600
+AUCTION_ROW_KEY = "auction:row:{id}"
+AUCTION_INVALIDATE_CHANNEL = "auction:invalidate"
+AUCTION_LISTEN_POLL = 1.0
+
+DATETIME_COLUMNS = ("created_at",)
+
+
+def encode_row(row: dict) -> str:
+    return json.dumps(
+        {k: (v.isoformat() if k in DATETIME_COLUMNS and v else v) for k, v in row.items()},
+        separators=(",", ":"), ensure_ascii=False
+    )
+
+
+def decode_row(raw: str) -> dict:
+    row = json.loads(raw)
+    for k in DATETIME_COLUMNS:
+        if row.get(k):
+            row[k] = datetime.fromisoformat(row[k])
+    return row
+
+
+class AuctionCache:
+    def __init__(self, bot, size: int = AUCTION_CACHE_SIZE, ttl: float = AUCTION_CACHE_TTL):
+        self.bot = bot
+        self.size = size
+        self.ttl = ttl
+        self.token = uuid.uuid4().hex  # ignore nos propres messages d'invalidation
+        self._rows: "OrderedDict[int, tuple]" = OrderedDict()  # id -> (expire, ligne)
+        self._generation = Counter()  # id -> nb d'invalidations reçues
+        self._task: Optional[asyncio.Task] = None
+        self.stats = Counter()
+
+    def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._listen())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def get(self, auction_id: int) -> Optional[dict]:
+        auction_id = int(auction_id)
+        entry = self._rows.get(auction_id)
+        if entry and entry[0] > time.monotonic():
+            self._rows.move_to_end(auction_id)
+            self._count("local_hit")
+            return dict(entry[1])
+
+        key = AUCTION_ROW_KEY.format(id=auction_id)
+        generation = self._generation[auction_id]
+        raw = await self.bot.redis.get(key)
+        if raw is not None:
+            row = decode_row(raw)
+            self._count("redis_hit")
+        else:
+            rec = await db.fetchrow(self.bot.pg, "auction_by_id", auction_id)  # auction_core
+            self._count("miss")
+            if rec is None:
+                return None
+            row = dict(rec)
+            await self.bot.redis.set(key, encode_row(row), ex=AUCTION_REDIS_TTL, nx=True)
+        if self._generation[auction_id] == generation:
+            self._put(row)
+        return dict(row)
+
+    async def store(self, rows: Iterable):
+        """Après une écriture (lignes RETURNING *) : met à jour les deux niveaux
+        et invalide les LRU des autres process."""
+        rows = [dict(r) for r in rows]
+        if not rows:
+            return
+        pipe = self.bot.redis.pipeline(transaction=False)
+        for row in rows:
+            self._invalidate_local(row["id"])
+            self._put(row)
+            pipe.set(AUCTION_ROW_KEY.format(id=row["id"]), encode_row(row), ex=AUCTION_REDIS_TTL)
+        pipe.publish(AUCTION_INVALIDATE_CHANNEL, self._message(r["id"] for r in rows))
+        await pipe.execute()
+
+    async def invalidate(self, auction_ids: Iterable[int]):
+        ids = [int(i) for i in auction_ids]
+        if not ids:
+            return
+        for auction_id in ids:
+            self._invalidate_local(auction_id)
+        pipe = self.bot.redis.pipeline(transaction=False)
+        pipe.delete(*(AUCTION_ROW_KEY.format(id=i) for i in ids))
+        pipe.publish(AUCTION_INVALIDATE_CHANNEL, self._message(ids))
+        await pipe.execute()
+
+    def ratios(self) -> Dict[str, float]:
+        total = sum(self.stats.values())
+        return {k: (self.stats[k] / total if total else 0.0) for k in ("local_hit", "redis_hit", "miss")}
+
+    def _count(self, result: str):
+        self.stats[result] += 1
+        AUCTION_CACHE_REQUESTS.inc(result)
+
+    def _put(self, row: dict):
+        self._rows[row["id"]] = (time.monotonic() + self.ttl, row)
+        self._rows.move_to_end(row["id"])
+        while len(self._rows) > self.size:
+            self._rows.popitem(last=False)
+
+    def _invalidate_local(self, auction_id: int):
+        self._generation[auction_id] += 1
+        self._rows.pop(auction_id, None)
+
+    def _message(self, ids: Iterable[int]) -> str:
+        return f"{self.token}:{','.join(str(i) for i in ids)}"
+
+    async def _listen(self):
+        while True:
+            pubsub = self.bot.redis.pubsub()
+            try:
+                await pubsub.subscribe(AUCTION_INVALIDATE_CHANNEL)
+                # Messages perdus pendant la (re)connexion : on repart d'un LRU vide
+                self._rows.clear()
+                while True:
+                    # Attente bornée (et non listen()) : compatible avec le
+                    # socket_timeout du client sur toutes les versions de redis-py
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True, timeout=AUCTION_LISTEN_POLL
+                    )
+                    if message is None or message["type"] != "message":
+                        continue
+                    token, _, ids = message["data"].partition(":")
+                    if token == self.token:
+                        continue
+                    for auction_id in ids.split(","):
+                        if auction_id:
+                            self._invalidate_local(int(auction_id))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"Auction cache invalidation listener failed: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
@@ -1,11 +1,20 @@
+import asyncio
 import json
+import logging
 import re
+from collections import Counter, OrderedDict
 import discord
 from discord.ext import commands
-from typing import Optional, Dict
+from typing import Optional, Dict, NamedTuple, Tuple, List
 from datetime import date
 from discord import app_commands
 from .admin_guard import is_staff
+from .utils import encode_card
+from .migrations import run_migrations
+from . import db
+from .db import register_query
+from .metrics import timed
+from .render import auction_payload, payload_embed, stats as render_stats
 
 RARITY_FROM_EMOJI_ID = {
     1342202203515125801: "UR",
@@ -15,32 +24,60 @@ RARITY_FROM_EMOJI_ID = {
     1342202221558763571: "COMMON",
 }
 
+EMOJI_RE = re.compile(r"<a?:\w+:(\d+)>")
+VERSION_RE = re.compile(r"\bv(\d+)\b", re.IGNORECASE)
+VERSION_LABEL_RE = re.compile(r"Version:\s*`?(\d+)`?", re.IGNORECASE)
+SERIES_RE = re.compile(r"\*\*Series:\*\*\s*(.+)")
+BATCH_RE = re.compile(r"Batch\s+(\d+)", re.IGNORECASE)
+OWNER_RE = re.compile(r"Owned by <@(\d+)>")
+
+# Un seul scan par texte. Chaque branche commence par un caractère littéral
+# (ce qui permet au moteur de sauter directement aux candidats) et ne consomme
+# que ce caractère : le reste est en lookahead, donc aucune branche n'en masque
+# une autre (ex. un emoji <:v2:...> reste visible pour la version).
+EMBED_SCAN_RE = re.compile(
+    r"<(?=a?:\w+:(\d+)>)"                                               # 1: emoji id
+    r"|O(?=wned by <@(\d+)>)"                                           # 2: owner
+    r"|v(?:(?<=\bv)(?=(\d+)\b)|(?=(?i:ersion:)\s*`?(\d+)`?))"           # 3: vN, 4: Version:
+    r"|V(?:(?<=\bV)(?=(\d+)\b)|(?=(?i:ersion:)\s*`?(\d+)`?))"           # 5: VN, 6: Version:
+    r"|b(?=(?i:atch)\s+(\d+))"                                          # 7: batch
+    r"|B(?=(?i:atch)\s+(\d+))"                                          # 8: Batch
+    r"|\*(?=\*Series:\*\*\s*(.+))"                                      # 9: series
+)
+
 def strip_discord_emojis(text: str) -> str:
-    return re.sub(r"<a?:\w+:\d+>", "", text or "").strip()
+    return EMOJI_RE.sub("", text or "").strip()
 
 def parse_emoji_id_from_text(text: str) -> Optional[int]:
-    m = re.search(r"<a?:\w+:(\d+)>", text or "")
+    m = EMOJI_RE.search(text or "")
     return int(m.group(1)) if m else None
 
 def parse_version_from_text(text: str) -> Optional[str]:
-    m = re.search(r"\bv(\d+)\b", text or "", flags=re.IGNORECASE)
+    m = VERSION_RE.search(text or "")
     if m:
         return m.group(1)
-    m2 = re.search(r"Version:\s*`?(\d+)`?", text or "", flags=re.IGNORECASE)
+    m2 = VERSION_LABEL_RE.search(text or "")
     return m2.group(1) if m2 else None
 
 def parse_series_from_desc(desc: str) -> Optional[str]:
-    m = re.search(r"\*\*Series:\*\*\s*(.+)", desc or "")
+    m = SERIES_RE.search(desc or "")
     return m.group(1).strip() if m else None
 
 def parse_batch_from_desc(desc: str) -> Optional[int]:
-    m = re.search(r"Batch\s+(\d+)", desc or "", flags=re.IGNORECASE)
+    m = BATCH_RE.search(desc or "")
     return int(m.group(1)) if m else None
 
 def parse_owner_id_from_desc(desc: str) -> Optional[int]:
-    m = re.search(r"Owned by <@(\d+)>", desc or "")
+    m = OWNER_RE.search(desc or "")
     return int(m.group(1)) if m else None
 
+def rarity_from_text(title: str, desc: str, footer: str) -> Optional[str]:
+    joined = " ".join([title.upper(), desc.upper(), footer.upper()])
+    for key in ["UR", "SSR", "SR", "RARE", "COMMON"]:
+        if key in joined:
+            return key
+    return None
+
 def parse_rarity(embed_dict: Dict) -> Optional[str]:
     title = embed_dict.get("title") or ""
     eid = parse_emoji_id_from_text(title)
@@ -50,27 +87,13 @@ def parse_rarity(embed_dict: Dict) -> Optional[str]:
     eid2 = parse_emoji_id_from_text(desc)
     if eid2 and eid2 in RARITY_FROM_EMOJI_ID:
         return RARITY_FROM_EMOJI_ID[eid2]
-    joined = " ".join([
-        title.upper(),
-        (embed_dict.get("description") or "").upper(),
-        ((embed_dict.get("footer") or {}).get("text") or "").upper()
-    ])
-    for key in ["UR", "SSR", "SR", "RARE", "COMMON"]:
-        if key in joined:
-            return key
-    return None
+    footer = (embed_dict.get("footer") or {}).get("text") or ""
+    return rarity_from_text(title, desc, footer)
 
 # --- Détection Event / Special ---
-def parse_event_or_special(embed_dict: Dict) -> Dict[str, Optional[str]]:
-    title = (embed_dict.get("title") or "").lower()
-    desc = (embed_dict.get("description") or "").lower()
-    footer = ((embed_dict.get("footer") or {}).get("text") or "").lower()
-    text = " ".join([title, desc, footer])
-
+def parse_event_markers(text: str) -> Tuple[Optional[str], Optional[str]]:
+    # text doit déjà être en minuscules
     event_icon = None
-    special_icon = None
-
-    # Event
     if "christmas" in text or "🎄" in text:
         event_icon = "🎄"
     elif "halloween" in text or "🎃" in text:
@@ -80,56 +103,148 @@ def parse_event_or_special(embed_dict: Dict) -> Dict[str, Optional[str]]:
     elif "summer" in text or "🏖️" in text:
         event_icon = "🏖️"
 
-    # Special
-    if "special" in text or "✨" in text:
-        special_icon = "✨"
+    special_icon = "✨" if "special" in text or "✨" in text else None
+    return event_icon, special_icon
 
+def parse_event_or_special(embed_dict: Dict) -> Dict[str, Optional[str]]:
+    title = (embed_dict.get("title") or "").lower()
+    desc = (embed_dict.get("description") or "").lower()
+    footer = ((embed_dict.get("footer") or {}).get("text") or "").lower()
+    event_icon, special_icon = parse_event_markers(" ".join([title, desc, footer]))
     return {"event": event_icon, "special": special_icon}
 
-# --- Log utilitaire ---
-async def log_card_ready(bot: commands.Bot, auction: Dict):
-    guild = bot.get_guild(bot.guild_id)
-    if not guild:
-        return
-    log_channel = guild.get_channel(bot.log_channel_id)
-    if not log_channel:
-        return
-
-    card_name = auction["title"] or (
-        f"{auction['series']}" if auction.get("series") else f"Auction #{auction['id']}"
+# --- Parser single-pass ---
+class ParsedCard(NamedTuple):
+    title: str
+    rarity: str
+    series: Optional[str]
+    version: Optional[str]
+    batch: Optional[int]
+    owner_id: int
+    image_url: Optional[str]
+    event: Optional[str]
+    special: Optional[str]
+
+    def to_payload(self) -> Dict:
+        return self._asdict()
+
+SCAN_EMOJI, SCAN_OWNER, SCAN_VERSION, SCAN_VERSION_LABEL, SCAN_BATCH, SCAN_SERIES = range(6)
+# groupe de EMBED_SCAN_RE (index 0-based) -> champ SCAN_*
+SCAN_COLUMNS = (SCAN_EMOJI, SCAN_OWNER, SCAN_VERSION, SCAN_VERSION_LABEL,
+                SCAN_VERSION, SCAN_VERSION_LABEL, SCAN_BATCH, SCAN_BATCH, SCAN_SERIES)
+
+def _scan(text: str) -> List[Optional[str]]:
+    # Premier match de chaque champ, en un seul passage sur le texte
+    found = [None] * 6
+    for m in EMBED_SCAN_RE.finditer(text):
+        field = SCAN_COLUMNS[m.lastindex - 1]
+        if found[field] is None:
+            found[field] = m.group(m.lastindex)
+    return found
+
+def parse_mazoku_embed(data: Dict) -> Optional[ParsedCard]:
+    """Parse un embed Mazoku (dict) en un seul scan du titre et de la description.
+
+    Retourne None si l'embed n'a pas de propriétaire (pas une carte).
+    Même résultat que la combinaison des helpers parse_* ci-dessus.
+    """
+    desc = data.get("description") or ""
+    if "Owned by <@" not in desc:
+        return None
+    d = _scan(desc)
+    owner_id = int(d[SCAN_OWNER]) if d[SCAN_OWNER] else None
+    if not owner_id:
+        return None
+
+    title_raw = data.get("title") or ""
+    t = _scan(title_raw)
+    footer = (data.get("footer") or {}).get("text") or ""
+
+    rarity = RARITY_FROM_EMOJI_ID.get(int(t[SCAN_EMOJI])) if t[SCAN_EMOJI] else None
+    if not rarity and d[SCAN_EMOJI]:
+        rarity = RARITY_FROM_EMOJI_ID.get(int(d[SCAN_EMOJI]))
+    if not rarity:
+        rarity = rarity_from_text(title_raw, desc, footer)
+
+    version = t[SCAN_VERSION] or t[SCAN_VERSION_LABEL] or d[SCAN_VERSION] or d[SCAN_VERSION_LABEL]
+    series = d[SCAN_SERIES]
+    event, special = parse_event_markers(" ".join([title_raw.lower(), desc.lower(), footer.lower()]))
+
+    return ParsedCard(
+        title=EMOJI_RE.sub("", title_raw).strip() if t[SCAN_EMOJI] else title_raw.strip(),
+        rarity=rarity or "COMMON",
+        series=series.strip() if series is not None else None,
+        version=version,
+        batch=int(d[SCAN_BATCH]) if d[SCAN_BATCH] else None,
+        owner_id=owner_id,
+        image_url=(data.get("image") or {}).get("url"),
+        event=event,
+        special=special,
     )
 
-    embed = discord.Embed(
-        title="Card added to waiting list",
-        color=discord.Color.green()
-    )
-    embed.add_field(name="Name of the card", value=f"{card_name} v{auction.get('version') or '?'}", inline=True)
-    embed.add_field(name="Version", value=auction.get("version") or "?", inline=True)
-    embed.add_field(name="Queue", value=auction.get("queue_type") or "?", inline=True)
-    embed.add_field(name="Seller", value=f"<@{auction['user_id']}>", inline=True)
-    embed.add_field(name="Rarity", value=auction.get("rarity") or "?", inline=True)
-    embed.add_field(name="Currency", value=auction.get("currency") or "N/A", inline=True)
-    embed.add_field(name="Rate", value=auction.get("rate") or "N/A", inline=True)
-    if auction.get("event"):
-        embed.add_field(name="Event", value=auction["event"], inline=True)
-    if auction.get("special"):
-        embed.add_field(name="Special", value=auction["special"], inline=True)
-    if auction.get("image_url"):
-        embed.set_image(url=auction["image_url"])
-
-    await log_channel.send(embed=embed)
+# --- Cache des cartes ---
+CARD_CACHE_TTL = 600
+
+# Mode "stream" : le listener publie l'embed brut ici, les workers de
+# cogs/ingest_stream.py (ou ingest_worker.py) font le parsing et le cache.
+INGEST_STREAM = "mazoku:ingest"
+INGEST_STREAM_MAXLEN = 10000
+
+async def cache_card(redis, data: Dict) -> Optional[ParsedCard]:
+    card = parse_mazoku_embed(data)
+    if card:
+        await redis.set(f"mazoku:card:{card.owner_id}", encode_card(card.to_payload()), ex=CARD_CACHE_TTL)
+    return card
+
+# --- Log utilitaire ---
+async def log_card_ready(bot: commands.Bot, auction: Dict):
+    # Embed pré-rendu (cogs/render.py), clé id + rev de la ligne
+    payload = await auction_payload(bot.redis, auction)
+    await bot.log_sink.send(bot.guild_config.primary.log_channel_id, payload_embed(payload, "ready_log"))
 
 
 # --- Helper ---
+register_query("auction_set_status", "UPDATE auctions SET status=$2 WHERE id=$1 RETURNING *")
+register_query("auction_by_id", "SELECT * FROM auctions WHERE id=$1")
+
+
+async def set_auction_status(pool, auction_id: int, status: str, cache=None):
+    """Change le statut. Retourne la ligne à jour (None si absente) et la
+    pousse dans le cache d'auctions (cogs/auction_cache.py) s'il est fourni."""
+    auction = await db.fetchrow(pool, "auction_set_status", auction_id, status)
+    if auction and cache:
+        await cache.store([auction])
+    return auction
+
+
 async def mark_auction_ready(bot: commands.Bot, pool, auction_id: int):
-    await pool.execute("UPDATE auctions SET status='READY' WHERE id=$1", auction_id)
-    auction = await pool.fetchrow("SELECT * FROM auctions WHERE id=$1", auction_id)
+    # UPDATE ... RETURNING : plus de SELECT après coup
+    auction = await set_auction_status(pool, auction_id, "READY", bot.auctions)
     if auction:
         await log_card_ready(bot, dict(auction))
     return auction
+# --- Coalescing des edits Mazoku ---
+# Mazoku édite le même message plusieurs fois (claim, flip...) : on garde
+# seulement le dernier edit d'une fenêtre, et on ignore ceux dont le contenu
+# parsé (titre, description, footer, image) n'a pas changé.
+EDIT_COALESCE_SECONDS = 1.0
+FINGERPRINT_CACHE_SIZE = 4096
+
+def embed_fingerprint(emb: discord.Embed) -> int:
+    return hash((emb.title, emb.description, emb.footer.text, emb.image.url))
+
+
 class AuctionCore(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self._fingerprints: "OrderedDict[int, int]" = OrderedDict()
+        self._pending_edits: Dict[int, discord.Message] = {}
+        self._edit_tasks: Dict[int, asyncio.Task] = {}
+        self.ingest_stats = Counter()
+
+    def cog_unload(self):
+        for task in self._edit_tasks.values():
+            task.cancel()
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
@@ -139,44 +254,145 @@ class AuctionCore(commands.Cog):
     @commands.Cog.listener()
     async def on_message_edit(self, before: discord.Message, after: discord.Message):
         if after.author.bot and after.author.id == self.bot.mazoku_bot_id:
-            await self._process_mazoku_embed(after)
+            self._queue_edit(after)
 
+    def _queue_edit(self, message: discord.Message):
+        self.ingest_stats["edits"] += 1
+        if not message.embeds:
+            return
+        if message.id in self._pending_edits:
+            # Un edit est déjà en attente : le plus récent remplace l'ancien
+            self._pending_edits[message.id] = message
+            self.ingest_stats["edits_coalesced"] += 1
+            return
+        if self._fingerprints.get(message.id) == embed_fingerprint(message.embeds[0]):
+            self.ingest_stats["edits_unchanged"] += 1
+            return
+        self._pending_edits[message.id] = message
+        self._edit_tasks[message.id] = asyncio.create_task(self._flush_edit(message.id))
+
+    async def _flush_edit(self, message_id: int):
+        try:
+            await asyncio.sleep(EDIT_COALESCE_SECONDS)
+            message = self._pending_edits.pop(message_id)
+            if self._fingerprints.get(message_id) == embed_fingerprint(message.embeds[0]):
+                self.ingest_stats["edits_unchanged"] += 1
+                return
+            await self._process_mazoku_embed(message)
+        except Exception:
+            # Tâche jamais attendue : sans ça l'erreur n'apparaît qu'au GC
+            logging.exception(f"Mazoku edit of message {message_id} failed")
+        finally:
+            self._pending_edits.pop(message_id, None)
+            self._edit_tasks.pop(message_id, None)
+
+    def _remember_fingerprint(self, message_id: int, fingerprint: int):
+        self._fingerprints[message_id] = fingerprint
+        self._fingerprints.move_to_end(message_id)
+        if len(self._fingerprints) > FINGERPRINT_CACHE_SIZE:
+            self._fingerprints.popitem(last=False)
+
+    @timed("_process_mazoku_embed")
     async def _process_mazoku_embed(self, message: discord.Message):
         if not message.embeds:
             return
         emb = message.embeds[0]
+        self._remember_fingerprint(message.id, embed_fingerprint(emb))
         data = emb.to_dict()
 
-        title_raw = data.get("title") or ""
-        title_clean = strip_discord_emojis(title_raw)
-        desc = data.get("description") or ""
-        image = (data.get("image") or {}).get("url")
-
-        owner_id = parse_owner_id_from_desc(desc)
-        if not owner_id:
+        if self.bot.ingest_mode == "stream":
+            await self.bot.redis.xadd(
+                INGEST_STREAM,
+                {"message_id": message.id, "embed": json.dumps(data)},
+                maxlen=INGEST_STREAM_MAXLEN,
+                approximate=True
+            )
+            self.ingest_stats["published"] += 1
             return
 
-        rarity = parse_rarity(data)
-        version = parse_version_from_text(title_raw) or parse_version_from_text(desc)
-        series = parse_series_from_desc(desc)
-        batch = parse_batch_from_desc(desc)
+        self.ingest_stats["parses"] += 1
+        if await cache_card(self.bot.redis, data):
+            self.ingest_stats["writes"] += 1
 
-        event_info = parse_event_or_special(data)
-
-        payload = {
-            "title": title_clean,
-            "rarity": rarity or "COMMON",
-            "series": series,
-            "version": version,
-            "batch": batch,
-            "owner_id": owner_id,
-            "image_url": image,
-            "raw": data,
-            "event": event_info.get("event"),
-            "special": event_info.get("special"),
-        }
+    @app_commands.command(
+        name="ingest-stats",
+        description="Show Mazoku ingestion counters (staff only)."
+    )
+    @is_staff()
+    async def ingest_stats_cmd(self, interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True)
+        s = self.ingest_stats
+        cached, avg_memory = await self._sample_card_memory()
+        saved = s["edits_coalesced"] + s["edits_unchanged"]
+        embed = discord.Embed(title="📥 Mazoku ingestion", color=discord.Color.blurple())
+        embed.add_field(name="Edits received", value=str(s["edits"]), inline=True)
+        embed.add_field(name="Coalesced", value=str(s["edits_coalesced"]), inline=True)
+        embed.add_field(name="Unchanged (dropped)", value=str(s["edits_unchanged"]), inline=True)
+        embed.add_field(name="Parses", value=str(s["parses"]), inline=True)
+        embed.add_field(name="Redis writes", value=str(s["writes"]), inline=True)
+        embed.add_field(name="Parses & writes saved", value=str(saved), inline=True)
+        if self.bot.ingest_mode == "stream":
+            worker_cog = self.bot.get_cog("IngestStream")
+            w = worker_cog.workers.stats if worker_cog else Counter()
+            info = await worker_cog.stream_info() if worker_cog else None
+            embed.add_field(name="Published to stream", value=str(s["published"]), inline=True)
+            embed.add_field(name="Worker parses / writes", value=f"{w['parses']} / {w['writes']}", inline=True)
+            embed.add_field(
+                name="Stream length / pending",
+                value=f"{info['length']} / {info['pending']}" if info else "—",
+                inline=True
+            )
+        embed.add_field(
+            name="Redis memory / cached card",
+            value=f"{avg_memory:,.0f} B (sampled {cached} keys)" if cached else "—",
+            inline=False
+        )
+        await interaction.followup.send(embed=embed, ephemeral=True)
 
-        await self.bot.redis.set(f"mazoku:card:{owner_id}", json.dumps(payload), ex=600)
+    @app_commands.command(
+        name="db-stats",
+        description="Show Postgres pool usage and saturation (staff only)."
+    )
+    @is_staff()
+    async def db_stats_cmd(self, interaction: discord.Interaction):
+        s = db.pool_stats(self.bot.pg)
+        embed = discord.Embed(title="🐘 Postgres pool", color=discord.Color.blurple())
+        embed.add_field(name="In use / size / max", value=f"{s['in_use']} / {s['size']} / {s['max']}", inline=True)
+        embed.add_field(name="Saturation", value=f"{s['saturation']:.0%}", inline=True)
+        embed.add_field(
+            name="Acquires (saturated)",
+            value=f"{s['acquires']} ({s['saturated_acquires']}, waited {s['wait_seconds']:.2f}s)",
+            inline=True
+        )
+        embed.add_field(name="Registered queries", value=str(len(db.QUERIES)), inline=True)
+        r = self.bot.auctions.ratios()
+        embed.add_field(
+            name="Auction cache (local / redis / miss)",
+            value=f"{r['local_hit']:.0%} / {r['redis_hit']:.0%} / {r['miss']:.0%} "
+                  f"of {sum(self.bot.auctions.stats.values())}",
+            inline=False
+        )
+        hits, misses = render_stats["hits"], render_stats["misses"]
+        embed.add_field(
+            name="Rendered embeds (hit ratio)",
+            value=f"{hits / (hits + misses) if hits + misses else 0:.0%} of {hits + misses}",
+            inline=False
+        )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    async def _sample_card_memory(self, sample: int = 50) -> Tuple[int, float]:
+        keys = []
+        async for key in self.bot.redis.scan_iter(match="mazoku:card:*", count=200):
+            keys.append(key)
+            if len(keys) >= sample:
+                break
+        if not keys:
+            return 0, 0.0
+        pipe = self.bot.redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.memory_usage(key)
+        sizes = [n for n in await pipe.execute() if n]
+        return len(sizes), (sum(sizes) / len(sizes) if sizes else 0.0)
 
     # --- Commande staff ---
     @app_commands.command(
@@ -184,7 +400,7 @@ class AuctionCore(commands.Cog):
         description="Force an auction to READY and log it (staff only)."
     )
     @is_staff()  # ✅ Seuls les rôles staff définis dans admin_guard.py peuvent exécuter
-    async def auction_force_ready(self, interaction: discord.Interaction, auction_id: str):
+    async def auction_force_ready(self, interaction: discord.Interaction, auction_id: int):
         await interaction.response.defer(ephemeral=True)
         auction = await mark_auction_ready(self.bot, self.bot.pg, auction_id)
         if auction:
@@ -201,62 +417,186 @@ class AuctionCore(commands.Cog):
 
 # --- Init DB ---
 async def init_db(pool):
-    await pool.execute("""
-    CREATE TABLE IF NOT EXISTS auctions (
-        id SERIAL PRIMARY KEY,
-        user_id BIGINT NOT NULL,
-        series TEXT,
-        version TEXT,
-        batch_no INT,
-        owner_id BIGINT,
-        rarity TEXT,
-        queue_type TEXT,
-        currency TEXT,
-        rate TEXT,
-        status TEXT DEFAULT 'PENDING',
-        created_at TIMESTAMPTZ DEFAULT NOW(),
-        title TEXT,
-        image_url TEXT,
-        event TEXT,
-        special TEXT
-    );
-    CREATE TABLE IF NOT EXISTS batches (
-        id SERIAL PRIMARY KEY,
-        batch_date DATE UNIQUE NOT NULL,
-        locked_at TIMESTAMPTZ,
-        posted_at TIMESTAMPTZ
-    );
-    CREATE TABLE IF NOT EXISTS batch_items (
-        id SERIAL PRIMARY KEY,
-        batch_id INT REFERENCES batches(id) ON DELETE CASCADE,
-        auction_id INT REFERENCES auctions(id) ON DELETE CASCADE,
-        position INT
-    );
-    CREATE TABLE IF NOT EXISTS reviews (
-        id SERIAL PRIMARY KEY,
-        auction_id INT REFERENCES auctions(id) ON DELETE CASCADE,
-        stage INT NOT NULL,
-        reviewer_id BIGINT NOT NULL,
-        decision TEXT NOT NULL,
-        reason TEXT,
-        created_at TIMESTAMPTZ DEFAULT NOW()
-    );
-    """)
-    return True
-
-
-async def get_or_create_today_batch(pool) -> int:
-    today = date.today()
-    rec = await pool.fetchrow("SELECT id FROM batches WHERE batch_date=$1", today)
-    if rec:
-        return rec["id"]
-    rec = await pool.fetchrow("INSERT INTO batches (batch_date) VALUES ($1) RETURNING id", today)
-    return rec["id"]
-
-
-async def lock_today_batch(pool):
-    today = date.today()
-    await pool.execute("UPDATE batches SET locked_at=NOW() WHERE batch_date=$1 AND locked_at IS NULL", today)
+    # Schéma géré par les migrations versionnées (cogs/migrations.py)
+    # Retourne [(version, nom, secondes)] des migrations appliquées (boot report)
+    return await run_migrations(pool)
+
+
+register_query("batch_by_date", "SELECT id FROM batches WHERE batch_date=$1")
+register_query("batch_create", "INSERT INTO batches (batch_date) VALUES ($1) RETURNING id")
+
+
+async def get_or_create_today_batch(pool, day: Optional[date] = None) -> int:
+    """Batch du jour (ou de `day`, ex. jour de post du planning), créé si absent."""
+    today = day or date.today()
+    batch_id = await db.fetchval(pool, "batch_by_date", today)
+    if batch_id:
+        return batch_id
+    return await db.fetchval(pool, "batch_create", today)
+
+
+BATCH_NORMAL_LIMIT = 15
+
+# Remplissage set-based : candidats READY (15 Normal max en comptant ceux déjà
+# dans le batch, Skip et Card Maker illimités), dédoublonnés sur
+# (user, carte, version, rareté) en gardant le premier dans l'ordre
+# Normal > Skip > Card Maker puis id, positions à la suite de l'existant.
+# Relancer la commande n'ajoute ni auction ni carte déjà présente dans le batch.
+FILL_BATCH_SQL = register_query("batch_fill", """
+WITH existing AS (
+    SELECT a.id, a.user_id, a.title, a.version, a.rarity, a.queue_type
+    FROM batch_items bi
+    JOIN auctions a ON a.id = bi.auction_id
+    WHERE bi.batch_id = $1
+),
+normals AS (
+    SELECT id, user_id, title, version, rarity, 0 AS q
+    FROM auctions
+    WHERE status='READY' AND queue_type='NORMAL'
+      AND id NOT IN (SELECT id FROM existing)
+    ORDER BY id ASC
+    LIMIT GREATEST($2 - (SELECT COUNT(*) FROM existing WHERE queue_type='NORMAL'), 0)
+),
+candidates AS (
+    SELECT * FROM normals
+    UNION ALL
+    SELECT id, user_id, title, version, rarity,
+           CASE queue_type WHEN 'SKIP' THEN 1 ELSE 2 END AS q
+    FROM auctions
+    WHERE status='READY' AND queue_type IN ('SKIP', 'CARD_MAKER')
+      AND id NOT IN (SELECT id FROM existing)
+),
+deduped AS (
+    SELECT DISTINCT ON (c.user_id, c.title, c.version, c.rarity) c.id, c.q
+    FROM candidates c
+    WHERE NOT EXISTS (
+        SELECT 1 FROM existing e
+        WHERE (e.user_id, e.title, e.version, e.rarity)
+              IS NOT DISTINCT FROM (c.user_id, c.title, c.version, c.rarity)
+    )
+    ORDER BY c.user_id, c.title, c.version, c.rarity, c.q, c.id
+),
+inserted AS (
+    INSERT INTO batch_items (batch_id, auction_id, position)
+    SELECT $1, id,
+           (SELECT COALESCE(MAX(position), 0) FROM batch_items WHERE batch_id=$1)
+           + ROW_NUMBER() OVER (ORDER BY q, id)
+    FROM deduped
+    ON CONFLICT (batch_id, auction_id) DO NOTHING
+    RETURNING auction_id
+)
+SELECT (SELECT COUNT(*) FROM inserted) AS inserted,
+       (SELECT COUNT(*) FROM candidates) AS candidates
+""")
+register_query("batch_lock_row", "SELECT id FROM batches WHERE id=$1 FOR UPDATE")
+
+
+async def fill_batch(pool, batch_id: int) -> Tuple[int, int]:
+    """Remplit le batch en une transaction. Retourne (insérés, candidats)."""
+    async with db.acquire(pool) as conn:
+        async with conn.transaction():
+            # Sérialise les remplissages concurrents du même batch
+            await db.execute(conn, "batch_lock_row", batch_id)
+            rec = await db.fetchrow(conn, "batch_fill", batch_id, BATCH_NORMAL_LIMIT)
+    return rec["inserted"], rec["candidates"]
+
+
+register_query("batch_delete", "DELETE FROM batches WHERE id=$1 RETURNING batch_date")
+register_query("auctions_mark_posted", "UPDATE auctions SET status='POSTED' WHERE id = ANY($1::int[]) RETURNING *")
+register_query("posted_threads_upsert", """
+    INSERT INTO posted_threads (auction_id, batch_date, position, forum_id, thread_id, link)
+    SELECT t.auction_id, COALESCE($1::date, CURRENT_DATE), t.position, t.forum_id, t.thread_id, t.link
+    FROM unnest($2::int[], $3::int[], $4::bigint[], $5::bigint[], $6::text[])
+         AS t(auction_id, position, forum_id, thread_id, link)
+    ON CONFLICT (auction_id) DO UPDATE
+    SET batch_date = EXCLUDED.batch_date, position = EXCLUDED.position,
+        forum_id = EXCLUDED.forum_id, thread_id = EXCLUDED.thread_id,
+        link = EXCLUDED.link, posted_at = NOW()
+""")
+
+
+async def record_posted_batch(pool, batch_id: int, posted: List[Dict], cache=None):
+    """Clôture un batch posté en une transaction : supprime le batch, passe les
+    auctions postées en POSTED (un seul UPDATE) et garde leurs threads."""
+    async with db.acquire(pool) as conn:
+        async with conn.transaction():
+            batch_date = await db.fetchval(conn, "batch_delete", batch_id)
+            if not posted:
+                return
+            ids = [p["id"] for p in posted]
+            rows = await db.fetch(conn, "auctions_mark_posted", ids)
+            await db.execute(
+                conn, "posted_threads_upsert",
+                batch_date,
+                ids,
+                [p["position"] for p in posted],
+                [p["forum_id"] for p in posted],
+                [p["thread_id"] for p in posted],
+                [p["link"] for p in posted],
+            )
+    if cache:
+        await cache.store(rows)
+
+
+# --- Compteurs de backlog (table auction_counts, maintenue par trigger) ---
+register_query("backlog_counts", "SELECT queue_type, n FROM auction_counts WHERE status=$1")
+register_query("backlog_counts_drift", """
+    WITH actual AS (
+        SELECT COALESCE(status, '') AS status, COALESCE(queue_type, '') AS queue_type, COUNT(*) AS n
+        FROM auctions GROUP BY 1, 2
+    )
+    SELECT COALESCE(a.status, c.status) AS status, COALESCE(a.queue_type, c.queue_type) AS queue_type
+    FROM actual a
+    FULL JOIN auction_counts c ON c.status = a.status AND c.queue_type = a.queue_type
+    WHERE COALESCE(c.n, 0) <> COALESCE(a.n, 0)
+""")
+register_query("backlog_count_lock", "SELECT 1 FROM auction_counts WHERE status=$1 AND queue_type=$2 FOR UPDATE")
+# Recompte après le verrou (nouveau snapshot en READ COMMITTED) ; 0 si l'écart a disparu
+register_query("backlog_count_fix", """
+    WITH actual AS (
+        SELECT COUNT(*) AS n FROM auctions
+        WHERE COALESCE(status, '') = $1 AND COALESCE(queue_type, '') = $2
+    ),
+    fixed AS (
+        INSERT INTO auction_counts (status, queue_type, n)
+        SELECT $1, $2, n FROM actual
+        ON CONFLICT (status, queue_type) DO UPDATE SET n = EXCLUDED.n
+        WHERE auction_counts.n <> EXCLUDED.n
+        RETURNING 1
+    )
+    SELECT COUNT(*) FROM fixed
+""")
+
+
+async def get_backlog_counts(pool, status: str = "READY") -> Dict[str, int]:
+    rows = await db.fetch(pool, "backlog_counts", status)
+    return {r["queue_type"]: r["n"] for r in rows}
+
+
+async def reconcile_backlog_counts(pool) -> int:
+    """Recalcule auction_counts depuis auctions. Retourne le nombre de compteurs corrigés.
+
+    Sans verrou de table : les écarts sont repérés sur un snapshot, puis chaque
+    compteur en écart est recompté et corrigé sous le verrou de sa seule ligne
+    (les triggers concurrents attendent ce verrou, leurs deltas s'appliquent
+    après la correction)."""
+    drifted = await db.fetch(pool, "backlog_counts_drift", timeout=db.MAINTENANCE_TIMEOUT)
+    fixed = 0
+    for row in drifted:
+        async with db.acquire(pool) as conn:
+            async with conn.transaction():
+                await db.execute(conn, "backlog_count_lock", row["status"], row["queue_type"])
+                fixed += await db.fetchval(
+                    conn, "backlog_count_fix", row["status"], row["queue_type"], timeout=db.MAINTENANCE_TIMEOUT
+                )
+    return fixed
+
+
+register_query("batch_lock_today", "UPDATE batches SET locked_at=NOW() WHERE batch_date=$1 AND locked_at IS NULL")
+
+
+async def lock_today_batch(pool, day: Optional[date] = None):
+    await db.execute(pool, "batch_lock_today", day or date.today())
 
 
 async def setup(bot: commands.Bot):
@@ -1,6 +1,7 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
+from .render import auction_payload, payload_embed
 
 class AuctionStatus(commands.Cog):
     def __init__(self, bot: commands.Bot):
@@ -8,26 +9,20 @@ class AuctionStatus(commands.Cog):
 
     @app_commands.command(name="auction-status", description="Check the status of an auction by ID.")
     async def auction_status(self, interaction: discord.Interaction, auction_id: int):
-        rec = await self.bot.pg.fetchrow(
-            "SELECT id, title, rarity, queue_type, status, currency, rate, user_id, image_url "
-            "FROM auctions WHERE id=$1",
-            auction_id
-        )
+        rec = await self.bot.auctions.get(auction_id)
         if not rec:
             return await interaction.response.send_message(f"Auction #{auction_id} not found.", ephemeral=True)
+        # Le lien du thread n'existe qu'une fois postée
+        thread_link = None
+        if rec["status"] == "POSTED":
+            thread_link = await self.bot.pg.fetchval(
+                "SELECT link FROM posted_threads WHERE auction_id=$1", auction_id
+            )
 
-        embed = discord.Embed(
-            title=f"Auction #{rec['id']} — {rec['title'] or 'Untitled'}",
-            color=discord.Color.blurple()
-        )
-        embed.add_field(name="Rarity", value=rec["rarity"], inline=True)
-        embed.add_field(name="Queue", value=rec["queue_type"], inline=True)
-        embed.add_field(name="Currency", value=rec["currency"], inline=True)
-        embed.add_field(name="Rate", value=rec["rate"] or "—", inline=True)
-        embed.add_field(name="Status", value=rec["status"], inline=True)
-        embed.add_field(name="Seller", value=f"<@{rec['user_id']}>", inline=False)
-        if rec["image_url"]:
-            embed.set_thumbnail(url=rec["image_url"])
+        # Embed pré-rendu (cogs/render.py), le lien du thread est ajouté ici
+        embed = payload_embed(await auction_payload(self.bot.redis, rec), "status")
+        if thread_link:
+            embed.add_field(name="Thread", value=thread_link, inline=False)
 
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
@@ -1,27 +1,61 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Awaitable, Callable, FrozenSet, List, Optional
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
-from .auction_core import get_or_create_today_batch
+from .auction_core import get_or_create_today_batch, fill_batch, get_backlog_counts, reconcile_backlog_counts
 from .admin_guard import is_staff
-
-# Forums d'enchères à scanner pour /auction-lock
-AUCTION_FORUMS = [
-    1304507540645740666,  # Common
-    1304507516423766098,  # Rare
-    1304536219677626442,  # SR
-    1304502617472503908,  # SSR
-    1304052056109350922,  # UR
-    1395405043431116871,  # CM
-]
-
-# Channel de log
-LOG_CHANNEL_ID = 1424688704584286248
+from . import db
+from .db import register_query
+from .outbound import PRIORITY_FORUM
+from .jobs import JobContext, describe_job
+from .render import render_batch
+
+AUCTION_LOCK_JOB = "auction_lock"
+
+register_query("batch_clear", "DELETE FROM batch_items WHERE batch_id=$1")
+register_query("batch_items_view", """
+    SELECT a.id, a.title, a.rarity, a.currency, a.rate, a.image_url, bi.position
+    FROM batch_items bi
+    JOIN auctions a ON bi.auction_id = a.id
+    WHERE bi.batch_id = $1
+    ORDER BY bi.position
+""")
+register_query("batch_item_get", "SELECT * FROM batch_items WHERE batch_id=$1 AND auction_id=$2")
+register_query("batch_item_delete", "DELETE FROM batch_items WHERE batch_id=$1 AND auction_id=$2")
 
 
 class BatchPreparation(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
 
+    async def cog_load(self):
+        self.reconcile_counts.start()
+        self.bot.jobs.register(AUCTION_LOCK_JOB, self.run_auction_lock)
+
+    async def cog_unload(self):
+        self.reconcile_counts.cancel()
+
+    # Filet de sécurité : les compteurs de backlog sont tenus par trigger,
+    # on les recalcule une fois par jour au cas où (TRUNCATE, restauration...)
+    @tasks.loop(hours=24)
+    async def reconcile_counts(self):
+        if not self.bot.leader.is_leader:
+            return  # fait par le process leader
+        fixed = await reconcile_backlog_counts(self.bot.pg)
+        if fixed:
+            logging.warning(f"Backlog counters: corrected {fixed} drifted counters")
+
+    @reconcile_counts.before_loop
+    async def before_reconcile_counts(self):
+        # Premier tour une fois le bail pris (pas pendant setup_hook, avant le
+        # ready : il serait sauté et le suivant n'aurait lieu que 24h après)
+        await self.bot.wait_until_ready()
+        await self.bot.leader.wait_leader()
+
     # -------------------------
     # BATCH COMMANDS
     # -------------------------
@@ -31,7 +65,7 @@ class BatchPreparation(commands.Cog):
     async def batch_clear(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
         bid = await get_or_create_today_batch(self.bot.pg)
-        await self.bot.pg.execute("DELETE FROM batch_items WHERE batch_id=$1", bid)
+        await db.execute(self.bot.pg, "batch_clear", bid)
         await interaction.followup.send(f"Batch #{bid} cleared.", ephemeral=True)
 
     @app_commands.command(
@@ -43,50 +77,13 @@ class BatchPreparation(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         bid = await get_or_create_today_batch(self.bot.pg)
 
-        normals = await self.bot.pg.fetch("""
-            SELECT id, user_id, title, version, rarity
-            FROM auctions
-            WHERE status='READY' AND queue_type='NORMAL'
-            ORDER BY id ASC
-            LIMIT 15
-        """)
-
-        skips = await self.bot.pg.fetch("""
-            SELECT id, user_id, title, version, rarity
-            FROM auctions
-            WHERE status='READY' AND queue_type='SKIP'
-            ORDER BY id ASC
-        """)
-
-        cms = await self.bot.pg.fetch("""
-            SELECT id, user_id, title, version, rarity
-            FROM auctions
-            WHERE status='READY' AND queue_type='CARD_MAKER'
-            ORDER BY id ASC
-        """)
-
-        # ✅ Filtrage des doublons (même user + même carte)
-        seen = set()
-        unique = []
-        for row in normals + skips + cms:
-            key = (row["user_id"], row["title"], row["version"], row["rarity"])
-            if key not in seen:
-                seen.add(key)
-                unique.append(row)
-
-        # ✅ Insertion dans batch_items
-        position = 1
-        for row in unique:
-            await self.bot.pg.execute(
-                "INSERT INTO batch_items (batch_id, auction_id, position) VALUES ($1,$2,$3)",
-                bid, row["id"], position
-            )
-            position += 1
+        inserted, candidates = await fill_batch(self.bot.pg, bid)
+        # Embeds des items pré-rendus maintenant, pas au moment de poster
+        await render_batch(self.bot.pg, self.bot.redis, bid)
 
-        ignored = (len(normals) + len(skips) + len(cms)) - len(unique)
         await interaction.followup.send(
-            f"Batch #{bid} filled with {position-1} unique items "
-            f"(ignored {ignored} duplicates).",
+            f"Batch #{bid} filled with {inserted} unique items "
+            f"(ignored {candidates - inserted} duplicates).",
             ephemeral=True
         )
 
@@ -104,17 +101,11 @@ class BatchPreparation(commands.Cog):
         else:
             batch_date = datetime.date.today()
 
-        bid = await self.bot.pg.fetchval("SELECT id FROM batches WHERE batch_date=$1", batch_date)
+        bid = await db.fetchval(self.bot.pg, "batch_by_date", batch_date)
         if not bid:
             return await interaction.followup.send(f"No batch found for `{batch_date}`.", ephemeral=True)
 
-        rows = await self.bot.pg.fetch("""
-            SELECT a.id, a.title, a.rarity, a.currency, a.rate, a.image_url, bi.position
-            FROM batch_items bi
-            JOIN auctions a ON bi.auction_id = a.id
-            WHERE bi.batch_id = $1
-            ORDER BY bi.position
-        """, bid)
+        rows = await db.fetch(self.bot.pg, "batch_items_view", bid)
 
         if not rows:
             return await interaction.followup.send(f"Batch #{bid} is empty.", ephemeral=True)
@@ -127,9 +118,10 @@ class BatchPreparation(commands.Cog):
     @is_staff()
     async def batch_status(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
-        normals = await self.bot.pg.fetchval("SELECT COUNT(*) FROM auctions WHERE status='READY' AND queue_type='NORMAL'")
-        skips = await self.bot.pg.fetchval("SELECT COUNT(*) FROM auctions WHERE status='READY' AND queue_type='SKIP'")
-        cms = await self.bot.pg.fetchval("SELECT COUNT(*) FROM auctions WHERE status='READY' AND queue_type='CARD_MAKER'")
+        counts = await get_backlog_counts(self.bot.pg, "READY")
+        normals = counts.get("NORMAL", 0)
+        skips = counts.get("SKIP", 0)
+        cms = counts.get("CARD_MAKER", 0)
 
         embed = discord.Embed(
             title="📊 Batch Status",
@@ -149,20 +141,14 @@ class BatchPreparation(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         bid = await get_or_create_today_batch(self.bot.pg)
 
-        row = await self.bot.pg.fetchrow(
-            "SELECT * FROM batch_items WHERE batch_id=$1 AND auction_id=$2",
-            bid, auction_id
-        )
+        row = await db.fetchrow(self.bot.pg, "batch_item_get", bid, auction_id)
         if not row:
             return await interaction.followup.send(
                 f"❌ Auction #{auction_id} is not in today's batch.",
                 ephemeral=True
             )
 
-        await self.bot.pg.execute(
-            "DELETE FROM batch_items WHERE batch_id=$1 AND auction_id=$2",
-            bid, auction_id
-        )
+        await db.execute(self.bot.pg, "batch_item_delete", bid, auction_id)
 
         await interaction.followup.send(
             f"✅ Auction #{auction_id} has been removed from batch #{bid}.",
@@ -172,31 +158,155 @@ class BatchPreparation(commands.Cog):
     @app_commands.command(name="auction-lock", description="Lock and archive all open auction threads in auction forums.")
     @is_staff()
     async def auction_lock(self, interaction: discord.Interaction):
-        await interaction.response.defer(ephemeral=True)
-        locked_count = 0
-        log_channel = interaction.guild.get_channel(LOG_CHANNEL_ID)
-
-        for forum_id in AUCTION_FORUMS:
-            forum = interaction.guild.get_channel(forum_id)
-            if not forum or not isinstance(forum, discord.ForumChannel):
-                continue
-
-            for thread in forum.threads:
-                if not thread.locked or not thread.archived:
-                    try:
-                        await thread.edit(locked=True, archived=True)
-                        locked_count += 1
-                        if log_channel:
-                            embed = discord.Embed(
-                                title="🔒 Auction thread locked",
-                                description=f"Thread: {thread.mention}\nForum: {forum.name}",
-                                color=discord.Color.red()
-                            )
-                            await log_channel.send(embed=embed)
-                    except Exception as e:
-                        print(f"Failed to lock thread {thread.id}: {e}")
-
-        await interaction.followup.send(f"🔒 {locked_count} auction threads have been locked and archived.", ephemeral=True)
+        job_id, created = await self.bot.jobs.enqueue(
+            AUCTION_LOCK_JOB, {"guild_id": interaction.guild_id}, requested_by=interaction.user.id
+        )
+        if not created:
+            return await interaction.response.send_message(
+                f"⏳ An auction lock is already running (job #{job_id}). Use `/job-status {job_id}`.",
+                ephemeral=True
+            )
+        await interaction.response.send_message(f"🔒 Auction lock queued (job #{job_id}).", ephemeral=True)
+
+        async def watcher(status: str, values: dict):
+            if status == "RUNNING":
+                suffix = f" ({values['failed']} failed)" if values.get("failed") else ""
+                content = f"🔒 Locking auction threads... {values.get('done', 0)}/{values.get('total', '?')}{suffix}"
+            elif status == "DONE" and not values.get("total"):
+                content = "🔒 No open auction thread to lock."
+            elif status == "DONE":
+                suffix = f", {values['failed']} failed" if values.get("failed") else ""
+                content = (
+                    f"🔒 {values['locked']} auction threads have been locked and archived "
+                    f"in {values['seconds']:.1f}s{suffix}."
+                )
+            else:
+                content = f"❌ Auction lock failed (job #{job_id}): {values.get('error', '?')[:300]}"
+            await interaction.edit_original_response(content=content)
+
+        self.bot.jobs.watch(job_id, watcher)
+
+    async def run_auction_lock(self, job: JobContext) -> dict:
+        """Job auction_lock. Reprise naturelle : les threads déjà verrouillés
+        et archivés ne sont plus actifs, le sweep suivant les ignore."""
+        guild = self.bot.get_guild(job.payload["guild_id"])
+        if not guild:
+            raise RuntimeError(f"Guild {job.payload['guild_id']} not available")
+        # Forums d'enchères à scanner : ceux de la config de la guild
+        routes = self.bot.guild_config.routes(guild.id)
+        threads = await list_open_auction_threads(guild, routes.lock_forum_ids)
+        if not threads:
+            return {"total": 0, "locked": 0}
+
+        async def progress(done: int, total: int, failed: int):
+            await job.progress(force=True, done=done, total=total, failed=failed)
+
+        report = await lock_auction_threads(self.bot, threads, progress)
+        await self.bot.log_sink.send(routes.staff_log_channel_id, build_lock_summary_embed(report))
+        return {
+            "total": report["total"],
+            "locked": report["locked"],
+            "failed": len(report["failed"]),
+            "seconds": round(report["seconds"], 1),
+        }
+
+    @app_commands.command(name="job-status", description="Show background jobs (batch post, auction lock).")
+    @app_commands.describe(job_id="Job ID (default: the latest jobs)")
+    @is_staff()
+    async def job_status(self, interaction: discord.Interaction, job_id: Optional[int] = None):
+        if job_id is not None:
+            row = await db.fetchrow(self.bot.pg, "job_get", job_id)
+            rows = [row] if row else []
+        else:
+            rows = await db.fetch(self.bot.pg, "jobs_recent", 10)
+        if not rows:
+            return await interaction.response.send_message("No job found.", ephemeral=True)
+        await interaction.response.send_message(
+            "\n".join(describe_job(r) for r in rows)[:1900], ephemeral=True
+        )
+
+
+# --- Sweep /auction-lock ---
+# Édits en parallèle, bornés : chaque PATCH passe par l'outbound (priorité
+# forum, cadence globale) et discord.py gère les buckets et les 429.
+AUCTION_LOCK_CONCURRENCY = 8
+LOCK_PROGRESS_INTERVAL = 2.0
+
+
+async def list_open_auction_threads(guild: discord.Guild, forums: FrozenSet[int]) -> List[discord.Thread]:
+    # GET /guilds/{id}/threads/active : tous les threads actifs, pas seulement ceux en cache.
+    # Un thread actif n'est jamais archivé : tous sont à archiver, même ceux déjà verrouillés
+    threads = await guild.active_threads()
+    return [t for t in threads if t.parent_id in forums]
+
+
+async def lock_auction_threads(bot: commands.Bot, threads: List[discord.Thread],
+                               progress: Optional[Callable[[int, int, int], Awaitable]] = None) -> dict:
+    started = time.perf_counter()
+    sem = asyncio.Semaphore(AUCTION_LOCK_CONCURRENCY)
+    per_forum = Counter()
+    failed = []
+    done = 0
+
+    async def lock(thread: discord.Thread):
+        nonlocal done
+        async with sem:
+            try:
+                await bot.outbound.send(
+                    PRIORITY_FORUM, f"channel:{thread.id}",
+                    lambda: thread.edit(locked=True, archived=True)
+                )
+                per_forum[thread.parent_id] += 1
+            except Exception as e:
+                # Un thread en échec (HTTP, timeout, outbound fermé...) compte dans
+                # failed sans interrompre le sweep
+                failed.append((thread.id, str(e) or type(e).__name__))
+                logging.warning(f"Failed to lock thread {thread.id}: {e!r}")
+            done += 1
+
+    async def report_progress():
+        while True:
+            await asyncio.sleep(LOCK_PROGRESS_INTERVAL)
+            try:
+                await progress(done, len(threads), len(failed))
+            except discord.HTTPException:
+                pass
+
+    reporter = asyncio.create_task(report_progress()) if progress else None
+    try:
+        await asyncio.gather(*(lock(t) for t in threads))
+    finally:
+        if reporter:
+            reporter.cancel()
+
+    return {
+        "total": len(threads),
+        "locked": sum(per_forum.values()),
+        "per_forum": per_forum,
+        "failed": failed,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def build_lock_summary_embed(report: dict) -> discord.Embed:
+    # Un seul log pour tout le sweep (au lieu d'un embed par thread)
+    embed = discord.Embed(
+        title="🔒 Auction threads locked",
+        description=f"{report['locked']}/{report['total']} threads locked and archived in {report['seconds']:.1f}s",
+        color=discord.Color.red()
+    )
+    if report["per_forum"]:
+        embed.add_field(
+            name="Per forum",
+            value="\n".join(f"<#{forum_id}>: {n}" for forum_id, n in report["per_forum"].most_common()),
+            inline=False
+        )
+    if report["failed"]:
+        lines = [f"<#{thread_id}>: {error[:80]}" for thread_id, error in report["failed"][:10]]
+        if len(report["failed"]) > 10:
+            lines.append(f"... +{len(report['failed']) - 10}")
+        embed.add_field(name=f"Failed ({len(report['failed'])})", value="\n".join(lines), inline=False)
+    return embed
 
 
 class BatchPaginationView(discord.ui.View):
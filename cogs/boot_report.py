@@ -0,0 +1,48 @@
+import json
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+# Profil du démarrage : imports, connexions, migrations, setup de chaque cog,
+# sync des commandes. Rempli par AuctionBot.setup_hook, loggé à la fin du boot,
+# gardé dans bot.boot_report (/boot-report) et dans Redis (BOOT_REPORT_KEY).
+BOOT_REPORT_KEY = "bot:boot_report"
+
+
+class BootReport:
+    def __init__(self, started: Optional[float] = None):
+        self.started = started or time.perf_counter()
+        self.steps: List[Tuple[str, str, float]] = []
+        self.total: Optional[float] = None
+
+    def add(self, phase: str, name: str, seconds: float):
+        self.steps.append((phase, name, seconds))
+
+    @contextmanager
+    def step(self, phase: str, name: str):
+        # Durée murale : les étapes lancées en parallèle se chevauchent
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, name, time.perf_counter() - t0)
+
+    def finish(self) -> float:
+        self.total = time.perf_counter() - self.started
+        return self.total
+
+    def to_dict(self) -> dict:
+        return {
+            "total": self.total,
+            "steps": [{"phase": p, "name": n, "seconds": round(s, 4)} for p, n, s in self.steps],
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict())
+
+    def render(self) -> str:
+        width = max((len(n) for _, n, _ in self.steps), default=0)
+        lines = [f"Boot report ({self.total or 0:.2f}s total)"]
+        for phase, name, seconds in self.steps:
+            lines.append(f"  {phase:<10} {name:<{width}} {seconds * 1000:>8.0f} ms")
+        return "\n".join(lines)
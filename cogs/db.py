@@ -0,0 +1,140 @@
+import json
+import os
+import time
+from collections import Counter
+from typing import Dict
+
+import asyncpg
+
+from .metrics import DB_QUERY_SECONDS
+
+# Couche d'accès Postgres partagée par les cogs :
+#  - pool configuré par variables d'environnement (PG_POOL_MIN, PG_POOL_MAX,
+#    PG_STATEMENT_CACHE_SIZE, PG_COMMAND_TIMEOUT, PG_MAX_INACTIVE_LIFETIME) ;
+#    PG_COMMAND_TIMEOUT borne les requêtes des commandes et des événements,
+#    la maintenance (migrations, recalcul des compteurs) passe
+#    timeout=MAINTENANCE_TIMEOUT
+#  - requêtes chaudes enregistrées par nom (register_query) : asyncpg garde
+#    chaque requête préparée dans le cache de statements de chaque connexion,
+#    le cache est dimensionné pour les contenir toutes
+#  - hook init par connexion (codecs json/jsonb)
+#  - métrique de saturation du pool (pool_stats)
+#  - latence par requête enregistrée (DB_QUERY_SECONDS, cogs/metrics.py)
+
+QUERIES: Dict[str, str] = {}
+
+# Compteurs d'attente sur le pool (acquire sans connexion libre)
+stats = Counter()
+
+# Requêtes longues hors chemin chaud (DDL, scans complets, attente de l'advisory lock)
+MAINTENANCE_TIMEOUT = float(os.getenv("PG_MAINTENANCE_TIMEOUT", "3600"))
+
+
+def register_query(name: str, sql: str) -> str:
+    """Enregistre une requête chaude sous un nom. Retourne le SQL."""
+    if QUERIES.get(name, sql) != sql:
+        raise ValueError(f"Query {name!r} already registered with a different statement")
+    QUERIES[name] = sql
+    return sql
+
+
+def pool_config() -> dict:
+    return {
+        "min_size": int(os.getenv("PG_POOL_MIN", "10")),
+        "max_size": int(os.getenv("PG_POOL_MAX", "10")),
+        # Assez grand pour toutes les requêtes enregistrées + le SQL inline
+        "statement_cache_size": int(os.getenv("PG_STATEMENT_CACHE_SIZE", "256")),
+        "command_timeout": float(os.getenv("PG_COMMAND_TIMEOUT", "30")),
+        "max_inactive_connection_lifetime": float(os.getenv("PG_MAX_INACTIVE_LIFETIME", "300")),
+    }
+
+
+async def init_connection(conn: asyncpg.Connection):
+    # json/jsonb décodés en objets Python (au lieu de str)
+    for typename in ("json", "jsonb"):
+        await conn.set_type_codec(
+            typename, schema="pg_catalog", encoder=json.dumps, decoder=json.loads, format="text"
+        )
+
+
+async def create_pool(dsn: str, **overrides) -> asyncpg.Pool:
+    config = {**pool_config(), **overrides}
+    return await asyncpg.create_pool(
+        dsn,
+        init=init_connection,
+        server_settings={"application_name": "auction-bot"},
+        **config
+    )
+
+
+def pool_stats(pool: asyncpg.Pool) -> dict:
+    size, idle, max_size = pool.get_size(), pool.get_idle_size(), pool.get_max_size()
+    in_use = size - idle
+    return {
+        "size": size,
+        "idle": idle,
+        "in_use": in_use,
+        "max": max_size,
+        "saturation": in_use / max_size if max_size else 0.0,
+        "acquires": stats["acquires"],
+        "saturated_acquires": stats["saturated"],
+        "wait_seconds": stats["wait_ms"] / 1000,
+    }
+
+
+class _Acquire:
+    """pool.acquire() qui compte les attentes quand le pool est plein."""
+
+    def __init__(self, db):
+        self.db = db
+        self._ctx = None
+        self.conn = None
+
+    async def __aenter__(self):
+        if not isinstance(self.db, asyncpg.Pool):
+            # Déjà une connexion (transaction en cours)
+            return self.db
+        pool = self.db
+        stats["acquires"] += 1
+        saturated = pool.get_idle_size() == 0 and pool.get_size() >= pool.get_max_size()
+        started = time.perf_counter()
+        self._ctx = pool.acquire()
+        self.conn = await self._ctx.__aenter__()
+        if saturated:
+            stats["saturated"] += 1
+            stats["wait_ms"] += int((time.perf_counter() - started) * 1000)
+        return self.conn
+
+    async def __aexit__(self, *exc):
+        if self._ctx:
+            await self._ctx.__aexit__(*exc)
+
+
+def acquire(db) -> _Acquire:
+    return _Acquire(db)
+
+
+# --- Exécution des requêtes enregistrées (db = pool ou connexion) ---
+# timeout=None : PG_COMMAND_TIMEOUT
+async def fetch(db, name: str, *args, timeout=None):
+    async with acquire(db) as conn:
+        with DB_QUERY_SECONDS.time(name):
+            return await conn.fetch(QUERIES[name], *args, timeout=timeout)
+
+
+async def fetchrow(db, name: str, *args, timeout=None):
+    async with acquire(db) as conn:
+        with DB_QUERY_SECONDS.time(name):
+            return await conn.fetchrow(QUERIES[name], *args, timeout=timeout)
+
+
+async def fetchval(db, name: str, *args, timeout=None):
+    async with acquire(db) as conn:
+        with DB_QUERY_SECONDS.time(name):
+            return await conn.fetchval(QUERIES[name], *args, timeout=timeout)
+
+
+async def execute(db, name: str, *args, timeout=None):
+    async with acquire(db) as conn:
+        with DB_QUERY_SECONDS.time(name):
+            return await conn.execute(QUERIES[name], *args, timeout=timeout)
@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import os
+from types import MappingProxyType
+from typing import FrozenSet, Mapping, NamedTuple, Optional
+
+from . import db
+from .db import register_query
+
+# Configuration par guild (forums, channels de review et de log, rôles) dans
+# la table guild_config (migration 8), chargée en une table de routage
+# immuable : chaque lookup sur un chemin chaud (post d'un thread, review,
+# check staff) est un dict.get, sans requête ni dict reconstruit.
+#  - un trigger fait NOTIFY guild_config à chaque changement : la guild est
+#    rechargée et la table remplacée d'un bloc (jamais modifiée sur place)
+#  - rechargement complet toutes les CONFIG_RELOAD_INTERVAL s et après une
+#    reconnexion (notifications perdues)
+#  - au premier boot, la guild principale (GUILD_ID) est créée avec les IDs
+#    que chaque appelant utilisait jusque-là : variables d'environnement pour
+#    les forums de post et les logs de post / ready / profil, IDs codés en dur
+#    (LEGACY_*) pour la review, les logs staff et le sweep /auction-lock
+# Module importé normalement (pas une extension) : le registre vit sur bot.guild_config.
+CONFIG_CHANNEL = "guild_config"
+CONFIG_RELOAD_INTERVAL = 300.0
+
+RARITIES = ("COMMON", "RARE", "SR", "SSR", "UR")
+QUEUES = ("NORMAL", "SKIP", "CARD_MAKER")
+
+# Valeurs historiques (batch_preparation, staff_review, admin_guard, scheduler),
+# utilisées seulement pour créer la ligne de la guild principale
+LEGACY_AUCTION_FORUMS = [
+    1304507540645740666,  # Common
+    1304507516423766098,  # Rare
+    1304536219677626442,  # SR
+    1304502617472503908,  # SSR
+    1304052056109350922,  # UR
+    1395405043431116871,  # CM
+]
+LEGACY_REVIEW_CHANNELS = {
+    "NORMAL": 1304100031388844114,
+    "SKIP": 1308385490931810434,
+    "CARD_MAKER": 1395404596230361209,
+}
+LEGACY_LOG_CHANNEL_ID = 1424688704584286248
+LEGACY_STAFF_ROLE_IDS = [1342461081133518949, 1304102244462886982]
+LEGACY_PING_ROLE_ID = 1303005123622207559
+
+register_query("guild_config_all", "SELECT * FROM guild_config")
+register_query("guild_config_get", "SELECT * FROM guild_config WHERE guild_id=$1")
+register_query("guild_config_seed", """
+    INSERT INTO guild_config (guild_id, forums, review_channels, staff_role_ids, lock_forum_ids,
+                              log_channel_id, staff_log_channel_id, ping_channel_id, ping_role_id)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+    ON CONFLICT (guild_id) DO NOTHING
+""")
+# Une clé de forums / review_channels (jsonb_set), une colonne sinon
+register_query("guild_config_set_forum", """
+    INSERT INTO guild_config (guild_id, forums) VALUES ($1, jsonb_build_object($2::text, $3::bigint))
+    ON CONFLICT (guild_id) DO UPDATE
+    SET forums = jsonb_set(guild_config.forums, ARRAY[$2::text], to_jsonb($3::bigint)), updated_at = NOW()
+""")
+register_query("guild_config_set_review", """
+    INSERT INTO guild_config (guild_id, review_channels) VALUES ($1, jsonb_build_object($2::text, $3::bigint))
+    ON CONFLICT (guild_id) DO UPDATE
+    SET review_channels = jsonb_set(guild_config.review_channels, ARRAY[$2::text], to_jsonb($3::bigint)),
+        updated_at = NOW()
+""")
+# Colonnes à un ID, puis colonnes liste (BIGINT[])
+GUILD_CONFIG_COLUMNS = ("log_channel_id", "staff_log_channel_id", "ping_channel_id", "ping_role_id")
+GUILD_CONFIG_LIST_COLUMNS = ("staff_role_ids", "lock_forum_ids")
+for _column in GUILD_CONFIG_COLUMNS + GUILD_CONFIG_LIST_COLUMNS:
+    register_query(f"guild_config_set_{_column}", f"""
+        INSERT INTO guild_config (guild_id, {_column}) VALUES ($1, $2)
+        ON CONFLICT (guild_id) DO UPDATE SET {_column} = EXCLUDED.{_column}, updated_at = NOW()
+    """)
+
+
+class GuildRoutes(NamedTuple):
+    """Routage d'une guild. Immuable : remplacé en entier au rechargement."""
+    guild_id: int
+    forums: Mapping[str, int]  # rareté ou CARD_MAKER -> forum
+    review_channels: Mapping[str, int]  # queue -> channel de review
+    staff_role_ids: FrozenSet[int]
+    log_channel_id: Optional[int]  # posts, cartes ready, profils
+    staff_log_channel_id: Optional[int]  # décisions de review, résumé /auction-lock
+    ping_channel_id: Optional[int]
+    ping_role_id: Optional[int]
+    lock_forum_ids: FrozenSet[int]  # forums d'enchères (sweep /auction-lock)
+
+    def forum_for(self, rarity: Optional[str], queue_type: Optional[str]) -> Optional[int]:
+        if queue_type == "CARD_MAKER":
+            return self.forums.get("CARD_MAKER")
+        return self.forums.get((rarity or "COMMON").upper()) or self.forums.get("COMMON")
+
+    def review_channel_for(self, queue_type: Optional[str]) -> Optional[int]:
+        return self.review_channels.get(queue_type)
+
+    def is_staff(self, role_ids) -> bool:
+        return not self.staff_role_ids.isdisjoint(role_ids)
+
+
+def routes_from_row(row) -> GuildRoutes:
+    forums = {k: int(v) for k, v in (row["forums"] or {}).items() if v}
+    return GuildRoutes(
+        guild_id=row["guild_id"],
+        forums=MappingProxyType(forums),
+        review_channels=MappingProxyType({k: int(v) for k, v in (row["review_channels"] or {}).items() if v}),
+        staff_role_ids=frozenset(row["staff_role_ids"] or ()),
+        log_channel_id=row["log_channel_id"],
+        staff_log_channel_id=row["staff_log_channel_id"] or row["log_channel_id"],
+        ping_channel_id=row["ping_channel_id"],
+        ping_role_id=row["ping_role_id"],
+        lock_forum_ids=frozenset(row["lock_forum_ids"] or forums.values()),
+    )
+
+
+def empty_routes(guild_id: Optional[int]) -> GuildRoutes:
+    return GuildRoutes(guild_id, MappingProxyType({}), MappingProxyType({}), frozenset(),
+                       None, None, None, None, frozenset())
+
+
+def _env_id(name: str, default: Optional[int] = None) -> Optional[int]:
+    raw = os.getenv(name)
+    return int(raw) if raw else default
+
+
+def legacy_config() -> tuple:
+    """Ligne initiale de la guild principale, chaque valeur prise à la source
+    qu'utilisait son appelant (le routage ne change pas au premier boot) :
+     - forums de post (scheduler) : FORUM_*_ID
+     - logs de post, de carte ready, /profile : LOG_CHANNEL_ID
+     - ping du batch : PING_CHANNEL_ID, rôle codé en dur
+     - review (staff_review), logs staff et sweep /auction-lock, rôles staff :
+       IDs codés en dur (QUEUE_*_ID n'était pas utilisé)"""
+    forums = {r: _env_id(f"FORUM_{r}_ID") for r in RARITIES}
+    forums["CARD_MAKER"] = _env_id("FORUM_CM_ID")
+    return (
+        {k: v for k, v in forums.items() if v},
+        dict(LEGACY_REVIEW_CHANNELS),
+        LEGACY_STAFF_ROLE_IDS,
+        LEGACY_AUCTION_FORUMS,
+        _env_id("LOG_CHANNEL_ID", LEGACY_LOG_CHANNEL_ID),
+        LEGACY_LOG_CHANNEL_ID,
+        _env_id("PING_CHANNEL_ID"),
+        LEGACY_PING_ROLE_ID,
+    )
+
+
+class GuildConfigRegistry:
+    def __init__(self, bot):
+        self.bot = bot
+        self.table: Mapping[int, GuildRoutes] = MappingProxyType({})
+        self.reloads = 0
+        self._lock = asyncio.Lock()  # rechargements appliqués dans l'ordre
+        self._task: Optional[asyncio.Task] = None
+
+    def routes(self, guild_id: Optional[int]) -> GuildRoutes:
+        """Routage d'une guild (vide si elle n'est pas configurée)."""
+        return self.table.get(guild_id) or empty_routes(guild_id)
+
+    @property
+    def primary(self) -> GuildRoutes:
+        """Guild principale (GUILD_ID) : batch quotidien, logs globaux."""
+        return self.routes(self.bot.guild_id)
+
+    async def start(self):
+        await db.execute(self.bot.pg, "guild_config_seed", self.bot.guild_id, *legacy_config())
+        await self.reload()
+        if not self._task:
+            self._task = asyncio.create_task(self._watch())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def reload(self, guild_id: Optional[int] = None):
+        """Recharge une guild (ou toutes) et remplace la table d'un bloc."""
+        async with self._lock:
+            if guild_id is None:
+                rows = await db.fetch(self.bot.pg, "guild_config_all")
+                table = {r["guild_id"]: routes_from_row(r) for r in rows}
+            else:
+                row = await db.fetchrow(self.bot.pg, "guild_config_get", guild_id)
+                table = dict(self.table)
+                if row:
+                    table[guild_id] = routes_from_row(row)
+                else:
+                    table.pop(guild_id, None)
+            self.table = MappingProxyType(table)
+            self.reloads += 1
+
+    def _notified(self, conn, pid, channel, payload):
+        asyncio.create_task(self._reload_logged(int(payload)))
+
+    async def _reload_logged(self, guild_id: Optional[int] = None):
+        try:
+            await self.reload(guild_id)
+            if guild_id is not None:
+                logging.info(f"Guild config reloaded for {guild_id}")
+        except Exception as e:
+            logging.warning(f"Guild config reload failed: {e}")
+
+    async def _watch(self):
+        # Connexion dédiée au LISTEN, gardée hors du pool tant qu'elle vit
+        while True:
+            try:
+                async with self.bot.pg.acquire() as conn:
+                    await conn.add_listener(CONFIG_CHANNEL, self._notified)
+                    try:
+                        await self._reload_logged()  # changements manqués sans écoute
+                        while not conn.is_closed():
+                            await asyncio.sleep(CONFIG_RELOAD_INTERVAL)
+                            await self._reload_logged()
+                    finally:
+                        if not conn.is_closed():
+                            await conn.remove_listener(CONFIG_CHANNEL, self._notified)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"Guild config listener failed: {e}")
+            await asyncio.sleep(5)
@@ -0,0 +1,83 @@
+import re
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+from . import db
+from .guild_config import GUILD_CONFIG_COLUMNS, GUILD_CONFIG_LIST_COLUMNS, QUEUES, RARITIES, GuildRoutes
+
+# Réglages modifiables par /guild-config-set : "forum:<RARETÉ>", "review:<QUEUE>",
+# une colonne de guild_config (un ID) ou une colonne liste (plusieurs IDs)
+SETTINGS = (
+    [f"forum:{r}" for r in (*RARITIES, "CARD_MAKER")]
+    + [f"review:{q}" for q in QUEUES]
+    + list(GUILD_CONFIG_COLUMNS)
+    + list(GUILD_CONFIG_LIST_COLUMNS)
+)
+
+SNOWFLAKE_RE = re.compile(r"\d{15,21}")
+
+
+def describe_routes(routes: GuildRoutes) -> str:
+    def mention(channel_id):
+        return f"<#{channel_id}>" if channel_id else "—"
+
+    lines = [f"⚙️ Config of guild `{routes.guild_id}`", "**Forums**"]
+    lines += [f"  {key}: {mention(routes.forums.get(key))}" for key in (*RARITIES, "CARD_MAKER")]
+    lines.append("**Review channels**")
+    lines += [f"  {q}: {mention(routes.review_channels.get(q))}" for q in QUEUES]
+    lines.append("**Lock sweep forums**: " + (" ".join(mention(f) for f in sorted(routes.lock_forum_ids)) or "—"))
+    lines.append(f"**Log**: {mention(routes.log_channel_id)}")
+    lines.append(f"**Staff log**: {mention(routes.staff_log_channel_id)}")
+    lines.append(f"**Ping**: {mention(routes.ping_channel_id)} "
+                 f"({f'<@&{routes.ping_role_id}>' if routes.ping_role_id else 'no role'})")
+    lines.append("**Staff roles**: " + (" ".join(f"<@&{r}>" for r in sorted(routes.staff_role_ids)) or "—"))
+    return "\n".join(lines)
+
+
+class GuildSettings(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    # Réservé aux administrateurs : une guild neuve n'a pas encore de rôle staff
+    @app_commands.command(name="guild-config", description="Show this guild's auction routing (admin only)")
+    @app_commands.default_permissions(administrator=True)
+    @app_commands.checks.has_permissions(administrator=True)
+    async def guild_config_show(self, interaction: discord.Interaction):
+        routes = self.bot.guild_config.routes(interaction.guild_id)
+        await interaction.response.send_message(
+            describe_routes(routes), ephemeral=True, allowed_mentions=discord.AllowedMentions.none()
+        )
+
+    @app_commands.command(name="guild-config-set", description="Change a routing setting of this guild (admin only)")
+    @app_commands.describe(setting="Setting to change", value="Channel / role ID or mention (lists: several)")
+    @app_commands.choices(setting=[app_commands.Choice(name=s, value=s) for s in SETTINGS])
+    @app_commands.default_permissions(administrator=True)
+    @app_commands.checks.has_permissions(administrator=True)
+    async def guild_config_set(self, interaction: discord.Interaction, setting: str, value: str):
+        ids = [int(i) for i in SNOWFLAKE_RE.findall(value)]
+        if not ids or (setting not in GUILD_CONFIG_LIST_COLUMNS and len(ids) != 1):
+            return await interaction.response.send_message(
+                "❌ Expected one channel / role ID or mention (several for list settings).", ephemeral=True
+            )
+        await interaction.response.defer(ephemeral=True)
+        pool, guild_id = self.bot.pg, interaction.guild_id
+        kind, _, key = setting.partition(":")
+        if kind == "forum":
+            await db.execute(pool, "guild_config_set_forum", guild_id, key, ids[0])
+        elif kind == "review":
+            await db.execute(pool, "guild_config_set_review", guild_id, key, ids[0])
+        elif setting in GUILD_CONFIG_LIST_COLUMNS:
+            await db.execute(pool, f"guild_config_set_{setting}", guild_id, ids)
+        else:
+            await db.execute(pool, f"guild_config_set_{setting}", guild_id, ids[0])
+        # Les autres process rechargent sur NOTIFY ; ici tout de suite pour la réponse
+        await self.bot.guild_config.reload(guild_id)
+        await interaction.followup.send(
+            f"✅ `{setting}` updated.\n\n{describe_routes(self.bot.guild_config.routes(guild_id))}",
+            ephemeral=True, allowed_mentions=discord.AllowedMentions.none()
+        )
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(GuildSettings(bot))
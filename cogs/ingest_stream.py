@@ -0,0 +1,147 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+from collections import Counter
+from typing import Optional
+
+from discord.ext import commands
+from redis.exceptions import ResponseError
+
+from .auction_core import INGEST_STREAM, cache_card
+
+# Workers d'ingestion en mode stream (MAZOKU_INGEST_MODE=stream).
+# Le listener de AuctionCore fait seulement XADD sur INGEST_STREAM ; chaque
+# worker lit via le consumer group, parse, écrit mazoku:card:* puis XACK.
+# Les workers peuvent tourner dans le bot (cette extension) et/ou dans des
+# process séparés (ingest_worker.py) : le consumer group répartit les entrées.
+INGEST_GROUP = "mazoku-workers"
+READ_COUNT = 32
+READ_BLOCK_MS = 1000
+# Une entrée non ackée depuis ce délai (worker mort) est reprise par un autre
+CLAIM_IDLE_MS = 30_000
+
+log = logging.getLogger(__name__)
+
+
+def consumer_name(index: int) -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{index}"
+
+
+async def ensure_group(redis):
+    try:
+        await redis.xgroup_create(INGEST_STREAM, INGEST_GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+async def handle_entry(redis, entry_id: str, fields: dict, stats: Counter):
+    try:
+        data = json.loads(fields.get("embed") or "{}")
+        stats["parses"] += 1
+        if await cache_card(redis, data):
+            stats["writes"] += 1
+    except (ValueError, TypeError) as e:
+        # Entrée illisible : on l'ack quand même pour ne pas la rejouer sans fin
+        stats["failed"] += 1
+        log.warning("Dropping malformed ingest entry %s: %s", entry_id, e)
+    await redis.xack(INGEST_STREAM, INGEST_GROUP, entry_id)
+    stats["acked"] += 1
+
+
+async def reclaim(redis, name: str, stats: Counter):
+    # Reprise des entrées d'un worker tombé avant son XACK
+    start = "0-0"
+    while True:
+        start, claimed, *_ = await redis.xautoclaim(
+            INGEST_STREAM, INGEST_GROUP, name, CLAIM_IDLE_MS, start_id=start, count=READ_COUNT
+        )
+        for entry_id, fields in claimed:
+            if not fields:
+                # Entrée déjà coupée par MAXLEN : rien à parser
+                await redis.xack(INGEST_STREAM, INGEST_GROUP, entry_id)
+                continue
+            stats["reclaimed"] += 1
+            await handle_entry(redis, entry_id, fields, stats)
+        if start == "0-0":
+            return
+
+
+async def consume(redis, name: str, stats: Counter, stop: asyncio.Event):
+    loop = asyncio.get_running_loop()
+    next_claim = 0.0
+    while not stop.is_set():
+        try:
+            if loop.time() >= next_claim:
+                await reclaim(redis, name, stats)
+                next_claim = loop.time() + CLAIM_IDLE_MS / 2000
+
+            resp = await redis.xreadgroup(
+                INGEST_GROUP, name, {INGEST_STREAM: ">"}, count=READ_COUNT, block=READ_BLOCK_MS
+            )
+            for _stream, entries in resp or []:
+                for entry_id, fields in entries:
+                    await handle_entry(redis, entry_id, fields, stats)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            stats["errors"] += 1
+            log.exception("Ingest worker %s error: %s", name, e)
+            await asyncio.sleep(1)
+
+
+class IngestWorkers:
+    def __init__(self, redis, count: int):
+        self.redis = redis
+        self.count = count
+        self.stats = Counter()
+        self._stop = asyncio.Event()
+        self._tasks = []
+
+    async def start(self):
+        await ensure_group(self.redis)
+        self._tasks = [
+            asyncio.create_task(consume(self.redis, consumer_name(i), self.stats, self._stop))
+            for i in range(self.count)
+        ]
+        log.info("Started %d Mazoku ingest workers on %s", self.count, INGEST_STREAM)
+
+    async def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._tasks:
+            # Laisse finir le XREADGROUP en cours (BLOCK) avant d'annuler
+            _done, pending = await asyncio.wait(self._tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+        self._tasks = []
+
+
+class IngestStream(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.workers = IngestWorkers(bot.redis, bot.ingest_workers)
+
+    async def cog_load(self):
+        if self.bot.ingest_mode != "stream":
+            return
+        if self.bot.ingest_workers > 0:
+            await self.workers.start()
+        else:
+            await ensure_group(self.bot.redis)
+
+    async def cog_unload(self):
+        await self.workers.stop()
+
+    async def stream_info(self) -> Optional[dict]:
+        try:
+            length = await self.bot.redis.xlen(INGEST_STREAM)
+            pending = await self.bot.redis.xpending(INGEST_STREAM, INGEST_GROUP)
+        except ResponseError:
+            return None
+        return {"length": length, "pending": pending["pending"]}
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(IngestStream(bot))
@@ -0,0 +1,317 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from . import db
+from .db import register_query
+
+# Jobs durables pour les opérations staff longues (/batch-post, /auction-lock) :
+#  - la commande enregistre un job dans la table jobs et répond tout de suite
+#  - un worker le réclame (FOR UPDATE SKIP LOCKED) et exécute le handler du type
+#  - le handler sauvegarde un checkpoint JSONB au fil de l'eau : après un crash
+#    ou un redémarrage, le job est repris depuis ce checkpoint (les items déjà
+#    traités sont sautés) au lieu de tout recommencer
+#  - un job RUNNING sans battement depuis JOB_STALE_SECONDS est considéré
+#    orphelin (process tué) et réclamé à nouveau
+#  - avec plusieurs process, seul le leader (bot.leader, cogs/leader.py)
+#    réclame des jobs ; s'il perd le bail, le job en cours est remis en file
+#    et repris par le nouveau leader depuis son checkpoint
+# Module importé normalement (pas une extension) : le runner vit sur bot.jobs,
+# les cogs y enregistrent leurs handlers dans cog_load.
+JOB_WORKERS = 2
+JOB_POLL_INTERVAL = 5.0
+JOB_HEARTBEAT_INTERVAL = 10.0
+JOB_STALE_SECONDS = 60
+JOB_PROGRESS_INTERVAL = 2.0
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_BACKOFF = 30  # s, multiplié par le nombre de tentatives déjà faites
+JOB_WATCH_TIMEOUT = 15 * 60  # suivi d'un job exécuté par un autre process
+
+register_query("job_enqueue", """
+    INSERT INTO jobs (kind, payload, requested_by) VALUES ($1, $2, $3)
+    ON CONFLICT (kind) WHERE status IN ('QUEUED', 'RUNNING') DO NOTHING
+    RETURNING id
+""")
+register_query("job_active", "SELECT id FROM jobs WHERE kind=$1 AND status IN ('QUEUED', 'RUNNING')")
+# Un job orphelin (process tué pendant le handler : OOM, SIGKILL...) n'est
+# repris que s'il lui reste des tentatives, sinon il passe en FAILED : un job
+# qui tue son process n'est pas relancé indéfiniment.
+register_query("job_claim", """
+    WITH exhausted AS (
+        UPDATE jobs
+        SET status='FAILED', finished_at=NOW(),
+            error=COALESCE(error, 'process died during the job (no heartbeat)')
+        WHERE kind = ANY($1::text[])
+          AND status='RUNNING' AND heartbeat_at < NOW() - make_interval(secs => $2)
+          AND attempts >= $3
+    )
+    UPDATE jobs
+    SET status='RUNNING', attempts=attempts+1, started_at=COALESCE(started_at, NOW()),
+        heartbeat_at=NOW(), error=NULL, not_before=NULL
+    WHERE id = (
+        SELECT id FROM jobs
+        WHERE kind = ANY($1::text[])
+          AND ((status='QUEUED' AND (not_before IS NULL OR not_before <= NOW()))
+               OR (status='RUNNING' AND heartbeat_at < NOW() - make_interval(secs => $2)
+                   AND attempts < $3))
+        ORDER BY id
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, kind, payload, checkpoint, attempts, requested_by
+""")
+register_query("job_heartbeat", "UPDATE jobs SET heartbeat_at=NOW() WHERE id=$1")
+register_query("job_checkpoint", "UPDATE jobs SET checkpoint=$2, heartbeat_at=NOW() WHERE id=$1")
+register_query("job_progress", "UPDATE jobs SET progress=$2, heartbeat_at=NOW() WHERE id=$1")
+register_query("job_done", """
+    UPDATE jobs SET status='DONE', result=$2, progress=$3, finished_at=NOW() WHERE id=$1
+""")
+# Erreur : nouvelle tentative après attempts * JOB_RETRY_BACKOFF (une erreur
+# passagère, Postgres ou 5xx Discord, ne consomme pas toutes les tentatives d'un coup)
+register_query("job_error", """
+    UPDATE jobs
+    SET status = CASE WHEN attempts >= $3 THEN 'FAILED' ELSE 'QUEUED' END,
+        error=$2,
+        finished_at = CASE WHEN attempts >= $3 THEN NOW() END,
+        not_before = CASE WHEN attempts < $3 THEN NOW() + attempts * make_interval(secs => $4) END
+    WHERE id=$1
+    RETURNING status
+""")
+# Arrêt propre : le job repart au prochain boot sans compter une tentative
+register_query("job_release", """
+    UPDATE jobs SET status='QUEUED', attempts=GREATEST(attempts-1, 0) WHERE id=$1 AND status='RUNNING'
+""")
+register_query("job_get", "SELECT * FROM jobs WHERE id=$1")
+register_query("jobs_recent", "SELECT * FROM jobs ORDER BY id DESC LIMIT $1")
+
+
+class JobContext:
+    """Passé au handler : payload, checkpoint (à sauvegarder) et progression."""
+
+    def __init__(self, runner: "JobRunner", row):
+        self.runner = runner
+        self.id = row["id"]
+        self.kind = row["kind"]
+        self.payload = dict(row["payload"] or {})
+        self.checkpoint = dict(row["checkpoint"] or {})
+        self.attempts = row["attempts"]
+        self.requested_by = row["requested_by"]
+        self.progress_values: dict = {}
+        self._last_progress = 0.0
+
+    @property
+    def resumed(self) -> bool:
+        return bool(self.checkpoint)
+
+    async def save(self, **changes):
+        """Met à jour le checkpoint et l'écrit en base (point de reprise)."""
+        self.checkpoint.update(changes)
+        await db.execute(self.runner.bot.pg, "job_checkpoint", self.id, self.checkpoint)
+
+    async def progress(self, force: bool = False, **values):
+        """Progression visible par /job-status et les watchers (écriture limitée)."""
+        self.progress_values.update(values)
+        now = time.monotonic()
+        if not force and now - self._last_progress < JOB_PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        await db.execute(self.runner.bot.pg, "job_progress", self.id, self.progress_values)
+        await self.runner.notify(self.id, "RUNNING", self.progress_values)
+
+
+JobHandler = Callable[[JobContext], Awaitable[Optional[dict]]]
+JobWatcher = Callable[[str, dict], Awaitable]
+
+
+class JobRunner:
+    def __init__(self, bot, workers: int = JOB_WORKERS):
+        self.bot = bot
+        self.workers = workers
+        self.handlers: Dict[str, JobHandler] = {}
+        self._watchers: Dict[int, List[JobWatcher]] = {}
+        self._pollers: Dict[int, asyncio.Task] = {}
+        self._running: Set[int] = set()  # jobs exécutés par ce process
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+
+    def register(self, kind: str, handler: JobHandler):
+        self.handlers[kind] = handler
+        self._wakeup.set()
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self):
+        tasks, self._tasks = self._tasks + list(self._pollers.values()), []
+        self._pollers.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def enqueue(self, kind: str, payload: Optional[dict] = None,
+                      requested_by: Optional[int] = None) -> Tuple[int, bool]:
+        """Crée un job. Retourne (id, créé) ; si un job du même type est déjà
+        actif, retourne son id avec créé=False."""
+        job_id = await db.fetchval(self.bot.pg, "job_enqueue", kind, payload or {}, requested_by)
+        if job_id is not None:
+            self._wakeup.set()
+            return job_id, True
+        job_id = await db.fetchval(self.bot.pg, "job_active", kind)
+        if job_id is None:
+            # Terminé entre les deux requêtes
+            return await self.enqueue(kind, payload, requested_by)
+        return job_id, False
+
+    def watch(self, job_id: int, watcher: JobWatcher):
+        """watcher(status, valeurs) à chaque progression et à la fin (DONE/FAILED).
+        En mémoire seulement : perdu au redémarrage, le job continue quand même.
+        Le job peut tourner sur un autre process (leader) : on suit alors la
+        table jobs tant qu'il n'est pas exécuté ici."""
+        self._watchers.setdefault(job_id, []).append(watcher)
+        if job_id not in self._pollers:
+            self._pollers[job_id] = asyncio.create_task(self._poll(job_id))
+
+    async def notify(self, job_id: int, status: str, values: dict):
+        for watcher in list(self._watchers.get(job_id, ())):
+            try:
+                await watcher(status, values)
+            except Exception as e:
+                logging.warning(f"Job #{job_id} watcher failed: {e}")
+        if status in ("DONE", "FAILED"):
+            self._watchers.pop(job_id, None)
+
+    async def _poll(self, job_id: int):
+        deadline = time.monotonic() + JOB_WATCH_TIMEOUT
+        last = None
+        try:
+            while time.monotonic() < deadline:
+                await asyncio.sleep(JOB_PROGRESS_INTERVAL)
+                if job_id not in self._watchers:
+                    return  # terminé et notifié localement
+                if job_id in self._running:
+                    continue  # progression notifiée par le JobContext local
+                try:
+                    row = await db.fetchrow(self.bot.pg, "job_get", job_id)
+                except Exception as e:
+                    logging.warning(f"Job #{job_id} poll failed: {e}")
+                    continue
+                if row is None:
+                    return
+                state = (row["status"], row["progress"], row["result"])
+                if state == last or row["status"] == "QUEUED":
+                    continue
+                last = state
+                if row["status"] == "DONE":
+                    await self.notify(job_id, "DONE", row["result"] or {})
+                elif row["status"] == "FAILED":
+                    await self.notify(job_id, "FAILED", {**(row["progress"] or {}), "error": row["error"]})
+                elif row["progress"]:
+                    await self.notify(job_id, "RUNNING", row["progress"])
+        finally:
+            if self._pollers.get(job_id) is asyncio.current_task():
+                del self._pollers[job_id]
+            if time.monotonic() >= deadline:
+                self._watchers.pop(job_id, None)
+
+    async def _worker(self):
+        # Les handlers ont besoin du cache Discord (guild, forums)
+        await self.bot.wait_until_ready()
+        leader = getattr(self.bot, "leader", None)
+        while True:
+            if leader:
+                await leader.wait_leader()
+            # Remis à zéro avant la requête : un enqueue pendant le claim n'est pas perdu
+            self._wakeup.clear()
+            row = None
+            if self.handlers:
+                try:
+                    row = await db.fetchrow(
+                        self.bot.pg, "job_claim", list(self.handlers), JOB_STALE_SECONDS, JOB_MAX_ATTEMPTS
+                    )
+                except Exception as e:
+                    logging.warning(f"Job claim failed: {e}")
+            if row is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            ctx = JobContext(self, row)
+            if leader:
+                await self._run_as_leader(leader, ctx)
+            else:
+                await self._run(ctx)
+
+    async def _run_as_leader(self, leader, ctx: JobContext):
+        """Exécute le job tant que ce process garde le bail : sinon il est
+        annulé (remis en file) pour que le nouveau leader le reprenne."""
+        run = asyncio.create_task(self._run(ctx))
+        lost = asyncio.create_task(leader.wait_follower())
+        try:
+            await asyncio.wait({run, lost}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            lost.cancel()
+            if not run.done():
+                if not leader.is_leader:
+                    logging.warning(f"Leader lease lost, releasing job #{ctx.id} {ctx.kind}")
+                run.cancel()
+                await asyncio.gather(run, return_exceptions=True)
+
+    async def _run(self, ctx: JobContext):
+        pool = self.bot.pg
+        verb = "Resuming" if ctx.resumed else "Starting"
+        logging.info(f"{verb} job #{ctx.id} {ctx.kind} (attempt {ctx.attempts})")
+        heartbeat = asyncio.create_task(self._heartbeat(ctx.id))
+        started = time.perf_counter()
+        self._running.add(ctx.id)
+        try:
+            result = await self.handlers[ctx.kind](ctx) or {}
+        except asyncio.CancelledError:
+            # Arrêt du bot : le checkpoint est en base, reprise au prochain boot
+            await db.execute(pool, "job_release", ctx.id)
+            raise
+        except Exception as e:
+            logging.exception(f"Job #{ctx.id} {ctx.kind} failed")
+            error = f"{type(e).__name__}: {e}"
+            status = await db.fetchval(
+                pool, "job_error", ctx.id, error[:1000], JOB_MAX_ATTEMPTS, JOB_RETRY_BACKOFF
+            )
+            if status == "FAILED":
+                await self.notify(ctx.id, status, {**ctx.progress_values, "error": error})
+            else:
+                # Pas de réveil : repris par le poll une fois not_before passé
+                logging.warning(f"Job #{ctx.id} {ctx.kind} will retry in {ctx.attempts * JOB_RETRY_BACKOFF}s")
+            return
+        finally:
+            heartbeat.cancel()
+            self._running.discard(ctx.id)
+
+        await db.execute(pool, "job_done", ctx.id, result, ctx.progress_values)
+        logging.info(f"Job #{ctx.id} {ctx.kind} done in {time.perf_counter() - started:.1f}s")
+        await self.notify(ctx.id, "DONE", result)
+
+    async def _heartbeat(self, job_id: int):
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                await db.execute(self.bot.pg, "job_heartbeat", job_id)
+            except Exception as e:
+                logging.warning(f"Job #{job_id} heartbeat failed: {e}")
+
+
+def describe_job(row) -> str:
+    """Ligne de statut pour /job-status."""
+    icon = {"QUEUED": "⏳", "RUNNING": "⚙️", "DONE": "✅", "FAILED": "❌"}.get(row["status"], "•")
+    line = f"{icon} Job #{row['id']} `{row['kind']}` {row['status']}"
+    if row["attempts"] > 1:
+        line += f" (attempt {row['attempts']})"
+    values = row["result"] if row["status"] == "DONE" and row["result"] else row["progress"]
+    if values:
+        line += " — " + ", ".join(f"{k}: {v}" for k, v in values.items())
+    if row["status"] == "QUEUED" and row["not_before"]:
+        line += f" — retry <t:{int(row['not_before'].timestamp())}:R>"
+    if row["error"]:
+        line += f"\n    last error: {row['error'][:200]}"
+    return line
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Callable, List, Optional
+
+# Élection de leader par bail Redis, pour faire tourner plusieurs process du
+# bot (shards via SHARD_COUNT / SHARD_IDS) avec le travail singleton sur un
+# seul : planning du batch, jobs (/batch-post, /auction-lock), recalcul des
+# compteurs. L'ingestion (consumer group Redis) et les interactions restent
+# réparties sur tous les process.
+#  - acquisition : SET bot:leader <node> NX PX LEASE_TTL
+#  - renouvellement toutes les RENEW_INTERVAL s (PEXPIRE si on est toujours
+#    le détenteur, script Lua), abandon si le bail n'a pas pu être renouvelé
+#    avant son expiration : chaque appel Redis est borné par le temps de bail
+#    restant, et un timer (call_at) rend la main à l'échéance même si un
+#    appel reste bloqué
+#  - libération à l'arrêt : le suivant prend la main sans attendre le TTL
+# Module importé normalement (pas une extension) : le bail vit sur bot.leader.
+LEADER_KEY = "bot:leader"
+LEASE_TTL = 15.0
+RENEW_INTERVAL = 5.0
+
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def node_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class LeaderLease:
+    def __init__(self, redis=None, key: str = LEADER_KEY, ttl: float = LEASE_TTL,
+                 renew_interval: float = RENEW_INTERVAL, node: Optional[str] = None,
+                 eligible: Optional[Callable[[], bool]] = None):
+        self.redis = redis  # posé au setup_hook si None à la construction
+        self.key = key
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.node = node or node_name()
+        # Candidat seulement si eligible() (ex. le process voit la guild)
+        self.eligible = eligible or (lambda: True)
+        self.elections = 0
+        self._leader = asyncio.Event()
+        self._follower = asyncio.Event()
+        self._follower.set()
+        self._listeners: List[Callable[[bool], None]] = []
+        self._valid_until = 0.0
+        self._expiry: Optional[asyncio.TimerHandle] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_leader(self) -> bool:
+        # Bail expiré sans renouvellement : plus leader, même avant le prochain tour
+        return self._leader.is_set() and time.monotonic() < self._valid_until
+
+    async def wait_leader(self):
+        await self._leader.wait()
+
+    async def wait_follower(self):
+        """Retourne quand ce process perd (ou n'a pas) le bail."""
+        await self._follower.wait()
+
+    def on_change(self, listener: Callable[[bool], None]):
+        self._listeners.append(listener)
+
+    def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._leader.is_set():
+            try:
+                await asyncio.wait_for(
+                    self.redis.eval(RELEASE_SCRIPT, 1, self.key, self.node), self.renew_interval
+                )
+            except Exception as e:
+                logging.warning(f"Leader lease release failed: {e}")
+            self._set_leader(False)
+
+    async def holder(self) -> Optional[str]:
+        return await self.redis.get(self.key)
+
+    async def _run(self):
+        ttl_ms = int(self.ttl * 1000)
+        while True:
+            started = time.monotonic()
+            try:
+                if self._leader.is_set():
+                    # Borné par le bail restant : au-delà, un autre process a pu le prendre
+                    renewed = await asyncio.wait_for(
+                        self.redis.eval(RENEW_SCRIPT, 1, self.key, self.node, ttl_ms),
+                        max(self._valid_until - started, 0.001)
+                    )
+                    if renewed:
+                        self._extend(started + self.ttl)
+                    else:
+                        logging.warning(f"Leader lease lost by {self.node}")
+                        self._set_leader(False)
+                elif self.eligible() and await asyncio.wait_for(
+                    self.redis.set(self.key, self.node, nx=True, px=ttl_ms), self.renew_interval
+                ):
+                    self._extend(started + self.ttl)
+                    self.elections += 1
+                    self._set_leader(True)
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                logging.warning(f"Leader lease check timed out on {self.node}")
+            except Exception as e:
+                logging.warning(f"Leader lease check failed: {e}")
+            await asyncio.sleep(self.renew_interval)
+
+    def _extend(self, valid_until: float):
+        self._valid_until = valid_until
+        if self._expiry:
+            self._expiry.cancel()
+        # time.monotonic() est l'horloge de la loop asyncio par défaut
+        self._expiry = asyncio.get_running_loop().call_at(valid_until, self._expired)
+
+    def _expired(self):
+        self._expiry = None
+        if self._leader.is_set():
+            # Pas renouvelé à temps : un autre process a pu prendre le bail
+            logging.warning(f"Leader lease expired on {self.node}")
+            self._set_leader(False)
+
+    def _set_leader(self, leader: bool):
+        if leader == self._leader.is_set():
+            return
+        if leader:
+            self._follower.clear()
+            self._leader.set()
+            logging.info(f"Leader lease acquired by {self.node}")
+        else:
+            if self._expiry:
+                self._expiry.cancel()
+                self._expiry = None
+            self._leader.clear()
+            self._follower.set()
+        for listener in self._listeners:
+            listener(leader)
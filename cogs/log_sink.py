@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+import discord
+from discord.ext import commands
+
+from .outbound import PRIORITY_LOG
+
+# Sink partagé pour les embeds de log : au lieu d'un message par événement,
+# on regroupe jusqu'à 10 embeds (limite Discord) par message et par channel.
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_CHARS_PER_MESSAGE = 6000  # limite Discord sur le total des embeds d'un message
+FLUSH_INTERVAL = 2.0
+MAX_QUEUE = 1000
+
+log = logging.getLogger(__name__)
+
+
+class LogSink:
+    def __init__(self, bot: commands.Bot, flush_interval: float = FLUSH_INTERVAL, max_queue: int = MAX_QUEUE):
+        self.bot = bot
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)  # (channel_id, embed), None = arrêt
+        self._task: Optional[asyncio.Task] = None
+        self.messages_sent = 0
+        self.embeds_sent = 0
+
+    def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    async def send(self, channel_id: int, embed: discord.Embed):
+        if not self._task or self._task.done():
+            # Sink arrêté (shutdown) : envoi direct
+            channel = self.bot.get_channel(channel_id)
+            if channel:
+                await self.bot.outbound.send(PRIORITY_LOG, f"channel:{channel_id}", lambda: channel.send(embed=embed))
+            return
+        # Backpressure : attend si la file est pleine
+        await self._queue.put((channel_id, embed))
+
+    async def close(self):
+        if not self._task:
+            return
+        if not self._task.done():
+            await self._queue.put(None)
+            await self._task
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            buffers: Dict[int, List[discord.Embed]] = {}
+            await self._add(buffers, *item)
+            stop = False
+            deadline = loop.time() + self.flush_interval
+            while not stop:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                await self._add(buffers, *item)
+            for channel_id, embeds in buffers.items():
+                await self._flush(channel_id, embeds)
+            if stop:
+                return
+
+    async def _add(self, buffers: Dict[int, List[discord.Embed]], channel_id: int, embed: discord.Embed):
+        batch = buffers.setdefault(channel_id, [])
+        size = sum(len(e) for e in batch)
+        if batch and (len(batch) >= MAX_EMBEDS_PER_MESSAGE or size + len(embed) > MAX_CHARS_PER_MESSAGE):
+            await self._flush(channel_id, batch)
+            buffers[channel_id] = batch = []
+        batch.append(embed)
+
+    async def _flush(self, channel_id: int, embeds: List[discord.Embed]):
+        if not embeds:
+            return
+        channel = self.bot.get_channel(channel_id)
+        if not channel:
+            return
+        try:
+            # Priorité la plus basse : passe après interactions, DMs et posts forum
+            await self.bot.outbound.send(PRIORITY_LOG, f"channel:{channel_id}", lambda: channel.send(embeds=embeds))
+            self.messages_sent += 1
+            self.embeds_sent += len(embeds)
+        except Exception as e:
+            # Jamais propagé : une erreur ici tuerait _run et bloquerait send() (file pleine)
+            log.warning("Log sink failed to send %d embeds to %s: %r", len(embeds), channel_id, e)
@@ -0,0 +1,255 @@
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+import aiohttp
+import discord
+import redis.asyncio as aioredis
+from discord import app_commands
+
+# Métriques au format Prometheus, servies en local par le bot (GET /metrics sur
+# METRICS_HOST:METRICS_PORT, extension cogs.metrics_server). Pas de dépendance
+# prometheus_client : un petit registre suffit (histogrammes, compteurs, gauges).
+# Module importé normalement (pas une extension) : load_extension ré-exécute
+# le module et dupliquerait le registre.
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REGISTRY = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labels)
+        self._series: Dict[tuple, object] = {}
+        REGISTRY.append(self)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        for values, value in sorted(self._series.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, values)} {value}")
+        return lines
+
+
+class CounterMetric(_Metric):
+    kind = "counter"
+
+    def inc(self, *labelvalues, amount: float = 1):
+        self._series[labelvalues] = self._series.get(labelvalues, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labelvalues):
+        self._series[labelvalues] = value
+
+    def clear(self):
+        self._series.clear()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labelvalues):
+        series = self._series.get(labelvalues)
+        if series is None:
+            # [compteurs par bucket..., somme, total]
+            series = self._series[labelvalues] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    @contextmanager
+    def time(self, *labelvalues):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labelvalues)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        for values, series in sorted(self._series.items()):
+            for bound, count in zip(self.buckets, series):
+                le = _labels(self.labelnames, values, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{le} {count}")
+            le = _labels(self.labelnames, values, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, values)} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, values)} {series[-1]}")
+        return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Métriques du bot ---
+HANDLER_SECONDS = Histogram(
+    "auction_bot_handler_seconds", "Listener and app command duration.", ("handler", "status")
+)
+DB_QUERY_SECONDS = Histogram(
+    "auction_bot_db_query_seconds", "Registered Postgres query latency (cogs/db.py).", ("query",)
+)
+REDIS_COMMAND_SECONDS = Histogram(
+    "auction_bot_redis_command_seconds", "Redis command latency.", ("command",)
+)
+DISCORD_HTTP_SECONDS = Histogram(
+    "auction_bot_discord_http_seconds", "Discord API call duration, rate limit waits and retries included.",
+    ("route", "status")
+)
+DISCORD_BUCKET_WAIT_SECONDS = Histogram(
+    "auction_bot_discord_bucket_wait_seconds", "Time spent waiting on the rate limit bucket before sending.",
+    ("route",)
+)
+DISCORD_HTTP_RESPONSES = CounterMetric(
+    "auction_bot_discord_http_responses_total", "Discord API responses (each attempt).", ("route", "code")
+)
+DISCORD_HTTP_429 = CounterMetric(
+    "auction_bot_discord_http_429_total", "Discord API 429 responses.", ("route",)
+)
+PENDING_REVIEWS = Gauge("auction_bot_pending_reviews", "Auctions waiting for staff review.")
+READY_BACKLOG = Gauge("auction_bot_ready_backlog", "READY auctions waiting to be batched.", ("queue",))
+OUTBOUND_QUEUE_DEPTH = Gauge(
+    "auction_bot_outbound_queue_depth", "Discord sends waiting in the outbound scheduler.", ("priority",)
+)
+OUTBOUND_WAIT_SECONDS = Histogram(
+    "auction_bot_outbound_wait_seconds", "Time a Discord send waited in the outbound scheduler.", ("priority",)
+)
+DB_POOL = Gauge("auction_bot_db_pool_connections", "Postgres pool connections.", ("state",))
+AUCTION_CACHE_REQUESTS = CounterMetric(
+    "auction_bot_auction_cache_requests_total", "Auction row cache lookups (local_hit, redis_hit, miss).", ("result",)
+)
+RENDER_CACHE_REQUESTS = CounterMetric(
+    "auction_bot_render_cache_requests_total", "Pre-rendered embed payload lookups (hit, miss).", ("result",)
+)
+
+
+def timed(handler: str):
+    """Décorateur : durée d'une coroutine dans HANDLER_SECONDS."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            status = "ok"
+            try:
+                return await func(*args, **kwargs)
+            except BaseException:
+                status = "error"
+                raise
+            finally:
+                HANDLER_SECONDS.observe(time.perf_counter() - started, handler, status)
+        return wrapper
+    return decorator
+
+
+# --- Redis ---
+class InstrumentedRedis(aioredis.Redis):
+    """Client Redis qui mesure chaque commande (hors pipelines)."""
+
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            REDIS_COMMAND_SECONDS.observe(time.perf_counter() - started, str(args[0]).upper())
+
+
+# --- Discord HTTP ---
+# Appel en cours (route, début) : posé par instrument_http, lu par les
+# callbacks aiohttp qui tournent dans la même tâche.
+_current_call: ContextVar[Optional[dict]] = ContextVar("discord_http_call", default=None)
+
+
+def http_trace_config() -> aiohttp.TraceConfig:
+    """À passer en http_trace au Client (la session aiohttp est créée au login)."""
+    trace = aiohttp.TraceConfig()
+
+    async def on_request_start(session, ctx, params):
+        call = _current_call.get()
+        if call and not call["sent"]:
+            call["sent"] = True
+            DISCORD_BUCKET_WAIT_SECONDS.observe(time.perf_counter() - call["started"], call["route"])
+
+    async def on_request_end(session, ctx, params):
+        call = _current_call.get()
+        if not call:
+            return
+        DISCORD_HTTP_RESPONSES.inc(call["route"], str(params.response.status))
+        if params.response.status == 429:
+            DISCORD_HTTP_429.inc(call["route"])
+
+    trace.on_request_start.append(on_request_start)
+    trace.on_request_end.append(on_request_end)
+    return trace
+
+
+def instrument_http(http):
+    """Enveloppe HTTPClient.request. Retourne la méthode d'origine."""
+    original = http.request
+
+    async def request(route, **kwargs):
+        call = {"route": f"{route.method} {route.path}", "started": time.perf_counter(), "sent": False}
+        token = _current_call.set(call)
+        status = "ok"
+        try:
+            return await original(route, **kwargs)
+        except discord.HTTPException as e:
+            status = str(e.status)
+            raise
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            _current_call.reset(token)
+            DISCORD_HTTP_SECONDS.observe(time.perf_counter() - call["started"], call["route"], status)
+
+    http.request = request
+    return original
+
+
+# --- App commands ---
+class InstrumentedTree(app_commands.CommandTree):
+    """CommandTree qui chronomètre chaque app command (fin dans Metrics)."""
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        interaction.extras["metrics_started"] = time.perf_counter()
+        return True
+
+    async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        observe_command(interaction, "error")
+        await super().on_error(interaction, error)
+
+
+def observe_command(interaction: discord.Interaction, status: str):
+    started = interaction.extras.pop("metrics_started", None)
+    if started is None or not interaction.command:
+        return
+    HANDLER_SECONDS.observe(time.perf_counter() - started, interaction.command.qualified_name, status)
@@ -0,0 +1,73 @@
+import logging
+from typing import Optional
+
+import discord
+from aiohttp import web
+from discord.ext import commands
+
+from .metrics import DB_POOL, PENDING_REVIEWS, READY_BACKLOG, instrument_http, observe_command, render
+
+# Sert le registre de cogs/metrics.py en GET /metrics (aiohttp vient avec discord.py)
+
+log = logging.getLogger(__name__)
+
+
+class Metrics(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self._runner: Optional[web.AppRunner] = None
+        self._original_request = None
+
+    async def cog_load(self):
+        self._original_request = instrument_http(self.bot.http)
+        if not self.bot.metrics_port:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.bot.metrics_host, self.bot.metrics_port).start()
+        except OSError as e:
+            # Ex. second process sur le même hôte avec le même METRICS_PORT
+            log.warning("Metrics disabled: cannot listen on %s:%d (%s)",
+                        self.bot.metrics_host, self.bot.metrics_port, e)
+            await self._runner.cleanup()
+            self._runner = None
+            return
+        log.info("Metrics served on http://%s:%d/metrics", self.bot.metrics_host, self.bot.metrics_port)
+
+    async def cog_unload(self):
+        if self._original_request:
+            self.bot.http.request = self._original_request
+        if self._runner:
+            await self._runner.cleanup()
+
+    @commands.Cog.listener()
+    async def on_app_command_completion(self, interaction: discord.Interaction, command):
+        observe_command(interaction, "ok")
+
+    async def collect(self):
+        # Gauges lues au moment du scrape (compteurs auction_counts, pool)
+        from .auction_core import get_backlog_counts
+        from .db import pool_stats
+
+        pending = await get_backlog_counts(self.bot.pg, "PENDING")
+        PENDING_REVIEWS.set(sum(pending.values()))
+        READY_BACKLOG.clear()
+        for queue, n in (await get_backlog_counts(self.bot.pg, "READY")).items():
+            READY_BACKLOG.set(n, queue)
+        stats = pool_stats(self.bot.pg)
+        for state in ("size", "idle", "in_use", "max"):
+            DB_POOL.set(stats[state], state)
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        try:
+            await self.collect()
+        except Exception as e:
+            log.warning("Metrics collection failed: %s", e)
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Metrics(bot))
@@ -0,0 +1,389 @@
+import json
+import logging
+import time
+from typing import List, Tuple
+
+import asyncpg
+
+from . import db
+
+# Migrations versionnées, appliquées dans l'ordre au démarrage (init_db dans
+# setup_hook). Chaque script tourne dans sa propre transaction avec son
+# insertion dans schema_migrations ; un advisory lock empêche deux process de
+# migrer en même temps. Ne jamais modifier un script déjà déployé : en ajouter un.
+MIGRATIONS_LOCK_ID = 7_236_001
+
+MIGRATIONS: List[Tuple[int, str, str]] = [
+    (1, "initial_schema", """
+    CREATE TABLE IF NOT EXISTS auctions (
+        id SERIAL PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        series TEXT,
+        version TEXT,
+        batch_no INT,
+        owner_id BIGINT,
+        rarity TEXT,
+        queue_type TEXT,
+        currency TEXT,
+        rate TEXT,
+        status TEXT DEFAULT 'PENDING',
+        created_at TIMESTAMPTZ DEFAULT NOW(),
+        title TEXT,
+        image_url TEXT,
+        event TEXT,
+        special TEXT
+    );
+    CREATE TABLE IF NOT EXISTS batches (
+        id SERIAL PRIMARY KEY,
+        batch_date DATE UNIQUE NOT NULL,
+        locked_at TIMESTAMPTZ,
+        posted_at TIMESTAMPTZ
+    );
+    CREATE TABLE IF NOT EXISTS batch_items (
+        id SERIAL PRIMARY KEY,
+        batch_id INT REFERENCES batches(id) ON DELETE CASCADE,
+        auction_id INT REFERENCES auctions(id) ON DELETE CASCADE,
+        position INT
+    );
+    CREATE TABLE IF NOT EXISTS reviews (
+        id SERIAL PRIMARY KEY,
+        auction_id INT REFERENCES auctions(id) ON DELETE CASCADE,
+        stage INT NOT NULL,
+        reviewer_id BIGINT NOT NULL,
+        decision TEXT NOT NULL,
+        reason TEXT,
+        created_at TIMESTAMPTZ DEFAULT NOW()
+    );
+    """),
+
+    (2, "hot_query_indexes", """
+    -- /batch-fill, /batch-status : READY par queue, ordonné par id
+    CREATE INDEX IF NOT EXISTS auctions_ready_queue_idx
+        ON auctions (queue_type, id) WHERE status = 'READY';
+    -- staff_review.setup : scan des PENDING au démarrage
+    CREATE INDEX IF NOT EXISTS auctions_pending_idx
+        ON auctions (id) WHERE status = 'PENDING';
+    -- filtres staff génériques sur status / queue
+    CREATE INDEX IF NOT EXISTS auctions_status_queue_idx
+        ON auctions (status, queue_type);
+    -- posting / batch-view : items d'un batch dans l'ordre
+    CREATE INDEX IF NOT EXISTS batch_items_batch_position_idx
+        ON batch_items (batch_id, position);
+    -- FK ON DELETE CASCADE + recherches par auction
+    CREATE INDEX IF NOT EXISTS batch_items_auction_idx
+        ON batch_items (auction_id);
+    CREATE INDEX IF NOT EXISTS reviews_auction_idx
+        ON reviews (auction_id);
+    """),
+
+    (3, "unique_constraints", """
+    -- Un auction au plus une fois par batch (anciens doublons de /batch-fill supprimés)
+    DELETE FROM batch_items a
+        USING batch_items b
+        WHERE a.batch_id = b.batch_id AND a.auction_id = b.auction_id AND a.id > b.id;
+    ALTER TABLE batch_items
+        ADD CONSTRAINT batch_items_batch_auction_key UNIQUE (batch_id, auction_id);
+
+    -- La même carte ne peut pas être soumise deux fois tant qu'elle est en cours :
+    -- index unique auctions_active_card_key, posé par ensure_active_card_key()
+    -- (il dépend des données : pas créé tant qu'il reste des doublons)
+    """),
+
+    (4, "auction_backlog_counters", """
+    -- Compteurs (status, queue_type) tenus à jour par trigger : /batch-status
+    -- lit une poignée de lignes au lieu de COUNT(*) sur auctions.
+    -- reconcile_backlog_counts() (auction_core) corrige une éventuelle dérive.
+    LOCK TABLE auctions IN SHARE ROW EXCLUSIVE MODE;
+
+    CREATE TABLE IF NOT EXISTS auction_counts (
+        status TEXT NOT NULL,
+        queue_type TEXT NOT NULL,
+        n BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (status, queue_type)
+    );
+
+    CREATE OR REPLACE FUNCTION auction_counts_apply(s TEXT, q TEXT, d INT) RETURNS void AS $$
+    BEGIN
+        INSERT INTO auction_counts (status, queue_type, n)
+        VALUES (COALESCE(s, ''), COALESCE(q, ''), d)
+        ON CONFLICT (status, queue_type) DO UPDATE SET n = auction_counts.n + EXCLUDED.n;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION auction_counts_trigger() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM auction_counts_apply(OLD.status, OLD.queue_type, -1);
+        END IF;
+        IF TG_OP IN ('UPDATE', 'INSERT') THEN
+            PERFORM auction_counts_apply(NEW.status, NEW.queue_type, 1);
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER auctions_counts_ins_del
+        AFTER INSERT OR DELETE ON auctions
+        FOR EACH ROW EXECUTE FUNCTION auction_counts_trigger();
+    CREATE TRIGGER auctions_counts_upd
+        AFTER UPDATE OF status, queue_type ON auctions
+        FOR EACH ROW
+        WHEN (OLD.status IS DISTINCT FROM NEW.status OR OLD.queue_type IS DISTINCT FROM NEW.queue_type)
+        EXECUTE FUNCTION auction_counts_trigger();
+
+    INSERT INTO auction_counts (status, queue_type, n)
+    SELECT COALESCE(status, ''), COALESCE(queue_type, ''), COUNT(*)
+    FROM auctions GROUP BY 1, 2
+    ON CONFLICT (status, queue_type) DO UPDATE SET n = EXCLUDED.n;
+    """),
+
+    (5, "posted_threads", """
+    -- Thread créé pour chaque auction postée (le batch est supprimé après posting)
+    CREATE TABLE IF NOT EXISTS posted_threads (
+        auction_id INT PRIMARY KEY REFERENCES auctions(id) ON DELETE CASCADE,
+        batch_date DATE NOT NULL,
+        position INT,
+        forum_id BIGINT NOT NULL,
+        thread_id BIGINT NOT NULL UNIQUE,
+        link TEXT NOT NULL,
+        posted_at TIMESTAMPTZ DEFAULT NOW()
+    );
+    CREATE INDEX IF NOT EXISTS posted_threads_batch_date_idx
+        ON posted_threads (batch_date, position);
+    """),
+    (6, "jobs", """
+    -- Opérations staff longues (/batch-post, /auction-lock) exécutées en jobs
+    -- reprenables (cogs/jobs.py) : checkpoint JSONB mis à jour au fil de l'eau
+    CREATE TABLE IF NOT EXISTS jobs (
+        id SERIAL PRIMARY KEY,
+        kind TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'QUEUED'
+            CHECK (status IN ('QUEUED', 'RUNNING', 'DONE', 'FAILED')),
+        payload JSONB NOT NULL DEFAULT '{}',
+        checkpoint JSONB NOT NULL DEFAULT '{}',
+        progress JSONB NOT NULL DEFAULT '{}',
+        result JSONB,
+        error TEXT,
+        attempts INT NOT NULL DEFAULT 0,
+        requested_by BIGINT,
+        created_at TIMESTAMPTZ DEFAULT NOW(),
+        started_at TIMESTAMPTZ,
+        heartbeat_at TIMESTAMPTZ,
+        finished_at TIMESTAMPTZ
+    );
+    -- Un seul job actif par type (pas deux /batch-post en parallèle)
+    CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_kind_idx
+        ON jobs (kind) WHERE status IN ('QUEUED', 'RUNNING');
+    """),
+    (7, "auction_rev", """
+    -- Version du contenu d'une auction : incrémentée à chaque changement
+    -- (statut ou champ), sert de clé aux embeds pré-rendus (cogs/render.py)
+    ALTER TABLE auctions ADD COLUMN IF NOT EXISTS rev INT NOT NULL DEFAULT 1;
+
+    CREATE OR REPLACE FUNCTION auctions_bump_rev() RETURNS trigger AS $$
+    BEGIN
+        NEW.rev := OLD.rev + 1;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER auctions_rev_upd
+        BEFORE UPDATE ON auctions
+        FOR EACH ROW
+        WHEN (OLD.* IS DISTINCT FROM NEW.*)
+        EXECUTE FUNCTION auctions_bump_rev();
+    """),
+    (8, "guild_config", """
+    -- Routage par guild (cogs/guild_config.py) : forums par rareté (+ CARD_MAKER),
+    -- channels de review par queue, rôles staff, channels de log et de ping.
+    -- staff_log_channel_id (décisions de review, résumé /auction-lock) et
+    -- lock_forum_ids (forums balayés par /auction-lock) : vides = log_channel_id
+    -- et les forums de post
+    CREATE TABLE IF NOT EXISTS guild_config (
+        guild_id BIGINT PRIMARY KEY,
+        forums JSONB NOT NULL DEFAULT '{}',
+        review_channels JSONB NOT NULL DEFAULT '{}',
+        staff_role_ids BIGINT[] NOT NULL DEFAULT '{}',
+        lock_forum_ids BIGINT[] NOT NULL DEFAULT '{}',
+        log_channel_id BIGINT,
+        staff_log_channel_id BIGINT,
+        ping_channel_id BIGINT,
+        ping_role_id BIGINT,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+
+    -- Chaque process recharge la guild modifiée (LISTEN guild_config)
+    CREATE OR REPLACE FUNCTION guild_config_notify() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('guild_config', COALESCE(NEW.guild_id, OLD.guild_id)::text);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS guild_config_changed ON guild_config;
+    CREATE TRIGGER guild_config_changed
+        AFTER INSERT OR UPDATE OR DELETE ON guild_config
+        FOR EACH ROW
+        EXECUTE FUNCTION guild_config_notify();
+    """),
+    (9, "job_retry_backoff", """
+    -- Job remis en QUEUED après une erreur : pas repris avant not_before
+    -- (attente croissante avec les tentatives, cogs/jobs.py)
+    ALTER TABLE jobs ADD COLUMN IF NOT EXISTS not_before TIMESTAMPTZ;
+    """),
+]
+
+
+# Index unique des auctions en cours (Submit intercepte UniqueViolationError).
+# Hors migration : s'il reste des doublons PENDING/READY, l'index n'est pas
+# créé, les doublons sont listés en warning (le staff les refuse) et on
+# réessaie au boot suivant, sans bloquer le démarrage.
+ACTIVE_CARD_DUPLICATES_SQL = """
+    SELECT a.id, MIN(b.id) AS original
+    FROM auctions a
+    JOIN auctions b
+      ON a.user_id = b.user_id
+     AND COALESCE(a.title, '') = COALESCE(b.title, '')
+     AND COALESCE(a.series, '') = COALESCE(b.series, '')
+     AND COALESCE(a.version, '') = COALESCE(b.version, '')
+     AND a.id > b.id
+    WHERE a.status IN ('PENDING', 'READY') AND b.status IN ('PENDING', 'READY')
+    GROUP BY a.id
+    ORDER BY a.id
+"""
+ACTIVE_CARD_INDEX_SQL = """
+    CREATE UNIQUE INDEX IF NOT EXISTS auctions_active_card_key
+        ON auctions (user_id, COALESCE(title, ''), COALESCE(series, ''), COALESCE(version, ''))
+        WHERE status IN ('PENDING', 'READY')
+"""
+
+
+async def ensure_active_card_key(conn) -> bool:
+    """Crée auctions_active_card_key si aucun doublon ne l'empêche. True si l'index existe."""
+    if await conn.fetchval("SELECT to_regclass('auctions_active_card_key') IS NOT NULL"):
+        return True
+    duplicates = await conn.fetch(ACTIVE_CARD_DUPLICATES_SQL, timeout=db.MAINTENANCE_TIMEOUT)
+    if not duplicates:
+        try:
+            await conn.execute(ACTIVE_CARD_INDEX_SQL, timeout=db.MAINTENANCE_TIMEOUT)
+            logging.info("Created index auctions_active_card_key")
+            return True
+        except asyncpg.UniqueViolationError:
+            # Doublon soumis entre la vérification et la création
+            duplicates = await conn.fetch(ACTIVE_CARD_DUPLICATES_SQL, timeout=db.MAINTENANCE_TIMEOUT)
+    listed = ", ".join(f"#{d['id']} (same card as #{d['original']})" for d in duplicates)
+    logging.warning(
+        f"Duplicate active auctions (same seller and card, PENDING/READY): {listed}. "
+        f"Index auctions_active_card_key not created; deny the duplicates, it is retried at next boot."
+    )
+    return False
+
+
+async def run_migrations(pool) -> List[Tuple[int, str, float]]:
+    """Applique les migrations manquantes. Retourne [(version, nom, secondes)]."""
+    applied_now = []
+    async with pool.acquire() as conn:
+        # Un autre process peut tenir le lock le temps de ses migrations
+        await conn.execute("SELECT pg_advisory_lock($1)", MIGRATIONS_LOCK_ID, timeout=db.MAINTENANCE_TIMEOUT)
+        try:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMPTZ DEFAULT NOW()
+                )
+            """)
+            applied = {r["version"] for r in await conn.fetch("SELECT version FROM schema_migrations")}
+            for version, name, sql in MIGRATIONS:
+                if version in applied:
+                    continue
+                started = time.perf_counter()
+                async with conn.transaction():
+                    await conn.execute(sql, timeout=db.MAINTENANCE_TIMEOUT)
+                    await conn.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES ($1, $2)",
+                        version, name
+                    )
+                elapsed = time.perf_counter() - started
+                applied_now.append((version, name, elapsed))
+                logging.info(f"Applied migration {version:04d}_{name} in {elapsed * 1000:.0f} ms")
+            await ensure_active_card_key(conn)
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATIONS_LOCK_ID)
+    return applied_now
+
+
+# --- Vérification EXPLAIN des requêtes chaudes ---
+# (requête, paramètres, index accepté(s) dans le plan)
+HOT_QUERIES = [
+    ("SELECT COUNT(*) FROM auctions WHERE status='READY' AND queue_type=$1",
+     ["NORMAL"], ("auctions_ready_queue_idx", "auctions_status_queue_idx")),
+    ("SELECT id FROM auctions WHERE status='READY' AND queue_type=$1 ORDER BY id ASC LIMIT 15",
+     ["NORMAL"], ("auctions_ready_queue_idx",)),
+    ("SELECT id FROM auctions WHERE status='PENDING'",
+     [], ("auctions_pending_idx",)),
+    ("SELECT id FROM auctions WHERE status=$1 AND queue_type=$2",
+     ["DENIED", "SKIP"], ("auctions_status_queue_idx",)),
+    ("SELECT auction_id, position FROM batch_items WHERE batch_id=$1 ORDER BY position",
+     [1], ("batch_items_batch_position_idx",)),
+    ("SELECT * FROM batch_items WHERE batch_id=$1 AND auction_id=$2",
+     [1, 1], ("batch_items_batch_auction_key",)),
+    ("SELECT * FROM batch_items WHERE auction_id=$1",
+     [1], ("batch_items_auction_idx",)),
+    ("SELECT * FROM reviews WHERE auction_id=$1",
+     [1], ("reviews_auction_idx",)),
+]
+
+
+def _plan_indexes(plan: dict) -> set:
+    found = set()
+    if plan.get("Index Name"):
+        found.add(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        found |= _plan_indexes(child)
+    return found
+
+
+# Jeu de données synthétique (annulé avec la transaction) pour que le planner
+# voie des tables de taille réaliste, où la majorité des auctions sont POSTED.
+EXPLAIN_SEED_SQL = """
+INSERT INTO auctions (user_id, title, version, rarity, queue_type, status)
+SELECT g % 5000, 'Seed card ' || g, (g % 7)::text, 'UR',
+       (ARRAY['NORMAL', 'SKIP', 'CARD_MAKER'])[1 + g % 3],
+       CASE WHEN g % 50 = 0 THEN 'READY'
+            WHEN g % 50 = 1 THEN 'PENDING'
+            WHEN g % 50 = 2 THEN 'DENIED'
+            ELSE 'POSTED' END
+FROM generate_series(1, 50000) g;
+INSERT INTO batches (batch_date)
+SELECT DATE '1900-01-01' + g FROM generate_series(1, 500) g;
+INSERT INTO batch_items (batch_id, auction_id, position)
+SELECT b.id, a.id, row_number() OVER (PARTITION BY b.id ORDER BY a.id)
+FROM (SELECT id, row_number() OVER (ORDER BY id) AS n FROM auctions) a
+JOIN (SELECT id, row_number() OVER (ORDER BY id) AS n FROM batches) b ON b.n = 1 + a.n % 500;
+INSERT INTO reviews (auction_id, stage, reviewer_id, decision)
+SELECT id, 1, 1, 'ACCEPT' FROM auctions;
+ANALYZE auctions;
+ANALYZE batches;
+ANALYZE batch_items;
+ANALYZE reviews;
+"""
+
+
+async def explain_hot_queries(pool) -> List[Tuple[str, Tuple[str, ...], bool, set]]:
+    """EXPLAIN de chaque requête chaude sur un jeu de données synthétique,
+    dans une transaction annulée. Retourne [(requête, index acceptés, ok, index vus)]."""
+    results = []
+    async with pool.acquire() as conn:
+        tr = conn.transaction()
+        await tr.start()
+        try:
+            await conn.execute(EXPLAIN_SEED_SQL)
+            for query, args, indexes in HOT_QUERIES:
+                raw = await conn.fetchval(f"EXPLAIN (FORMAT JSON) {query}", *args)
+                plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+                used = _plan_indexes(plan)
+                results.append((query, indexes, bool(used.intersection(indexes)), used))
+        finally:
+            await tr.rollback()
+    return results
@@ -0,0 +1,155 @@
+import asyncio
+import itertools
+from collections import Counter, deque
+from typing import Awaitable, Callable, Deque, Dict, Optional
+
+from .metrics import OUTBOUND_QUEUE_DEPTH, OUTBOUND_WAIT_SECONDS
+
+# Dispatcher des envois Discord sortants, par classe de priorité :
+# réponses d'interaction > DMs > posts forum (et autres envois en masse) > logs.
+# Les interactions ne passent jamais par la file (délai de 3 s de Discord).
+# Le reste est mis en file par bucket (un envoi à la fois par bucket par défaut,
+# comme les buckets de rate-limit de Discord ; send(..., concurrency=n) en
+# autorise n, ex. les créations de threads d'un forum) et cadencé à OUTBOUND_RATE envois/s,
+# sous la limite globale de 50 req/s : il reste de la marge pour les
+# interactions même en plein batch, et un DM passe devant les posts en attente.
+PRIORITY_INTERACTION = 0
+PRIORITY_DM = 1
+PRIORITY_FORUM = 2
+PRIORITY_LOG = 3
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTION: "interaction",
+    PRIORITY_DM: "dm",
+    PRIORITY_FORUM: "forum",
+    PRIORITY_LOG: "log",
+}
+
+OUTBOUND_RATE = 25.0
+OUTBOUND_CONCURRENCY = 4
+
+
+class _Job:
+    __slots__ = ("priority", "seq", "bucket", "factory", "future", "enqueued", "concurrency")
+
+    def __init__(self, priority, seq, bucket, factory, future, enqueued, concurrency=1):
+        self.priority = priority
+        self.seq = seq
+        self.bucket = bucket
+        self.factory = factory
+        self.future = future
+        self.enqueued = enqueued
+        self.concurrency = concurrency
+
+
+class Outbound:
+    def __init__(self, rate: float = OUTBOUND_RATE, concurrency: int = OUTBOUND_CONCURRENCY):
+        self.interval = 1 / rate
+        self.concurrency = concurrency
+        self._buckets: Dict[str, Deque[_Job]] = {}
+        self._busy = Counter()  # bucket -> envois en cours
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._next_slot = 0.0
+        self._workers = []
+        self.depth = Counter()
+        self.sent = Counter()
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def close(self, timeout: float = 10.0):
+        workers, self._workers = self._workers, []
+        if not workers:
+            return
+        # Laisse partir ce qui est en file (les nouveaux envois passent en direct)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while sum(self.depth.values()) and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        for queue in self._buckets.values():
+            for job in queue:
+                if not job.future.done():
+                    job.future.cancel()
+        self._buckets.clear()
+
+    async def send(self, priority: int, bucket: str, factory: Callable[[], Awaitable],
+                   concurrency: int = 1):
+        """Exécute factory() selon sa priorité, au plus `concurrency` envois en
+        cours dans le bucket. Retourne son résultat (ou lève son erreur)."""
+        if priority == PRIORITY_INTERACTION or not self._workers:
+            self.sent[priority] += 1
+            return await factory()
+        loop = asyncio.get_running_loop()
+        job = _Job(priority, next(self._seq), bucket, factory, loop.create_future(), loop.time(), concurrency)
+        self._buckets.setdefault(bucket, deque()).append(job)
+        self._set_depth(priority, 1)
+        self._wakeup.set()
+        return await job.future
+
+    def _set_depth(self, priority: int, delta: int):
+        self.depth[priority] += delta
+        OUTBOUND_QUEUE_DEPTH.set(self.depth[priority], PRIORITY_NAMES[priority])
+
+    def _peek(self) -> Optional[_Job]:
+        # Meilleure tête de file parmi les buckets libres (peu de buckets : scan direct)
+        best = None
+        for bucket, queue in self._buckets.items():
+            if queue and self._busy[bucket] < queue[0].concurrency:
+                job = queue[0]
+                if best is None or (job.priority, job.seq) < (best.priority, best.seq):
+                    best = job
+        return best
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if self._peek() is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            # Cadence globale : le choix du job se fait après l'attente, pour
+            # qu'un envoi plus prioritaire arrivé entre-temps passe devant
+            delay = self._next_slot - loop.time()
+            if delay > 0:
+                self._next_slot += self.interval
+                await asyncio.sleep(delay)
+            else:
+                self._next_slot = loop.time() + self.interval
+            job = self._peek()
+            if job is None:
+                continue
+            self._buckets[job.bucket].popleft()
+            self._set_depth(job.priority, -1)
+            if job.future.cancelled():
+                self._drop_if_empty(job.bucket)
+                continue
+            OUTBOUND_WAIT_SECONDS.observe(loop.time() - job.enqueued, PRIORITY_NAMES[job.priority])
+
+            self._busy[job.bucket] += 1
+            try:
+                result = await job.factory()
+            except asyncio.CancelledError:
+                if not job.future.done():
+                    job.future.cancel()
+                raise
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                self._busy[job.bucket] -= 1
+                if not self._busy[job.bucket]:
+                    del self._busy[job.bucket]
+                self._drop_if_empty(job.bucket)
+                self.sent[job.priority] += 1
+                self._wakeup.set()
+
+    def _drop_if_empty(self, bucket: str):
+        if bucket in self._buckets and not self._buckets[bucket]:
+            del self._buckets[bucket]
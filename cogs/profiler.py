@@ -0,0 +1,208 @@
+import asyncio
+import inspect
+import io
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from typing import List, Optional, Tuple
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+from .admin_guard import is_staff
+
+# Profiler à la demande (/profile) :
+#  - échantillonnage par SIGPROF (setitimer) : le handler tourne dans le thread
+#    de la loop et reçoit la frame interrompue, sans le biais GIL d'un thread
+#    échantillonneur (qui ne voit la loop que dans select())
+#  - un battement posé sur la loop + un thread de surveillance détectent les
+#    callbacks qui la bloquent plus de SLOW_CALLBACK_SECONDS, pile comprise
+# Pas de loop.set_debug() : trop coûteux pendant un batch en cours.
+SAMPLE_INTERVAL = 0.005
+HEARTBEAT_INTERVAL = 0.05
+WATCHDOG_INTERVAL = 0.01
+SLOW_CALLBACK_SECONDS = 0.1
+MAX_DURATION = 120
+TOP_N = 25
+
+IDLE_FUNCTIONS = {"select", "poll", "epoll", "_run_once"}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})"
+
+
+def _walk(frame) -> List:
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()  # de l'extérieur vers l'intérieur
+    return frames
+
+
+class SamplingProfiler:
+    def __init__(self, loop: asyncio.AbstractEventLoop, interval: float = SAMPLE_INTERVAL,
+                 slow: float = SLOW_CALLBACK_SECONDS):
+        self.loop = loop
+        self.interval = interval
+        self.slow = slow
+        self.thread_id = threading.get_ident()  # construit depuis le thread de la loop
+        self.samples = 0
+        self.idle = 0
+        self.stacks = Counter()      # pile repliée -> échantillons (format flamegraph)
+        self.coroutines = Counter()  # coroutine la plus externe -> échantillons actifs
+        self.functions = Counter()   # fonction en haut de pile -> échantillons actifs
+        self.blocked: List[list] = []  # [battement, durée, pile] des blocages de la loop
+        self.max_lag = 0.0
+        self.started = self.stopped = 0.0
+        self._heartbeat = 0.0
+        self._beat_handle: Optional[asyncio.TimerHandle] = None
+        self._previous_handler = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        # signal.signal n'est permis que dans le thread principal (bot.run)
+        self._previous_handler = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        self.started = self._heartbeat = time.perf_counter()
+        self._beat()
+        self._thread = threading.Thread(target=self._watchdog, name="profiler-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+        self._stop.set()
+        if self._beat_handle:
+            self._beat_handle.cancel()
+        if self._thread:
+            self._thread.join()
+        self.stopped = time.perf_counter()
+
+    def _beat(self):
+        self._heartbeat = time.perf_counter()
+        if not self._stop.is_set():
+            self._beat_handle = self.loop.call_later(HEARTBEAT_INTERVAL, self._beat)
+
+    def _sample(self, signum, frame):
+        frames = _walk(frame)
+        self.samples += 1
+        if frames[-1].f_code.co_name in IDLE_FUNCTIONS:
+            self.idle += 1
+            return
+        self.stacks[";".join(f.f_code.co_qualname for f in frames)] += 1
+        self.functions[_frame_label(frames[-1])] += 1
+        coroutine = next((f for f in frames if f.f_code.co_flags & inspect.CO_COROUTINE), None)
+        self.coroutines[coroutine.f_code.co_qualname if coroutine else "<callback>"] += 1
+
+    def _watchdog(self):
+        # Loop bloquée : le battement n'est pas passé depuis trop longtemps
+        current_block = None
+        while not self._stop.wait(WATCHDOG_INTERVAL):
+            beat = self._heartbeat
+            lag = time.perf_counter() - beat - HEARTBEAT_INTERVAL
+            self.max_lag = max(self.max_lag, lag)
+            if lag <= self.slow:
+                continue
+            if current_block is None or current_block[0] != beat:
+                frame = sys._current_frames().get(self.thread_id)
+                stack = "\n".join("    " + _frame_label(f) for f in _walk(frame)) if frame else "    ?"
+                del frame
+                current_block = [beat, lag, stack]
+                self.blocked.append(current_block)
+            current_block[1] = lag
+
+    def report(self) -> str:
+        duration = (self.stopped or time.perf_counter()) - self.started
+        busy = self.samples - self.idle
+        ms = self.interval * 1000
+        lines = [
+            f"Profile: {duration:.1f}s, {self.samples} CPU samples every {ms:.0f} ms, "
+            f"loop CPU {busy * self.interval / duration if duration else 0:.0%}, "
+            f"max loop lag {self.max_lag * 1000:.0f} ms",
+            "",
+            "Slowest coroutines (CPU samples ~ ms on the loop):",
+        ]
+        for name, n in self.coroutines.most_common(TOP_N):
+            lines.append(f"  {n * ms:>8.0f} ms  {n:>6}  {name}")
+        lines += ["", "Hot functions (top of stack):"]
+        for name, n in self.functions.most_common(TOP_N):
+            lines.append(f"  {n * ms:>8.0f} ms  {n:>6}  {name}")
+        blocked = sorted(self.blocked, key=lambda b: b[1], reverse=True)
+        lines += ["", f"Loop blocked > {self.slow * 1000:.0f} ms: {len(blocked)} time(s)"]
+        for _beat, lag, stack in blocked[:TOP_N]:
+            lines.append(f"  ~{lag * 1000:.0f} ms in:")
+            lines.append(stack)
+        return "\n".join(lines) + "\n"
+
+    def folded(self) -> str:
+        # Compatible flamegraph.pl / speedscope
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+
+def task_summary(loop: asyncio.AbstractEventLoop) -> Tuple[int, Counter]:
+    names = Counter()
+    tasks = asyncio.all_tasks(loop)
+    for task in tasks:
+        coro = task.get_coro()
+        names[getattr(coro, "__qualname__", repr(coro))] += 1
+    return len(tasks), names
+
+
+class Profiler(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self._running = asyncio.Lock()
+
+    @app_commands.command(name="profile", description="Profile the bot event loop for N seconds (staff only).")
+    @app_commands.describe(
+        seconds=f"Duration (max {MAX_DURATION}s)",
+        to_log_channel="Post the result in the log channel instead of here"
+    )
+    @is_staff()
+    async def profile(self, interaction: discord.Interaction, seconds: int = 30, to_log_channel: bool = False):
+        if self._running.locked():
+            return await interaction.response.send_message("⏳ A profile is already running.", ephemeral=True)
+        seconds = max(1, min(seconds, MAX_DURATION))
+        await interaction.response.send_message(f"🔬 Profiling for {seconds}s...", ephemeral=True)
+
+        async with self._running:
+            loop = asyncio.get_running_loop()
+            tasks_before, _ = task_summary(loop)
+            profiler = SamplingProfiler(loop)
+            profiler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                # join() du thread : quelques ms au plus
+                profiler.stop()
+            tasks_after, names = task_summary(loop)
+
+        report = profiler.report()
+        report += f"\nTasks: {tasks_before} at start, {tasks_after} at end\n"
+        for name, n in names.most_common(TOP_N):
+            report += f"  {n:>5}  {name}\n"
+
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        files = [
+            discord.File(io.BytesIO(report.encode()), filename=f"profile-{stamp}.txt"),
+            discord.File(io.BytesIO(profiler.folded().encode()), filename=f"profile-{stamp}.folded"),
+        ]
+        summary = report.splitlines()[0]
+        log_channel_id = self.bot.guild_config.routes(interaction.guild_id).log_channel_id
+        channel = self.bot.get_channel(log_channel_id) if to_log_channel else None
+        if channel:
+            await channel.send(f"🔬 Profile requested by {interaction.user.mention}\n{summary}", files=files)
+            await interaction.followup.send("✅ Profile posted in the log channel.", ephemeral=True)
+        else:
+            await interaction.followup.send(f"🔬 {summary}", files=files, ephemeral=True)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Profiler(bot))
@@ -0,0 +1,186 @@
+import json
+import re
+from collections import Counter
+from typing import Dict, Iterable
+
+import discord
+
+from . import db
+from .db import register_query
+from .metrics import RENDER_CACHE_REQUESTS
+
+# Embeds d'une auction pré-rendus une fois (forum, logs, review, statut) et
+# gardés dans Redis sous render:auction:{id}:{rev}. auctions.rev est incrémenté
+# par trigger à chaque changement de la ligne (statut ou champ, migration 7) :
+# une nouvelle version change la clé, l'ancienne expire d'elle-même.
+# Les payloads sont les dicts d'embed (Embed.to_dict) sérialisés en JSON,
+# rendus en batch au remplissage et relus en un MGET au moment de poster.
+# Module importé normalement (pas une extension) : partagé par plusieurs cogs.
+RENDER_KEY = "render:auction:{id}:{rev}"
+RENDER_TTL = 2 * 24 * 3600
+
+stats = Counter()
+
+RARITY_EMOJIS = {
+    "COMMON": "<a:Common:1342208021853634781>",
+    "RARE": "<a:Rare:1342208028342091857>",
+    "SR": "<a:SuperRare:1342208034482425936>",
+    "SSR": "<a:SuperSuperRare:1342208039918370857>",
+    "UR": "<a:UltraRare:1342208044351623199>",
+}
+
+VERSION_SUFFIX_RE = re.compile(r"\s*v\s*\d+\s*$", re.IGNORECASE)
+
+def strip_version_suffix(name: str) -> str:
+    if not name:
+        return name
+    return VERSION_SUFFIX_RE.sub("", name).strip()
+
+def card_display_name(it) -> str:
+    raw_name = it["title"] or (it["series"] if it["series"] else f"Auction #{it['id']}")
+    return strip_version_suffix(raw_name)
+
+def build_forum_embed(it, card_name: str, emoji: str, rarity: str) -> discord.Embed:
+    embed = discord.Embed(
+        title=f"{emoji} {card_name}" if emoji else card_name,
+        description=f"Auction posted by <@{it['user_id']}>",
+        color=discord.Color.blurple()
+    )
+    embed.add_field(name="Seller", value=f"<@{it['user_id']}>", inline=True)
+    embed.add_field(name="Rarity", value=f"{emoji} {rarity}" if emoji else (it.get("rarity") or "?"), inline=True)
+    embed.add_field(name="Preference", value=it.get("currency") or "N/A", inline=True)
+    embed.add_field(name="Rate", value=it.get("rate") or "N/A", inline=True)
+    embed.add_field(name="Version", value=it.get("version") or "?", inline=True)
+    if it.get("image_url"):
+        embed.set_image(url=it["image_url"])
+    return embed
+
+def build_posted_log_embed(it, card_name: str, emoji: str, rarity: str) -> discord.Embed:
+    log_embed = discord.Embed(title="Auction posted", color=discord.Color.blue())
+    log_embed.add_field(name="Name of the card", value=(f"{emoji} {card_name}" if emoji else card_name), inline=True)
+    log_embed.add_field(name="Version", value=it.get("version") or "?", inline=True)
+    log_embed.add_field(name="Queue", value=it.get("queue_type") or "?", inline=True)
+    log_embed.add_field(name="Seller", value=f"<@{it['user_id']}>", inline=True)
+    log_embed.add_field(name="Rarity", value=f"{emoji} {rarity}" if emoji else (it.get("rarity") or "?"), inline=True)
+    log_embed.add_field(name="Currency", value=it.get("currency") or "N/A", inline=True)
+    log_embed.add_field(name="Rate", value=it.get("rate") or "N/A", inline=True)
+    if it.get("image_url"):
+        log_embed.set_image(url=it["image_url"])
+    return log_embed
+
+def build_ready_log_embed(auction) -> discord.Embed:
+    card_name = auction["title"] or (
+        f"{auction['series']}" if auction.get("series") else f"Auction #{auction['id']}"
+    )
+
+    embed = discord.Embed(
+        title="Card added to waiting list",
+        color=discord.Color.green()
+    )
+    embed.add_field(name="Name of the card", value=f"{card_name} v{auction.get('version') or '?'}", inline=True)
+    embed.add_field(name="Version", value=auction.get("version") or "?", inline=True)
+    embed.add_field(name="Queue", value=auction.get("queue_type") or "?", inline=True)
+    embed.add_field(name="Seller", value=f"<@{auction['user_id']}>", inline=True)
+    embed.add_field(name="Rarity", value=auction.get("rarity") or "?", inline=True)
+    embed.add_field(name="Currency", value=auction.get("currency") or "N/A", inline=True)
+    embed.add_field(name="Rate", value=auction.get("rate") or "N/A", inline=True)
+    if auction.get("event"):
+        embed.add_field(name="Event", value=auction["event"], inline=True)
+    if auction.get("special"):
+        embed.add_field(name="Special", value=auction["special"], inline=True)
+    if auction.get("image_url"):
+        embed.set_image(url=auction["image_url"])
+    return embed
+
+def build_review_embed(auction) -> discord.Embed:
+    embed = discord.Embed(
+        title=f"Auction #{auction['id']} submitted",
+        description="Pending review",
+        color=discord.Color.orange()
+    )
+    embed.add_field(name="Seller", value=f"<@{auction['user_id']}>", inline=True)
+    embed.add_field(name="Rarity", value=auction["rarity"], inline=True)
+    embed.add_field(name="Queue", value=auction["queue_type"], inline=True)
+    embed.add_field(name="Currency", value=auction["currency"], inline=True)
+    embed.add_field(name="Rate", value=auction["rate"] or "—", inline=True)
+    embed.add_field(name="Version", value=auction["version"] or "?", inline=True)
+    embed.add_field(name="Status", value="PENDING ⏳", inline=True)  # ✅ Ajout
+    if auction["image_url"]:
+        embed.set_image(url=auction["image_url"])
+    return embed
+
+def build_status_embed(auction) -> discord.Embed:
+    # Sans le lien du thread (posted_threads) : ajouté à la lecture
+    embed = discord.Embed(
+        title=f"Auction #{auction['id']} — {auction['title'] or 'Untitled'}",
+        color=discord.Color.blurple()
+    )
+    embed.add_field(name="Rarity", value=auction["rarity"], inline=True)
+    embed.add_field(name="Queue", value=auction["queue_type"], inline=True)
+    embed.add_field(name="Currency", value=auction["currency"], inline=True)
+    embed.add_field(name="Rate", value=auction["rate"] or "—", inline=True)
+    embed.add_field(name="Status", value=auction["status"], inline=True)
+    embed.add_field(name="Seller", value=f"<@{auction['user_id']}>", inline=False)
+    if auction["image_url"]:
+        embed.set_thumbnail(url=auction["image_url"])
+    return embed
+
+
+def render_auction(auction) -> dict:
+    """Tous les embeds d'une auction (ligne complète de auctions), en dicts."""
+    card_name = card_display_name(auction)
+    rarity = (auction.get("rarity") or "COMMON").upper()
+    emoji = RARITY_EMOJIS.get(rarity, "")
+    return {
+        "card_name": card_name,
+        "forum": build_forum_embed(auction, card_name, emoji, rarity).to_dict(),
+        "posted_log": build_posted_log_embed(auction, card_name, emoji, rarity).to_dict(),
+        "ready_log": build_ready_log_embed(auction).to_dict(),
+        "review": build_review_embed(auction).to_dict(),
+        "status": build_status_embed(auction).to_dict(),
+    }
+
+
+def payload_embed(payload: dict, kind: str) -> discord.Embed:
+    return discord.Embed.from_dict(payload[kind])
+
+
+async def auction_payloads(redis, auctions: Iterable) -> Dict[int, dict]:
+    """Payloads pré-rendus par id d'auction : un MGET, rendu + SET des absents."""
+    auctions = list(auctions)
+    if not auctions:
+        return {}
+    keys = [RENDER_KEY.format(id=a["id"], rev=a["rev"]) for a in auctions]
+    cached = await redis.mget(keys)
+    payloads = {}
+    pipe = None
+    for auction, key, raw in zip(auctions, keys, cached):
+        if raw is not None:
+            stats["hits"] += 1
+            RENDER_CACHE_REQUESTS.inc("hit")
+            payloads[auction["id"]] = json.loads(raw)
+            continue
+        stats["misses"] += 1
+        RENDER_CACHE_REQUESTS.inc("miss")
+        payload = payloads[auction["id"]] = render_auction(auction)
+        if pipe is None:
+            pipe = redis.pipeline(transaction=False)
+        pipe.set(key, json.dumps(payload, separators=(",", ":"), ensure_ascii=False), ex=RENDER_TTL)
+    if pipe is not None:
+        await pipe.execute()
+    return payloads
+
+
+async def auction_payload(redis, auction) -> dict:
+    return (await auction_payloads(redis, [auction]))[auction["id"]]
+
+
+register_query("batch_auctions", """
+    SELECT a.* FROM batch_items bi JOIN auctions a ON a.id=bi.auction_id WHERE bi.batch_id=$1
+""")
+
+
+async def render_batch(pool, redis, batch_id: int) -> int:
+    """Pré-rend les embeds des auctions du batch (après remplissage)."""
+    rows = await db.fetch(pool, "batch_auctions", batch_id)
+    return len(await auction_payloads(redis, rows))
@@ -1,32 +1,43 @@
+import asyncio
+import logging
+import time
 import discord
 from discord.ext import commands
-from .auction_core import get_or_create_today_batch
-from .utils import rarity_to_forum_id
+from typing import List, NamedTuple, Optional, Tuple
+from .auction_core import fill_batch, get_or_create_today_batch, lock_today_batch, record_posted_batch
 from .admin_guard import is_staff
+from . import db
+from .db import register_query
+from .metrics import timed
+from .outbound import PRIORITY_FORUM
+from .jobs import JobContext
+from .render import RARITY_EMOJIS, auction_payloads, card_display_name, payload_embed, render_batch
 from zoneinfo import ZoneInfo
-from datetime import datetime, timedelta
-import re
+from datetime import date, datetime, time as dtime, timedelta, timezone
 
 CEST = ZoneInfo("Europe/Paris")
 
-RARITY_EMOJIS = {
-    "COMMON": "<a:Common:1342208021853634781>",
-    "RARE": "<a:Rare:1342208028342091857>",
-    "SR": "<a:SuperRare:1342208034482425936>",
-    "SSR": "<a:SuperSuperRare:1342208039918370857>",
-    "UR": "<a:UltraRare:1342208044351623199>",
-}
+register_query("batch_items_for_post", """
+    SELECT bi.position, a.*
+    FROM batch_items bi
+    JOIN auctions a ON a.id=bi.auction_id
+    WHERE bi.batch_id=$1
+    ORDER BY bi.position ASC
+""")
+register_query("posted_threads_for_auctions", """
+    SELECT pt.auction_id AS id, pt.position, pt.forum_id, pt.thread_id, pt.link,
+           a.title, a.series, a.version, a.event, a.rarity
+    FROM posted_threads pt
+    JOIN auctions a ON a.id=pt.auction_id
+    WHERE pt.auction_id = ANY($1::int[])
+    ORDER BY pt.position ASC
+""")
 
-PING_ROLE_ID = 1303005123622207559
-VERSION_SUFFIX_RE = re.compile(r"\s*v\s*\d+\s*$", re.IGNORECASE)
+BATCH_POST_JOB = "batch_post"
 
-def strip_version_suffix(name: str) -> str:
-    if not name:
-        return name
-    return VERSION_SUFFIX_RE.sub("", name).strip()
-
-async def post_ping_message(channel: discord.TextChannel, daily_index: int, auctions: list):
-    lines = [f"<@&{PING_ROLE_ID}> Batch #{daily_index}"]
+async def post_ping_message(channel: discord.TextChannel, daily_index: int, auctions: list,
+                            ping_role_id: Optional[int] = None):
+    lines = [f"<@&{ping_role_id}> Batch #{daily_index}" if ping_role_id else f"Batch #{daily_index}"]
 
     grouped = {r: [] for r in RARITY_EMOJIS.keys()}
     for auc in auctions:
@@ -53,103 +64,367 @@ async def post_ping_message(channel: discord.TextChannel, daily_index: int, auct
     for chunk in [content[i:i+3900] for i in range(0, len(content), 3900)]:
         await channel.send(chunk)
 
+# Création de threads en parallèle, au plus FORUM_POST_CONCURRENCY en cours
+# par forum (bucket outbound "forum:{id}"). Le client HTTP de discord.py gère
+# déjà le bucket de rate-limit (POST /channels/{id}/threads est par forum) et
+# attend sur les 429 : la borne évite juste de l'inonder.
+FORUM_POST_CONCURRENCY = 3
+
+class PreparedPost(NamedTuple):
+    it: object  # ligne batch_items_for_post
+    forum: discord.ForumChannel
+    card_name: str
+    embed: discord.Embed
+    log_embed: discord.Embed
+
+
+# --- Planning quotidien (heures de Paris) ---
+# BATCH_POST_TIME=HH:MM active le planning : à BATCH_LOCK_TIME le batch du jour
+# est rempli puis verrouillé, BATCH_PREWARM_MINUTES avant l'heure de post les
+# lignes sont chargées et les embeds construits, à l'heure de post un job
+# batch_post est lancé (il ne reste que les appels Discord).
+# Les étapes sont rattachées au jour de post et toujours dans l'ordre
+# lock -> prewarm -> post : un BATCH_LOCK_TIME plus tard que BATCH_POST_TIME
+# (ex. 23:30 pour 00:10) est la veille, et le batch verrouillé est celui du
+# jour de post.
+# Chaque étape faite est notée dans Redis : après un redémarrage, les étapes
+# manquées depuis moins de SCHEDULE_CATCHUP sont rattrapées dans l'ordre.
+# Une étape en cours est réservée par un marqueur court (SCHEDULE_RUN_TTL) et
+# notée faite seulement si elle réussit : en cas d'erreur ou de crash, elle
+# est retentée au tick suivant (ou à l'expiration du marqueur).
+SCHEDULE_KEY = "scheduler:batch:{day}"
+SCHEDULE_RUNNING_KEY = "scheduler:batch:{day}:{phase}:running"
+SCHEDULE_KEY_TTL = 3 * 24 * 3600
+SCHEDULE_RUN_TTL = 10 * 60
+SCHEDULE_CATCHUP = timedelta(hours=3)
+SCHEDULE_MAX_SLEEP = 60  # réveil régulier : robuste aux sauts d'horloge / mise en veille
+DEFAULT_LOCK_LEAD = timedelta(minutes=15)
+
+
+def parse_hhmm(value: str) -> dtime:
+    hours, minutes = value.strip().split(":")
+    return dtime(int(hours), int(minutes))
+
+
+def paris_instant(day: date, at: dtime) -> datetime:
+    """Heure murale de Paris -> instant UTC. Changement d'heure : une heure qui
+    n'existe pas (mars, 02:30) tombe une heure plus tard, une heure ambiguë
+    (octobre, 02:30) prend la première occurrence."""
+    return datetime.combine(day, at, tzinfo=CEST).astimezone(timezone.utc)
+
+
+def schedule_for_day(day: date, post_at: dtime, lock_at: Optional[dtime],
+                     prewarm: timedelta) -> List[Tuple[str, datetime]]:
+    """Étapes du batch posté le jour `day` (Paris), dans l'ordre d'exécution."""
+    post = paris_instant(day, post_at)
+    if lock_at:
+        lock = paris_instant(day - timedelta(days=1) if lock_at > post_at else day, lock_at)
+    else:
+        lock = post - DEFAULT_LOCK_LEAD
+    # Écarts en temps réel (UTC) : corrects même la nuit du changement d'heure.
+    # Pas de prewarm avant le lock (le batch ne serait pas encore rempli)
+    return [("lock", lock), ("prewarm", max(post - prewarm, lock)), ("post", post)]
+
+
 class Scheduler(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self._prepared: Optional[dict] = None
+        self._schedule_task: Optional[asyncio.Task] = None
+
+    async def cog_load(self):
+        # /batch-post tourne en job reprenable (cogs/jobs.py)
+        self.bot.jobs.register(BATCH_POST_JOB, self.post_forums_and_summary)
+        if self.bot.batch_post_time:
+            self._schedule_task = asyncio.create_task(self.run_schedule())
+
+    async def cog_unload(self):
+        if self._schedule_task:
+            self._schedule_task.cancel()
+
+    def phases(self, day: date) -> List[Tuple[str, datetime]]:
+        return schedule_for_day(
+            day,
+            parse_hhmm(self.bot.batch_post_time),
+            parse_hhmm(self.bot.batch_lock_time) if self.bot.batch_lock_time else None,
+            timedelta(minutes=self.bot.batch_prewarm_minutes),
+        )
+
+    async def run_schedule(self):
+        await self.bot.wait_until_ready()
+        logging.info("Batch schedule (Europe/Paris): " + ", ".join(
+            f"{phase} {at.astimezone(CEST):%H:%M}" for phase, at in self.phases(datetime.now(CEST).date())
+        ))
+        while True:
+            # Un seul process déroule le planning (le prewarm reste en mémoire
+            # du leader, qui exécute aussi le job de post)
+            await self.bot.leader.wait_leader()
+            try:
+                delay = await self.schedule_tick()
+            except Exception:
+                logging.exception("Batch schedule tick failed")
+                delay = SCHEDULE_MAX_SLEEP
+            await asyncio.sleep(min(max(delay, 0.5), SCHEDULE_MAX_SLEEP))
+
+    async def schedule_tick(self) -> float:
+        """Exécute la prochaine étape due. Retourne le délai avant la suivante."""
+        now = datetime.now(timezone.utc)
+        today = now.astimezone(CEST).date()
+        # Jours de post en cours : hier (rattrapage après minuit), aujourd'hui,
+        # demain (lock de la veille)
+        for day in (today - timedelta(days=1), today, today + timedelta(days=1)):
+            delay = await self.tick_day(day, now)
+            if delay is not None:
+                return delay
+        # Tout est fait jusqu'à demain : première étape du jour suivant
+        return (self.phases(today + timedelta(days=2))[0][1] - now).total_seconds()
+
+    async def tick_day(self, day: date, now: datetime) -> Optional[float]:
+        """Étapes du jour de post `day`, dans l'ordre. None si toutes sont faites."""
+        phases = self.phases(day)
+        if now - phases[-1][1] > SCHEDULE_CATCHUP:
+            return None  # jour passé, plus rien à rattraper
+        key = SCHEDULE_KEY.format(day=day.isoformat())
+        done = None
+        for phase, at in phases:
+            if done is None:
+                if at > now:
+                    return (at - now).total_seconds()  # rien de dû ce jour-là
+                done = await self.bot.redis.hgetall(key)
+            if phase in done:
+                continue
+            if at > now:
+                return (at - now).total_seconds()
+            late = now - at
+            if late > SCHEDULE_CATCHUP:
+                logging.warning(f"Batch schedule: skipped {phase} for {day} ({late} late)")
+                await self.mark_phase_done(key, phase, "skipped")
+                continue
+            # Une seule exécution à la fois par étape et par jour
+            running = SCHEDULE_RUNNING_KEY.format(day=day.isoformat(), phase=phase)
+            if not await self.bot.redis.set(running, now.isoformat(), nx=True, ex=SCHEDULE_RUN_TTL):
+                return SCHEDULE_MAX_SLEEP
+            if late > timedelta(seconds=SCHEDULE_MAX_SLEEP):
+                logging.warning(f"Batch schedule: catching up {phase} for {day} ({late} late)")
+            try:
+                await self.run_phase(phase, day)
+            except BaseException:
+                # Échec : marqueur retiré, l'étape est retentée au prochain tick
+                await self.bot.redis.delete(running)
+                raise
+            await self.mark_phase_done(key, phase, now.isoformat())
+            await self.bot.redis.delete(running)
+            return 0
+        return None
+
+    async def mark_phase_done(self, key: str, phase: str, value: str):
+        pipe = self.bot.redis.pipeline(transaction=False)
+        pipe.hset(key, phase, value)
+        pipe.expire(key, SCHEDULE_KEY_TTL)
+        await pipe.execute()
+
+    async def run_phase(self, phase: str, day: date):
+        """Étape du batch du jour de post `day`."""
+        started = time.perf_counter()
+        if phase == "lock":
+            bid = await get_or_create_today_batch(self.bot.pg, day)
+            inserted, candidates = await fill_batch(self.bot.pg, bid)
+            await lock_today_batch(self.bot.pg, day)
+            rendered = await render_batch(self.bot.pg, self.bot.redis, bid)
+            detail = f"batch #{bid} filled with {inserted}/{candidates} and locked, {rendered} rendered"
+        elif phase == "prewarm":
+            detail = await self.prewarm(day)
+        else:
+            job_id, created = await self.bot.jobs.enqueue(
+                BATCH_POST_JOB, {"scheduled": True, "batch_date": day.isoformat()}
+            )
+            detail = f"job #{job_id}" + ("" if created else " (already running)")
+        logging.info(f"Batch schedule: {phase} done in {time.perf_counter() - started:.2f}s, {detail}")
 
-    async def post_forums_and_summary(self):
+    async def prewarm(self, day: date) -> str:
+        """Charge le batch et prépare forums + embeds avant l'heure de post."""
         guild = self.bot.get_guild(self.bot.guild_id)
         if not guild:
-            return
-
-        bid = await get_or_create_today_batch(self.bot.pg)
-        items = await self.bot.pg.fetch("""
-            SELECT bi.position, a.id, a.user_id, a.rarity, a.queue_type,
-                   a.series, a.version, a.title, a.currency, a.rate, a.image_url, a.event
-            FROM batch_items bi
-            JOIN auctions a ON a.id=bi.auction_id
-            WHERE bi.batch_id=$1
-            ORDER BY bi.position ASC
-        """, bid)
-        if not items:
-            return
-
-        auctions_today = []
-        daily_index = 0
-
+            return "guild not available"
+        bid = await get_or_create_today_batch(self.bot.pg, day)
+        items = await db.fetch(self.bot.pg, "batch_items_for_post", bid)
+        payloads = await auction_payloads(self.bot.redis, items)
+        posts = {}
         for it in items:
-            daily_index += 1
-            forum_id = rarity_to_forum_id(self.bot, it["rarity"], it["queue_type"])
-            forum = guild.get_channel(forum_id)
-            if not forum or forum.type != discord.ChannelType.forum:
-                continue
+            post = self.prepare_post(guild, it, payloads[it["id"]])
+            if post:
+                posts[it["id"]] = post
+        self._prepared = {"batch_id": bid, "posts": posts}
+        return f"batch #{bid}, {len(posts)}/{len(items)} posts prepared"
 
-            raw_name = it["title"] or (it["series"] if it["series"] else f"Auction #{it['id']}")
-            card_name = strip_version_suffix(raw_name)
-            rarity = (it.get("rarity") or "COMMON").upper()
-            emoji = RARITY_EMOJIS.get(rarity, "")
+    @timed("post_forums_and_summary")
+    async def post_forums_and_summary(self, job: JobContext) -> Optional[dict]:
+        """Job batch_post. Checkpoint : batch_id, auction_ids, total, stage
+        (posting -> recorded -> pinged). Chaque thread créé est enregistré tout
+        de suite dans posted_threads : à la reprise, les items déjà postés
+        sont sautés."""
+        guild = self.bot.get_guild(self.bot.guild_id)
+        if not guild:
+            raise RuntimeError(f"Guild {self.bot.guild_id} not available")
 
-            embed = discord.Embed(
-                title=f"{emoji} {card_name}" if emoji else card_name,
-                description=f"Auction posted by <@{it['user_id']}>",
-                color=discord.Color.blurple()
+        started = time.perf_counter()
+        checkpoint = job.checkpoint
+        if not checkpoint:
+            # Planning : batch du jour de post ; /batch-post : batch du jour
+            batch_date = job.payload.get("batch_date")
+            bid = await get_or_create_today_batch(self.bot.pg, batch_date and date.fromisoformat(batch_date))
+            items = await db.fetch(self.bot.pg, "batch_items_for_post", bid)
+            if not items:
+                return {"batch_id": bid, "posted": 0, "total": 0}
+            await job.save(
+                batch_id=bid, auction_ids=[it["id"] for it in items], total=len(items), stage="posting"
             )
-            embed.add_field(name="Seller", value=f"<@{it['user_id']}>", inline=True)
-            embed.add_field(name="Rarity", value=f"{emoji} {rarity}" if emoji else (it.get("rarity") or "?"), inline=True)
-            embed.add_field(name="Preference", value=it.get("currency") or "N/A", inline=True)
-            embed.add_field(name="Rate", value=it.get("rate") or "N/A", inline=True)
-            embed.add_field(name="Version", value=it.get("version") or "?", inline=True)
-            if it.get("image_url"):
-                embed.set_image(url=it["image_url"])
+        bid, auction_ids, total = checkpoint["batch_id"], checkpoint["auction_ids"], checkpoint["total"]
 
-            try:
-                thread_with_msg = await forum.create_thread(
-                    name=card_name,
-                    content=None,
-                    embed=embed
+        if checkpoint["stage"] == "posting":
+            items = await db.fetch(self.bot.pg, "batch_items_for_post", bid)
+            done = {r["id"] for r in await db.fetch(self.bot.pg, "posted_threads_for_auctions", auction_ids)}
+            todo = [it for it in items if it["id"] not in done]
+            if done:
+                logging.info(f"Batch #{bid}: resuming, {len(done)} already posted, {len(todo)} to go")
+            # Embeds préparés par le pré-chauffage s'ils correspondent encore au batch
+            prepared = self._prepared if self._prepared and self._prepared["batch_id"] == bid else {}
+            prepared = prepared.get("posts", {})
+            # Les autres (ajoutés ou modifiés depuis : rev différent) en un MGET
+            stale = [it for it in todo if it["id"] not in prepared or prepared[it["id"]].it["rev"] != it["rev"]]
+            payloads = await auction_payloads(self.bot.redis, stale)
+            failed = 0
+
+            async def post_bounded(it):
+                nonlocal failed
+                if it["id"] in payloads:
+                    post = self.prepare_post(guild, it, payloads[it["id"]])
+                else:
+                    post = prepared[it["id"]]
+                if post is None:
+                    failed += 1
+                    return
+                posted = await self._post_item(guild, post)
+                if not posted:
+                    failed += 1
+                    return
+                # Point de reprise par item
+                await db.execute(
+                    self.bot.pg, "posted_threads_upsert", None, [posted["id"]], [posted["position"]],
+                    [posted["forum_id"]], [posted["thread_id"]], [posted["link"]]
                 )
-                thread = thread_with_msg.thread
-                link = f"https://discord.com/channels/{guild.id}/{thread.id}"
-                await self.bot.pg.execute("UPDATE auctions SET status='POSTED' WHERE id=$1", it["id"])
-
-                log_channel = guild.get_channel(self.bot.log_channel_id)
-                if log_channel:
-                    log_embed = discord.Embed(title="Auction posted", color=discord.Color.blue())
-                    log_embed.add_field(name="Name of the card", value=(f"{emoji} {card_name}" if emoji else card_name), inline=True)
-                    log_embed.add_field(name="Version", value=it.get("version") or "?", inline=True)
-                    log_embed.add_field(name="Queue", value=it.get("queue_type") or "?", inline=True)
-                    log_embed.add_field(name="Seller", value=f"<@{it['user_id']}>", inline=True)
-                    log_embed.add_field(name="Rarity", value=f"{emoji} {rarity}" if emoji else (it.get("rarity") or "?"), inline=True)
-                    log_embed.add_field(name="Currency", value=it.get("currency") or "N/A", inline=True)
-                    log_embed.add_field(name="Rate", value=it.get("rate") or "N/A", inline=True)
-                    if it.get("image_url"):
-                        log_embed.set_image(url=it["image_url"])
-                    await log_channel.send(embed=log_embed)
-
-                auctions_today.append({
-                    "id": it["id"],
-                    "title": card_name,
-                    "version": it.get("version"),
-                    "event": it.get("event"),
-                    "rarity": it.get("rarity"),
-                    "link": link
-                })
-
-            except Exception as e:
-                print("Error creating thread:", e)
-
-        await self.bot.pg.execute("DELETE FROM batches WHERE id=$1", bid)
-
-        ping_channel = guild.get_channel(self.bot.ping_channel_id)
-        if ping_channel and auctions_today:
-            await post_ping_message(ping_channel, daily_index, auctions_today)
+                done.add(posted["id"])
+                await job.progress(posted=len(done), total=total, failed=failed)
+
+            await asyncio.gather(*(post_bounded(it) for it in todo))
+            auctions_today = await self.load_posted(auction_ids)
+
+            # Un seul aller-retour pour tous les changements de statut + threads
+            await record_posted_batch(self.bot.pg, bid, auctions_today, self.bot.auctions)
+            await job.save(stage="recorded")
+            self._prepared = None
+        else:
+            auctions_today = await self.load_posted(auction_ids)
+
+        if checkpoint["stage"] == "recorded":
+            routes = self.bot.guild_config.routes(guild.id)
+            ping_channel = guild.get_channel(routes.ping_channel_id)
+            if ping_channel and auctions_today:
+                await post_ping_message(ping_channel, total, auctions_today, routes.ping_role_id)
+            await job.save(stage="pinged")
+
+        elapsed = time.perf_counter() - started
+        await job.progress(force=True, posted=len(auctions_today), total=total)
+        logging.info(f"Batch #{bid}: posted {len(auctions_today)}/{total} threads in {elapsed:.1f}s")
+        return {"batch_id": bid, "posted": len(auctions_today), "total": total, "seconds": round(elapsed, 1)}
+
+    async def load_posted(self, auction_ids: List[int]) -> List[dict]:
+        # Threads postés relus depuis posted_threads (dans l'ordre de bi.position
+        # pour le ping), y compris ceux d'une exécution précédente
+        rows = await db.fetch(self.bot.pg, "posted_threads_for_auctions", auction_ids)
+        return [
+            {
+                "id": r["id"],
+                "title": card_display_name(r),
+                "version": r["version"],
+                "event": r["event"],
+                "rarity": r["rarity"],
+                "link": r["link"],
+                "position": r["position"],
+                "forum_id": r["forum_id"],
+                "thread_id": r["thread_id"],
+            }
+            for r in rows
+        ]
+
+    def prepare_post(self, guild: discord.Guild, it, payload: dict) -> Optional[PreparedPost]:
+        """Résout le forum et reprend les embeds pré-rendus d'un item (sans appel réseau)."""
+        forum = guild.get_channel(self.bot.guild_config.routes(guild.id).forum_for(it["rarity"], it["queue_type"]))
+        if not forum or forum.type != discord.ChannelType.forum:
+            return None
+        return PreparedPost(
+            it, forum, payload["card_name"],
+            payload_embed(payload, "forum"),
+            payload_embed(payload, "posted_log"),
+        )
+
+    async def _post_item(self, guild: discord.Guild, post: PreparedPost) -> Optional[dict]:
+        it, forum, card_name = post.it, post.forum, post.card_name
+        try:
+            thread_with_msg = await self.bot.outbound.send(
+                PRIORITY_FORUM, f"forum:{forum.id}",
+                lambda: forum.create_thread(name=card_name, content=None, embed=post.embed),
+                concurrency=FORUM_POST_CONCURRENCY
+            )
+            thread = thread_with_msg.thread
+            link = f"https://discord.com/channels/{guild.id}/{thread.id}"
+
+            await self.bot.log_sink.send(self.bot.guild_config.routes(guild.id).log_channel_id, post.log_embed)
+
+            return {
+                "id": it["id"],
+                "title": card_name,
+                "version": it.get("version"),
+                "event": it.get("event"),
+                "rarity": it.get("rarity"),
+                "link": link,
+                "position": it["position"],
+                "forum_id": forum.id,
+                "thread_id": thread.id
+            }
+
+        except Exception as e:
+            print("Error creating thread:", e)
+            return None
 
     @discord.app_commands.command(name="batch-post", description="Post today auction.")
     @is_staff()
     async def batch_post(self, interaction: discord.Interaction):
-        await interaction.response.defer(ephemeral=True)
-        await self.post_forums_and_summary()
-        await interaction.followup.send("✅ Batch posting forced.", ephemeral=True)
+        job_id, created = await self.bot.jobs.enqueue(BATCH_POST_JOB, requested_by=interaction.user.id)
+        if not created:
+            return await interaction.response.send_message(
+                f"⏳ Batch posting is already running (job #{job_id}). Use `/job-status {job_id}`.",
+                ephemeral=True
+            )
+        await interaction.response.send_message(f"📤 Batch posting queued (job #{job_id}).", ephemeral=True)
+
+        async def watcher(status: str, values: dict):
+            if status == "RUNNING":
+                content = f"📤 Posting batch (job #{job_id})... {values.get('posted', 0)}/{values.get('total', '?')}"
+                if values.get("failed"):
+                    content += f" ({values['failed']} failed)"
+            elif status == "DONE" and not values.get("total"):
+                content = "Nothing to post today."
+            elif status == "DONE":
+                content = (
+                    f"✅ Batch posting forced: {values['posted']}/{values['total']} threads "
+                    f"in {values.get('seconds', 0):.1f}s."
+                )
+            else:
+                content = f"❌ Batch posting failed (job #{job_id}): {values.get('error', '?')[:300]}"
+            await interaction.edit_original_response(content=content)
+
+        self.bot.jobs.watch(job_id, watcher)
 
 
 async def setup(bot: commands.Bot):
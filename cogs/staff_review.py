@@ -1,14 +1,10 @@
+import re
 import discord
 from discord.ext import commands
-
-# IDs des canaux de log par queue
-QUEUE_CHANNELS = {
-    "NORMAL": 1304100031388844114,
-    "SKIP": 1308385490931810434,
-    "CARD_MAKER": 1395404596230361209,
-}
-
-LOG_CHANNEL_ID = 1424688704584286248
+from typing import Optional, Tuple
+from .auction_core import set_auction_status
+from .outbound import PRIORITY_FORUM
+from .render import auction_payload, payload_embed
 
 
 class StaffReview(commands.Cog):
@@ -16,53 +12,82 @@ class StaffReview(commands.Cog):
         self.bot = bot
 
     async def log_submission(self, auction: dict):
-        qtype = auction["queue_type"]
-        channel_id = QUEUE_CHANNELS.get(qtype)
+        # Channel de review par queue (guild_config de la guild principale)
+        channel_id = self.bot.guild_config.primary.review_channel_for(auction["queue_type"])
         if not channel_id:
             return
         channel = self.bot.get_channel(channel_id)
         if not channel:
             return
 
-        embed = discord.Embed(
-            title=f"Auction #{auction['id']} submitted",
-            description="Pending review",
-            color=discord.Color.orange()
+        embed = payload_embed(await auction_payload(self.bot.redis, auction), "review")
+
+        await self.bot.outbound.send(
+            PRIORITY_FORUM, f"channel:{channel_id}",
+            lambda: channel.send(embed=embed, view=review_buttons(auction["id"]))
         )
-        embed.add_field(name="Seller", value=f"<@{auction['user_id']}>", inline=True)
-        embed.add_field(name="Rarity", value=auction["rarity"], inline=True)
-        embed.add_field(name="Queue", value=auction["queue_type"], inline=True)
-        embed.add_field(name="Currency", value=auction["currency"], inline=True)
-        embed.add_field(name="Rate", value=auction["rate"] or "—", inline=True)
-        embed.add_field(name="Version", value=auction["version"] or "?", inline=True)
-        embed.add_field(name="Status", value="PENDING ⏳", inline=True)  # ✅ Ajout
-        if auction["image_url"]:
-            embed.set_image(url=auction["image_url"])
-
-        view = ReviewButtons(self.bot, auction["id"])
-        await channel.send(embed=embed, view=view)
-
-
-class ReviewButtons(discord.ui.View):
-    def __init__(self, bot, auction_id: int):
-        super().__init__(timeout=None)
-        self.bot = bot
-        self.auction_id = auction_id
 
-    @discord.ui.button(label="✅ Accept", style=discord.ButtonStyle.success, custom_id="review:accept")
-    async def accept(self, interaction: discord.Interaction, button: discord.ui.Button):
-        modal = ReasonModal(self.bot, self.auction_id, "ACCEPT", interaction.message)
+    @commands.Cog.listener()
+    async def on_interaction(self, interaction: discord.Interaction):
+        if interaction.type != discord.InteractionType.component:
+            return
+        custom_id = (interaction.data or {}).get("custom_id", "")
+        if not custom_id.startswith(REVIEW_PREFIX):
+            return
+        parsed = parse_review_custom_id(custom_id, interaction.message)
+        if not parsed:
+            return await interaction.response.send_message("❌ Unknown auction for this review.", ephemeral=True)
+        action, auction_id = parsed
+        # Lecture par le cache (LRU puis Redis) : pas de requête Postgres par clic
+        auction = await self.bot.auctions.get(auction_id)
+        if not auction:
+            return await interaction.response.send_message(f"❌ Auction #{auction_id} not found.", ephemeral=True)
+        if auction["status"] != "PENDING":
+            return await interaction.response.send_message(
+                f"⚠️ Auction #{auction_id} was already reviewed ({auction['status']}).", ephemeral=True
+            )
+        modal = ReasonModal(self.bot, auction_id, action, interaction.message)
         await interaction.response.send_modal(modal)
 
-    @discord.ui.button(label="❌ Deny", style=discord.ButtonStyle.danger, custom_id="review:deny")
-    async def deny(self, interaction: discord.Interaction, button: discord.ui.Button):
-        modal = ReasonModal(self.bot, self.auction_id, "DENY", interaction.message)
-        await interaction.response.send_modal(modal)
+
+# Boutons de review sans état : l'id de l'auction est dans le custom_id
+# (review:accept:<id> / review:deny:<id>) et StaffReview.on_interaction les
+# dispatch tous, sans View persistante par auction ni scan au démarrage.
+REVIEW_PREFIX = "review:"
+# Anciens messages (custom_id "review:accept" sans id) : l'id est relu dans le titre
+LEGACY_TITLE_RE = re.compile(r"Auction #(\d+) submitted")
+
+
+def review_buttons(auction_id: int) -> discord.ui.View:
+    view = discord.ui.View(timeout=None)
+    view.add_item(discord.ui.Button(
+        label="✅ Accept", style=discord.ButtonStyle.success, custom_id=f"review:accept:{auction_id}"
+    ))
+    view.add_item(discord.ui.Button(
+        label="❌ Deny", style=discord.ButtonStyle.danger, custom_id=f"review:deny:{auction_id}"
+    ))
+    # Rendu seulement : une View arrêtée n'est pas gardée en mémoire par discord.py
+    view.stop()
+    return view
+
+
+def parse_review_custom_id(custom_id: str, message: Optional[discord.Message]) -> Optional[Tuple[str, int]]:
+    parts = custom_id.split(":")
+    if len(parts) < 2 or parts[1] not in ("accept", "deny"):
+        return None
+    action = "ACCEPT" if parts[1] == "accept" else "DENY"
+    if len(parts) >= 3 and parts[2].isdigit():
+        return action, int(parts[2])
+    if message and message.embeds:
+        m = LEGACY_TITLE_RE.search(message.embeds[0].title or "")
+        if m:
+            return action, int(m.group(1))
+    return None
 
 
 class ReasonModal(discord.ui.Modal):
     def __init__(self, bot, auction_id: int, action: str, message: discord.Message):
-        super().__init__(title=f"{action} Auction")
+        super().__init__(title=f"{action} Auction", timeout=600)
         self.bot = bot
         self.auction_id = auction_id
         self.action = action
@@ -72,20 +97,19 @@ class ReasonModal(discord.ui.Modal):
 
     async def on_submit(self, interaction: discord.Interaction):
         reason = (self.reason.value or "No reason provided.").strip()
-        log_channel = interaction.guild.get_channel(LOG_CHANNEL_ID)
 
         if not self.message.embeds:
             return await interaction.response.send_message("No embed to update.", ephemeral=True)
         embed = self.message.embeds[0]
 
         if self.action == "ACCEPT":
-            await self.bot.pg.execute("UPDATE auctions SET status='READY' WHERE id=$1", self.auction_id)
+            await set_auction_status(self.bot.pg, self.auction_id, "READY", self.bot.auctions)
             embed.description = f"✅ Submission approved\nReason: {reason}"
             embed.color = discord.Color.green()
             self._update_status(embed, "READY ✅")
 
         elif self.action == "DENY":
-            await self.bot.pg.execute("UPDATE auctions SET status='DENIED' WHERE id=$1", self.auction_id)
+            await set_auction_status(self.bot.pg, self.auction_id, "DENIED", self.bot.auctions)
             embed.description = f"❌ Submission denied\nReason: {reason}"
             embed.color = discord.Color.red()
             self._update_status(embed, "DENIED ❌")
@@ -93,14 +117,13 @@ class ReasonModal(discord.ui.Modal):
         await self.message.edit(embed=embed, view=None)
         await interaction.response.send_message(f"Auction #{self.auction_id} {self.action.lower()}ed.", ephemeral=True)
 
-        if log_channel:
-            log_embed = discord.Embed(
-                title=f"{'✅' if self.action=='ACCEPT' else '❌'} Auction {self.action.lower()}ed",
-                description=f"Auction #{self.auction_id} {self.action.lower()}ed by {interaction.user.mention}",
-                color=embed.color
-            )
-            log_embed.add_field(name="Reason", value=reason, inline=False)
-            await log_channel.send(embed=log_embed)
+        log_embed = discord.Embed(
+            title=f"{'✅' if self.action=='ACCEPT' else '❌'} Auction {self.action.lower()}ed",
+            description=f"Auction #{self.auction_id} {self.action.lower()}ed by {interaction.user.mention}",
+            color=embed.color
+        )
+        log_embed.add_field(name="Reason", value=reason, inline=False)
+        await self.bot.log_sink.send(self.bot.guild_config.routes(interaction.guild_id).staff_log_channel_id, log_embed)
 
     def _update_status(self, embed: discord.Embed, status: str):
         for i, field in enumerate(embed.fields):
@@ -112,8 +135,3 @@ class ReasonModal(discord.ui.Modal):
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(StaffReview(bot))
-
-    # ✅ Réattacher toutes les Views persistantes au redémarrage
-    rows = await bot.pg.fetch("SELECT id FROM auctions WHERE status='PENDING'")
-    for row in rows:
-        bot.add_view(ReviewButtons(bot, row["id"]))
@@ -3,6 +3,9 @@ from discord.ext import commands
 from discord import app_commands
 from .utils import redis_json_load, queue_display_to_type
 import asyncpg  # pour intercepter UniqueViolation
+from . import db
+from .db import register_query
+from .outbound import PRIORITY_DM
 
 # Options de sélection
 QUEUE_OPTIONS = [
@@ -18,6 +21,12 @@ CURRENCY_OPTIONS = [
     discord.SelectOption(label="PayPal (CM only)", value="PAYPAL", emoji="💳", description="Only valid for Card Maker"),
 ]
 
+register_query("auction_insert", """
+    INSERT INTO auctions (user_id, series, version, batch_no, owner_id, rarity, queue_type, currency, rate, status, title, image_url)
+    VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9,'PENDING',$10,$11)
+    RETURNING *
+""")
+
 # Tarifs centralisés
 FEES = {
     "Normal queue": "500 BS or 3 MS",
@@ -93,15 +102,17 @@ class Submit(commands.Cog):
         view = ConfigView(self.bot, user_id, data)
         embed = build_preview_embed(user_id, data, view.queue_display, view.currency, view.rate)
 
+        # Ack d'abord (délai de 3 s), le DM passe ensuite par l'outbound en priorité DM
+        await interaction.response.defer(ephemeral=True)
         try:
-            await interaction.user.send(
+            await self.bot.outbound.send(PRIORITY_DM, f"dm:{user_id}", lambda: interaction.user.send(
                 content="Setup your auction below. Pick queue, currency, and rate if needed, then submit.",
                 embed=embed,
                 view=view
-            )
-            await interaction.response.send_message("I sent you a private message to complete the submission.", ephemeral=True)
+            ))
+            await interaction.followup.send("I sent you a private message to complete the submission.", ephemeral=True)
         except discord.Forbidden:
-            await interaction.response.send_message("Enable your DMs so I can send you the form.", ephemeral=True)
+            await interaction.followup.send("Enable your DMs so I can send you the form.", ephemeral=True)
 
 
 class QueueSelect(discord.ui.Select):
@@ -220,12 +231,8 @@ class ConfigView(discord.ui.View):
             )
 
         try:
-            rec = await self.bot.pg.fetchrow(
-                """
-                INSERT INTO auctions (user_id, series, version, batch_no, owner_id, rarity, queue_type, currency, rate, status, title, image_url)
-                VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9,'PENDING',$10,$11)
-                RETURNING *
-                """,
+            rec = await db.fetchrow(
+                self.bot.pg, "auction_insert",
                 self.user_id,
                 self.data.get("series"),
                 self.data.get("version"),
@@ -244,16 +251,6 @@ class ConfigView(discord.ui.View):
                 ephemeral=True
             )
 
-        if self.queue_display in FEES:
-            fee_msg = f"💰 Pay fees to <@723441401211256842>\n{self.queue_display}: {FEES[self.queue_display]}"
-            try:
-                await interaction.user.send(fee_msg)
-            except discord.Forbidden:
-                try:
-                    await interaction.followup.send(fee_msg, ephemeral=True)
-                except discord.HTTPException:
-                    pass
-
         confirm = discord.Embed(
             title=f"Auction #{rec['id']} submitted",
             description="Your auction was logged for staff review.",
@@ -275,6 +272,20 @@ class ConfigView(discord.ui.View):
         finally:
             self.stop()
 
+        # Après l'ack de l'interaction : le DM des frais passe en priorité DM
+        if self.queue_display in FEES:
+            fee_msg = f"💰 Pay fees to <@723441401211256842>\n{self.queue_display}: {FEES[self.queue_display]}"
+            try:
+                await self.bot.outbound.send(PRIORITY_DM, f"dm:{self.user_id}", lambda: interaction.user.send(fee_msg))
+            except discord.Forbidden:
+                try:
+                    await interaction.followup.send(fee_msg, ephemeral=True)
+                except discord.HTTPException:
+                    pass
+
+        # Cache chaud pour les boutons de review (cogs/auction_cache.py)
+        await self.bot.auctions.store([rec])
+
         staff_cog = self.bot.get_cog("StaffReview")
         if staff_cog and hasattr(staff_cog, "log_submission"):
             await staff_cog.log_submission(rec)
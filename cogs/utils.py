@@ -2,29 +2,38 @@ import json
 import discord
 from discord.ext import commands
 
+# --- Cache mazoku:card:{owner_id} ---
+# Format compact versionné : [version, title, rarity, series, version, batch,
+# owner_id, image_url, event, special] en JSON sans espaces, nulls de fin retirés.
+# L'ancien format (dict complet avec "raw") reste lisible pendant le TTL.
+CARD_SCHEMA_VERSION = 1
+CARD_FIELDS = ("title", "rarity", "series", "version", "batch", "owner_id", "image_url", "event", "special")
+
+def encode_card(payload: dict) -> str:
+    values = [payload.get(f) for f in CARD_FIELDS]
+    while values and values[-1] is None:
+        values.pop()
+    return json.dumps([CARD_SCHEMA_VERSION, *values], separators=(",", ":"), ensure_ascii=False)
+
+def decode_card(values: list) -> dict:
+    if not values or values[0] != CARD_SCHEMA_VERSION:
+        return {}
+    data = dict.fromkeys(CARD_FIELDS)
+    data.update(zip(CARD_FIELDS, values[1:]))
+    return data
+
 def redis_json_load(s: str) -> dict:
     try:
-        return json.loads(s)
+        data = json.loads(s)
     except Exception:
         return {}
-
-def rarity_to_forum_id(bot: commands.Bot, rarity: str, queue_type: str) -> int:
-    if queue_type == "CARD_MAKER":
-        return bot.forum_cm_id
-    mapping = {
-        "COMMON": bot.forum_common_id,
-        "RARE": bot.forum_rare_id,
-        "SR": bot.forum_sr_id,
-        "SSR": bot.forum_ssr_id,
-        "UR": bot.forum_ur_id,
-    }
-    return mapping.get((rarity or "COMMON").upper(), bot.forum_common_id)
+    if isinstance(data, list):
+        return decode_card(data)
+    return data
 
 def queue_display_to_type(display: str) -> str:
     return "CARD_MAKER" if display == "Card Maker" else ("SKIP" if display == "Skip queue" else "NORMAL")
 
-def type_to_queue_channel_id(bot: commands.Bot, qtype: str) -> int:
-    return bot.queue_cm_id if qtype == "CARD_MAKER" else (bot.queue_skip_id if qtype == "SKIP" else bot.queue_normal_id)
 class Utils(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
@@ -0,0 +1,35 @@
+import os
+import asyncio
+import logging
+import signal
+import redis.asyncio as aioredis
+
+from cogs.ingest_stream import IngestWorkers
+
+logging.basicConfig(level=logging.INFO)
+
+# Worker d'ingestion Mazoku standalone (sans connexion Discord).
+# Lance le bot avec MAZOKU_INGEST_MODE=stream, puis autant de process que voulu :
+#   REDIS_URL=redis://localhost:6379 MAZOKU_INGEST_WORKERS=4 python ingest_worker.py
+
+async def run():
+    redis = aioredis.from_url(
+        os.getenv("REDIS_URL"),
+        encoding="utf-8",
+        decode_responses=True
+    )
+    workers = IngestWorkers(redis, int(os.getenv("MAZOKU_INGEST_WORKERS", "2")))
+    await workers.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    await workers.stop()
+    await redis.aclose()
+    logging.info(f"Ingest worker stopped: {dict(workers.stats)}")
+
+if __name__ == "__main__":
+    asyncio.run(run())
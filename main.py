@@ -1,68 +1,227 @@
+import time
+_IMPORTS_STARTED = time.perf_counter()
+
 import os
+import json
+import asyncio
+import hashlib
 import logging
+from typing import List, Optional
+
 import discord
 from discord.ext import commands
-import asyncpg
-import redis.asyncio as aioredis
 
 from cogs.auction_core import init_db  # DB bootstrap
+from cogs.db import create_pool
+from cogs.metrics import InstrumentedRedis, InstrumentedTree, http_trace_config
+from cogs.log_sink import LogSink
+from cogs.outbound import Outbound
+from cogs.jobs import JobRunner
+from cogs.auction_cache import AuctionCache
+from cogs.leader import LeaderLease
+from cogs.guild_config import GuildConfigRegistry
+from cogs.boot_report import BOOT_REPORT_KEY, BootReport
+from cogs.admin_guard import is_staff
+
+IMPORTS_SECONDS = time.perf_counter() - _IMPORTS_STARTED
 
 logging.basicConfig(level=logging.INFO)
 
+# Chargées en parallèle au boot (do not load utils as an extension)
+EXTENSIONS = (
+    "cogs.metrics_server",
+    "cogs.auction_core",
+    "cogs.ingest_stream",
+    "cogs.submit",
+    "cogs.staff_review",
+    "cogs.batch_preparation",
+    "cogs.scheduler",
+    "cogs.guild_settings",
+    "cogs.profiler",
+)
+
+# Empreinte de l'arbre de commandes déjà synchronisé, par guild : au boot on
+# ne refait le tree.sync (lent, rate-limité) que si l'arbre a changé.
+COMMAND_TREE_KEY = "bot:command_tree:{guild_id}"
+
+
+def command_tree_fingerprint(tree: discord.app_commands.CommandTree, guild: discord.abc.Snowflake) -> str:
+    payload = sorted(
+        (cmd.to_dict() for cmd in tree.get_commands(guild=guild)),
+        key=lambda c: (c.get("type", 1), c["name"]),
+    )
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+async def store_command_tree_fingerprint(bot: commands.Bot, guild: discord.abc.Snowflake):
+    await bot.redis.set(
+        COMMAND_TREE_KEY.format(guild_id=guild.id), command_tree_fingerprint(bot.tree, guild)
+    )
+
+
 INTENTS = discord.Intents.default()
 INTENTS.message_content = True  # required for Mazoku message capture
 
-class AuctionBot(commands.Bot):
+
+def shard_ids_from_env() -> Optional[List[int]]:
+    raw = os.getenv("SHARD_IDS", "").strip()
+    return [int(i) for i in raw.split(",") if i.strip()] if raw else None
+
+
+# Plusieurs process : chacun se connecte avec ses shards (SHARD_COUNT au total,
+# SHARD_IDS="0,1" pour ce process, METRICS_PORT distinct par process sur un
+# même hôte). Sans ces variables, discord.py choisit le
+# nombre de shards et tout tourne dans ce process. Le travail singleton
+# (planning, jobs, recalculs) ne tourne que sur le leader (cogs/leader.py).
+class AuctionBot(commands.AutoShardedBot):
     def __init__(self):
-        super().__init__(command_prefix="!", intents=INTENTS)
+        shard_count = os.getenv("SHARD_COUNT")
+        super().__init__(
+            command_prefix="!",
+            intents=INTENTS,
+            shard_count=int(shard_count) if shard_count else None,
+            shard_ids=shard_ids_from_env(),
+            tree_cls=InstrumentedTree,  # durée des app commands (cogs/metrics.py)
+            http_trace=http_trace_config(),  # 429 et attente de bucket Discord
+        )
         self.pg = None
         self.redis = None
+        self.outbound = Outbound(rate=float(os.getenv("OUTBOUND_RATE", "25")))
+        self.log_sink = LogSink(self)
+        self.jobs = JobRunner(self)
+        self.auctions = AuctionCache(self)
+        self.boot_report = BootReport(started=_IMPORTS_STARTED)
+        self.boot_report.add("imports", "main", IMPORTS_SECONDS)
         self.guild_id = int(os.getenv("GUILD_ID"))
+        # Candidat au bail seulement si la guild est sur un de nos shards
+        self.leader = LeaderLease(eligible=lambda: self.get_guild(self.guild_id) is not None)
 
         # IDs from environment variables
         self.mazoku_bot_id = int(os.getenv("MAZOKU_BOT_ID"))
         self.mazoku_channel_id = int(os.getenv("MAZOKU_CHANNEL_ID"))
-        self.ping_channel_id = int(os.getenv("PING_CHANNEL_ID"))
-        self.queue_skip_id = int(os.getenv("QUEUE_SKIP_ID"))
-        self.queue_normal_id = int(os.getenv("QUEUE_NORMAL_ID"))
-        self.queue_cm_id = int(os.getenv("QUEUE_CM_ID"))
-        self.forum_common_id = int(os.getenv("FORUM_COMMON_ID"))
-        self.forum_rare_id = int(os.getenv("FORUM_RARE_ID"))
-        self.forum_sr_id = int(os.getenv("FORUM_SR_ID"))
-        self.forum_ssr_id = int(os.getenv("FORUM_SSR_ID"))
-        self.forum_ur_id = int(os.getenv("FORUM_UR_ID"))
-        self.forum_cm_id = int(os.getenv("FORUM_CM_ID"))
-
-        # Nouveau : channel de log
-        self.log_channel_id = int(os.getenv("LOG_CHANNEL_ID"))
+
+        # Forums, channels de review / log / ping et rôles staff par guild
+        # (table guild_config, cogs/guild_config.py). Les anciennes variables
+        # FORUM_*_ID, QUEUE_*_ID, LOG_CHANNEL_ID et PING_CHANNEL_ID ne servent
+        # plus qu'à créer la config de GUILD_ID au premier boot.
+        self.guild_config = GuildConfigRegistry(self)
+
+        # Ingestion Mazoku : "inline" (parse dans le listener) ou "stream"
+        # (XADD sur Redis, parsing par les workers de cogs.ingest_stream / ingest_worker.py)
+        self.ingest_mode = os.getenv("MAZOKU_INGEST_MODE", "inline")
+        self.ingest_workers = int(os.getenv("MAZOKU_INGEST_WORKERS", "2"))
+
+        # Planning du batch quotidien, heures de Paris (cogs/scheduler.py) :
+        # désactivé tant que BATCH_POST_TIME (HH:MM) n'est pas défini
+        self.batch_post_time = os.getenv("BATCH_POST_TIME")
+        self.batch_lock_time = os.getenv("BATCH_LOCK_TIME")  # défaut : 15 min avant le post
+        self.batch_prewarm_minutes = int(os.getenv("BATCH_PREWARM_MINUTES", "5"))
+
+        # FORCE_COMMAND_SYNC=1 : sync au boot même si l'empreinte n'a pas changé
+        self.force_command_sync = os.getenv("FORCE_COMMAND_SYNC", "0") == "1"
+
+        # Endpoint Prometheus local (METRICS_PORT=0 pour le désactiver) ; un port
+        # par process quand plusieurs tournent sur le même hôte (port pris :
+        # métriques désactivées sur ce process, le boot continue)
+        self.metrics_host = os.getenv("METRICS_HOST", "127.0.0.1")
+        self.metrics_port = int(os.getenv("METRICS_PORT", "9108"))
 
     async def setup_hook(self):
-        # Connect databases
-        self.pg = await asyncpg.create_pool(os.getenv("POSTGRES_URL"))
-        self.redis = aioredis.from_url(
-            os.getenv("REDIS_URL"),
-            encoding="utf-8",
-            decode_responses=True
-        )
+        report = self.boot_report
+
+        # Postgres (pool + migrations) et Redis sont indépendants : en parallèle
+        async def connect_postgres():
+            with report.step("connect", "postgres"):
+                # create_pool ouvre déjà min_size connexions (pool chaud),
+                # taille/timeouts via PG_POOL_MIN, PG_POOL_MAX... (cogs/db.py)
+                self.pg = await create_pool(os.getenv("POSTGRES_URL"))
+            with report.step("db", "init_db"):
+                applied = await init_db(self.pg)
+            for version, name, seconds in applied:
+                report.add("migration", f"{version:04d}_{name}", seconds)
+
+        async def connect_redis():
+            with report.step("connect", "redis"):
+                self.redis = InstrumentedRedis.from_url(
+                    os.getenv("REDIS_URL"),
+                    encoding="utf-8",
+                    decode_responses=True,
+                    # Un appel bloqué (Redis figé, réseau coupé) finit en erreur ;
+                    # doit rester au-dessus du BLOCK de XREADGROUP (cogs/ingest_stream.py)
+                    socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", "5")),
+                    socket_connect_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", "5")),
+                )
+                await self.redis.ping()  # ouvre la première connexion maintenant
+
+        await asyncio.gather(connect_postgres(), connect_redis())
+
+        self.leader.redis = self.redis
+        self.leader.start()
+
+        # Table de routage par guild, rechargée sur NOTIFY guild_config
+        with report.step("db", "guild_config"):
+            await self.guild_config.start()
+
+        # Envois Discord en masse cadencés par priorité (cogs/outbound.py),
+        # log embeds batched (up to 10 per message) through the sink
+        self.outbound.start()
+        self.log_sink.start()
+        # Cache des lignes auctions, invalidé par pub/sub Redis entre process
+        self.auctions.start()
+
+        # Les cogs ne dépendent pas les uns des autres au chargement
+        async def load(extension: str):
+            with report.step("cog", extension):
+                await self.load_extension(extension)
+
+        await asyncio.gather(*(load(ext) for ext in EXTENSIONS))
 
-        # Initialize database schema
-        await init_db(self.pg)
+        # Jobs staff reprenables (cogs/jobs.py) : handlers enregistrés par les
+        # cogs, un job interrompu par un redémarrage repart de son checkpoint
+        self.jobs.start()
 
-        # Load extensions (do not load utils as an extension)
-        await self.load_extension("cogs.auction_core")
-        await self.load_extension("cogs.submit")
-        await self.load_extension("cogs.staff_review")
-        await self.load_extension("cogs.batch_preparation")
-        await self.load_extension("cogs.scheduler")
+        # Auto-sync application commands to the target guild, only when the tree changed
+        with report.step("commands", "sync"):
+            synced = await self.sync_guild_commands()
 
-        # Auto-sync application commands to the target guild
+        report.finish()
+        logging.info(report.render())
+        logging.info(
+            f"Startup took {report.total:.2f}s "
+            f"({'with' if synced else 'without'} command sync)"
+        )
+        await self.redis.set(BOOT_REPORT_KEY, report.to_json())
+
+    async def sync_guild_commands(self) -> bool:
         guild = discord.Object(id=self.guild_id)
         self.tree.copy_global_to(guild=guild)
+        key = COMMAND_TREE_KEY.format(guild_id=self.guild_id)
+        fingerprint = command_tree_fingerprint(self.tree, guild)
+        if not self.force_command_sync and await self.redis.get(key) == fingerprint:
+            logging.info(f"Command tree unchanged ({fingerprint[:12]}), skipping sync for guild {self.guild_id}")
+            return False
+
+        t0 = time.perf_counter()
         synced = await self.tree.sync(guild=guild)
-        logging.info(f"Synced {len(synced)} commands to guild {self.guild_id}")
+        await self.redis.set(key, fingerprint)
+        logging.info(
+            f"Synced {len(synced)} commands to guild {self.guild_id} "
+            f"in {time.perf_counter() - t0:.2f}s ({fingerprint[:12]})"
+        )
+        return True
 
     async def close(self):
+        # Job en cours remis en file (checkpoint en base) avant de fermer le pool
+        await self.jobs.close()
+        # Bail libéré tout de suite : un autre process reprend sans attendre le TTL
+        await self.leader.close()
+        # Drain buffered log embeds while the HTTP session is still open
+        await self.log_sink.close()
+        await self.outbound.close()
         await super().close()
+        await self.auctions.close()
+        await self.guild_config.close()
         if self.pg:
             await self.pg.close()
         if self.redis:
@@ -78,6 +237,7 @@ async def sync_cmd(interaction: discord.Interaction):
     guild = discord.Object(id=interaction.guild_id)
     bot.tree.copy_global_to(guild=guild)
     synced = await bot.tree.sync(guild=guild)
+    await store_command_tree_fingerprint(bot, guild)
     await interaction.followup.send(f"✅ Synced {len(synced)} commands to this guild.")
 
 # --- Commande sync globale ---
@@ -105,6 +265,7 @@ async def sync_clear_cmd(interaction: discord.Interaction):
     # Re-copie des commandes globales vers la guilde
     bot.tree.copy_global_to(guild=guild)
     synced = await bot.tree.sync(guild=guild)
+    await store_command_tree_fingerprint(bot, guild)
 
     # ✅ Log console
     print("🧹 Sync-Clear executed")
@@ -119,6 +280,29 @@ async def sync_clear_cmd(interaction: discord.Interaction):
         ephemeral=True
     )
 
+# --- Boot report ---
+@bot.tree.command(name="boot-report", description="Show the startup time profile (staff only)")
+@is_staff()
+async def boot_report_cmd(interaction: discord.Interaction):
+    await interaction.response.send_message(
+        f"```\n{bot.boot_report.render()[:1900]}\n```", ephemeral=True
+    )
+
+# --- Cluster ---
+@bot.tree.command(name="cluster-status", description="Show this process, its shards and the leader (staff only)")
+@is_staff()
+async def cluster_status_cmd(interaction: discord.Interaction):
+    holder = await bot.leader.holder()
+    shards = ", ".join(
+        f"#{sid} {shard.latency * 1000:.0f}ms" for sid, shard in sorted(bot.shards.items())
+    ) or "—"
+    await interaction.response.send_message(
+        f"🖥️ Node: `{bot.leader.node}`{' 👑' if bot.leader.is_leader else ''}\n"
+        f"👑 Leader: `{holder or 'none'}`\n"
+        f"🧩 Shards: {shards} (of {bot.shard_count})",
+        ephemeral=True
+    )
+
 # --- Login console ---
 @bot.event
 async def on_ready():